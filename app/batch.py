@@ -0,0 +1,98 @@
+from typing import Any
+import asyncio
+import inspect
+import json
+import logging
+import os
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, ValidationError, validate_call
+from pymongo.errors import ExecutionTimeout
+from starlette.concurrency import run_in_threadpool
+
+from app.caching import CachedResponse, serialize_json
+from app.mongo import ResultTooLarge, TooManyHeavyQueries
+
+logger = logging.getLogger(__name__)
+
+# Peticiones compuestas: varias consultas en una sola llamada, con paralelismo limitado
+BATCH_MAX_QUERIES = int(os.environ.get("SOTERIA_BATCH_MAX_QUERIES", 20))
+BATCH_CONCURRENCY = int(os.environ.get("SOTERIA_BATCH_CONCURRENCY", 4))
+
+class BatchQuery(BaseModel):
+    id: str | None = None
+    operation: str
+    params: dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    queries: list[BatchQuery] = Field(..., max_length=BATCH_MAX_QUERIES)
+
+class BatchOperations:
+    """
+    Registry of the operations a batch may call. Parameters are validated and coerced like query
+    parameters (enums, ints, booleans). Arguments named in `context` (e.g. `current_user`) are filled
+    by the batch endpoint and cannot be sent by the client.
+    """
+
+    def __init__(self, operations, context_names=("current_user",)):
+        self.context_names = set(context_names)
+        self.operations = {}
+        for name, function in operations.items():
+            accepted = set(inspect.signature(function).parameters)
+            self.operations[name] = (validate_call(function), accepted & self.context_names)
+
+    def __contains__(self, name):
+        return name in self.operations
+
+    def names(self):
+        return sorted(self.operations)
+
+    def call(self, name, params, context):
+        function, context_names = self.operations[name]
+        reserved = self.context_names & set(params)
+        if reserved:
+            raise ValueError(f"Parameters {sorted(reserved)} cannot be set in a batch")
+        return function(**params, **{key: context[key] for key in context_names})
+
+def _error_status(exc):
+    """Same status codes as the application's exception handlers."""
+    match exc:
+        case HTTPException():
+            return exc.status_code, exc.detail
+        case ValidationError():
+            return 422, json.loads(exc.json(include_url=False, include_context=False))
+        case TooManyHeavyQueries():
+            return 503, str(exc)
+        case ResultTooLarge() | ValueError():
+            return 400, str(exc)
+        case ExecutionTimeout():
+            return 504, "Query exceeded its time budget, narrow the filters or set a smaller quantity"
+        case _:
+            return 500, "Internal error"
+
+async def run_batch(queries, operations: BatchOperations, context, concurrency=BATCH_CONCURRENCY):
+    """
+    Runs every query in the threadpool, at most `concurrency` at a time, and returns the JSON body
+    {"results": [{"id", "operation", "status", "result" | "detail"}, ...]} in the request order. A
+    failing query only fails its own item. Cached responses are embedded as stored, without re-encoding.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(query):
+        header = {"id": query.id, "operation": query.operation}
+        if query.operation not in operations:
+            return serialize_json(header | {"status": 404, "detail": f"Unknown operation, use one of {operations.names()}"})
+        async with semaphore:
+            try:
+                result = await run_in_threadpool(operations.call, query.operation, query.params, context)
+            except Exception as e:
+                status_code, detail = _error_status(e)
+                if status_code == 500:
+                    logger.exception(f"Batch operation {query.operation} failed")
+                return serialize_json(header | {"status": status_code, "detail": detail})
+        body = result.body if isinstance(result, CachedResponse) else serialize_json(result)
+        # El resultado se inserta ya serializado tras la cabecera del elemento
+        return serialize_json(header | {"status": 200})[:-1] + b',"result":' + body + b"}"
+
+    items = await asyncio.gather(*(run(query) for query in queries))
+    return b'{"results":[' + b",".join(items) + b"]}"
@@ -0,0 +1,319 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from enum import Enum
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after being stored."""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+# Validadores HTTP derivados de la versión de los datos de cada colección
+DATASET_VERSION_REFRESH_SECONDS = float(os.environ.get("SOTERIA_DATASET_VERSION_REFRESH_SECONDS", 30))
+HTTP_CACHE_MAX_AGE = int(os.environ.get("SOTERIA_HTTP_CACHE_MAX_AGE", 300))
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+class DatasetVersions:
+    """Data version of each collection, re-read every few seconds, and the HTTP validators derived from it."""
+
+    def __init__(self, db_manager, refresh_seconds=DATASET_VERSION_REFRESH_SECONDS, max_age=HTTP_CACHE_MAX_AGE):
+        self.db_manager = db_manager
+        self.max_age = max_age
+        self._versions = TTLCache(maxsize=256, ttl=refresh_seconds)
+
+    def get(self, collection_name):
+        version = self._versions.get(collection_name)
+        if version is None:
+            version = self.db_manager.get_dataset_version(collection_name)
+            self._versions.set(collection_name, version)
+        return version
+
+    def bump(self, collection_name, append_only=False):
+        version = self.db_manager.bump_dataset_version(collection_name, append_only)
+        self._versions.set(collection_name, version)
+        return version
+
+    def key(self, *collection_names):
+        """Identifies the current data of the given collections, for use in cache keys."""
+        return ",".join(f"{name}@{self.get(name)[0]}" for name in collection_names)
+
+    def conditional_get(self, request, response, *collection_names):
+        """
+        Sets ETag, Last-Modified and Cache-Control on `response` from the versions of the collections
+        the endpoint reads. Returns a 304 response when the client's copy is still current, so the
+        caller can skip the query, and None otherwise.
+        """
+        collection_names = [name for name in collection_names if name]
+        if not collection_names:
+            return None
+
+        versions = [self.get(name) for name in collection_names]
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        fingerprint = f"{request.url.path}?{query}|{self.key(*collection_names)}"
+        etag = '"' + hashlib.sha1(fingerprint.encode()).hexdigest()[:32] + '"'
+
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        updated = [_as_utc(updated_at) for _, updated_at in versions if updated_at is not None]
+        last_modified = max(updated).replace(microsecond=0) if len(updated) == len(versions) else None
+        if last_modified is not None:
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+        if _is_not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return None
+
+def _is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match usa comparación débil y tiene prioridad sobre If-Modified-Since
+        tags = [tag.strip().removeprefix("W/").replace('-gzip"', '"') for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= _as_utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# Caché de respuestas en dos niveles: LRU en proceso (limitada en bytes) y una caché compartida opcional
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("SOTERIA_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get("SOTERIA_RESPONSE_CACHE_TTL_SECONDS", 24 * 3600))
+SHARED_CACHE_URL = os.environ.get("SOTERIA_SHARED_CACHE_URL")
+
+class ByteLRUCache:
+    """Thread-safe LRU cache bounded by the total size in bytes of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+class LocalSharedCache:
+    """In-process stand-in for the shared cache, with the same interface as RedisSharedCache."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+class RedisSharedCache:
+    """Shared cache on Redis. Errors are logged and treated as misses so Redis is never required."""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        try:
+            return self.client.get(key)
+        except Exception as e:
+            logger.warning(f"Shared cache get failed: {e}")
+            return None
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(key, value, ex=ttl)
+        except Exception as e:
+            logger.warning(f"Shared cache set failed: {e}")
+
+def create_shared_cache(url=SHARED_CACHE_URL):
+    if not url:
+        return None
+    if url == "local":
+        return LocalSharedCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            return RedisSharedCache(url)
+        except ImportError:
+            logger.warning("SOTERIA_SHARED_CACHE_URL points to Redis but the redis package is not installed, using only the in-process cache")
+            return None
+    raise ValueError(f"Unsupported shared cache URL: {url}")
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    gzip_body: bytes
+
+    @property
+    def size(self):
+        return len(self.body) + len(self.gzip_body)
+
+def _normalize(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return _normalize(value.model_dump())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def serialize_json(result):
+    # Mismo formato que JSONResponse de FastAPI
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class ResponseCache:
+    """
+    Caches the JSON bytes (plain and gzip) of MongoDBManager results. Keys are built from the method
+    name, its normalized arguments and the data versions of the collections it reads, so loading new
+    data invalidates every response derived from it.
+    """
+
+    def __init__(self, dataset_versions, max_bytes=RESPONSE_CACHE_MAX_BYTES, shared=None, ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.local = ByteLRUCache(max_bytes)
+        self.shared = shared
+        self.ttl = ttl
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+
+    def key(self, name, args, collections):
+        payload = json.dumps([name, _normalize(args), self.dataset_versions.key(*collections)], sort_keys=True, default=str)
+        return "soteria:response:" + hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_or_compute(self, method, *args, collections):
+        key = self.key(method.__name__, args, collections)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        # Un solo cálculo por clave y proceso aunque lleguen varias peticiones a la vez
+        with self._key_locks_lock:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                cached = self._lookup(key)
+                if cached is None:
+                    body = serialize_json(method(*args))
+                    cached = CachedResponse(body, gzip.compress(body, compresslevel=6))
+                    self.local.set(key, cached, cached.size)
+                    if self.shared is not None:
+                        # En la caché compartida sólo viaja la versión comprimida
+                        self.shared.set(key, cached.gzip_body, self.ttl)
+            finally:
+                with self._key_locks_lock:
+                    self._key_locks.pop(key, None)
+        return cached
+
+    def _lookup(self, key):
+        cached = self.local.get(key)
+        if cached is None and self.shared is not None:
+            gzip_body = self.shared.get(key)
+            if gzip_body is not None:
+                cached = CachedResponse(gzip.decompress(gzip_body), gzip_body)
+                self.local.set(key, cached, cached.size)
+        return cached
+
+    def cached_response(self, request, method, *args, collections, headers=None):
+        """Runs `method(*args)` through the cache and returns the stored bytes as a JSON response."""
+        cached = self.get_or_compute(method, *args, collections=collections)
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept-Encoding"
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            if "etag" in {name.lower() for name in headers}:
+                # Un ETag fuerte debe distinguir las dos codificaciones del mismo recurso
+                etag_header = next(name for name in headers if name.lower() == "etag")
+                headers[etag_header] = headers[etag_header][:-1] + '-gzip"'
+            return Response(cached.gzip_body, media_type="application/json", headers=headers)
+        return Response(cached.body, media_type="application/json", headers=headers)
+
+    def clear(self):
+        self.local.clear()
@@ -0,0 +1,164 @@
+import math
+import os
+
+import numpy as np
+
+from app.caching import TTLCache
+from app.mongo import GeoType, Severity, UserType
+from app.tiles import MAX_LATITUDE
+
+# Agrupación de hotspots en una rejilla jerárquica alineada con las teselas: cada nivel de zoom divide
+# las celdas del anterior en cuatro, así que todas las celdas se obtienen desplazando bits
+CLUSTER_MIN_ZOOM = int(os.environ.get("SOTERIA_CLUSTER_MIN_ZOOM", 0))
+CLUSTER_MAX_ZOOM = int(os.environ.get("SOTERIA_CLUSTER_MAX_ZOOM", 16))
+# Celdas de 2^-CLUSTER_CELL_BITS teselas: 2 bits son celdas de 64 px en teselas de 256 px
+CLUSTER_CELL_BITS = int(os.environ.get("SOTERIA_CLUSTER_CELL_BITS", 2))
+CLUSTER_INDEX_CACHE_SIZE = int(os.environ.get("SOTERIA_CLUSTER_INDEX_CACHE_SIZE", 64))
+CLUSTER_INDEX_TTL_SECONDS = float(os.environ.get("SOTERIA_CLUSTER_INDEX_TTL_SECONDS", 24 * 3600))
+
+FINEST_LEVEL = CLUSTER_MAX_ZOOM + CLUSTER_CELL_BITS
+USERS = [user.value for user in UserType]
+SEVERITIES = [severity.value for severity in Severity]
+TYPES = [geo_type.value for geo_type in GeoType]
+
+def representative_point(geometry):
+    """Point of a hotspot used for clustering: the point itself, or the mean of a line's vertices."""
+    coordinates = np.asarray((geometry or {}).get("coordinates") or [], dtype=float)
+    if coordinates.size == 0:
+        return None
+    if coordinates.ndim == 1:
+        return coordinates[0], coordinates[1]
+    coordinates = coordinates.reshape(-1, coordinates.shape[-1])
+    return coordinates[:, 0].mean(), coordinates[:, 1].mean()
+
+def grid_cells(lon, lat, level):
+    """Integer (x, y) cell of each point in the Web Mercator grid with 2^level cells per side."""
+    n = 2 ** level
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+class HotspotClusterIndex:
+    """
+    The hotspots of one month with their point, finest grid cell, type and (user, severity) pairs as
+    arrays. Clusters for any zoom and bbox are computed from these arrays, without querying MongoDB.
+    """
+
+    def __init__(self, hotspots):
+        points = [(doc, representative_point(doc.get("geometry"))) for doc in hotspots]
+        points = [(doc, point) for doc, point in points if point is not None]
+        self.documents = [doc for doc, _ in points]
+        self.lon = np.array([point[0] for _, point in points], dtype=float)
+        self.lat = np.array([point[1] for _, point in points], dtype=float)
+        self.x, self.y = grid_cells(self.lon, self.lat, FINEST_LEVEL)
+
+        self.types = np.zeros((len(points), len(TYPES)), dtype=bool)
+        # pairs[i, u, s]: el hotspot i tiene una entrada de info con el usuario u y la gravedad s
+        self.pairs = np.zeros((len(points), len(USERS), len(SEVERITIES)), dtype=bool)
+        for i, doc in enumerate(self.documents):
+            properties = doc.get("properties") or {}
+            location_type = properties.get("locationType", properties.get("hotspotType"))
+            if location_type in TYPES:
+                self.types[i, TYPES.index(location_type)] = True
+            for info in properties.get("info") or []:
+                if info.get("user") in USERS and info.get("severity") in SEVERITIES:
+                    self.pairs[i, USERS.index(info["user"]), SEVERITIES.index(info["severity"])] = True
+
+    def _mask(self, type, user, severity):
+        mask = np.ones(len(self.documents), dtype=bool)
+        if type is not None:
+            mask &= self.types[:, TYPES.index(type.value)]
+        # Mismo criterio que get_all_hotspots: usuario y gravedad juntos deben estar en la misma entrada
+        if user is not None and severity is not None:
+            mask &= self.pairs[:, USERS.index(user.value), SEVERITIES.index(severity.value)]
+        elif user is not None:
+            mask &= self.pairs[:, USERS.index(user.value), :].any(axis=1)
+        elif severity is not None:
+            mask &= self.pairs[:, :, SEVERITIES.index(severity.value)].any(axis=1)
+        return mask
+
+    def clusters(self, zoom, bbox, type=None, user=None, severity=None):
+        """
+        GeoJSON features for the bbox at `zoom`: a Point per grid cell with more than one hotspot, with
+        its centroid, count and breakdowns, and the hotspot documents of cells holding only one. Every
+        cell touching the bbox is returned whole, so clusters do not change while panning. Beyond
+        CLUSTER_MAX_ZOOM every hotspot in the bbox is returned as is.
+        """
+        west, south, east, north = bbox
+        mask = self._mask(type, user, severity)
+        if zoom > CLUSTER_MAX_ZOOM:
+            mask &= (self.lon >= west) & (self.lon <= east) & (self.lat >= south) & (self.lat <= north)
+            return [self.documents[i] for i in np.flatnonzero(mask)]
+
+        level = max(CLUSTER_MIN_ZOOM, zoom) + CLUSTER_CELL_BITS
+        shift = FINEST_LEVEL - level
+        (min_x, max_x), (max_y, min_y) = grid_cells(np.array([west, east]), np.array([south, north]), level)
+        x, y = self.x >> shift, self.y >> shift
+        mask &= (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+        selected = np.flatnonzero(mask)
+        if len(selected) == 0:
+            return []
+
+        cells, inverse, counts = np.unique(np.stack([x[selected], y[selected]], axis=1), axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+        sum_by_cell = lambda values: np.bincount(inverse, weights=values, minlength=len(cells))
+        centroid_lon, centroid_lat = sum_by_cell(self.lon[selected]) / counts, sum_by_cell(self.lat[selected]) / counts
+        breakdowns = {}
+        for name, labels, flags in (("types", TYPES, self.types[selected]), ("users", USERS, self.pairs[selected].any(axis=2)), ("severities", SEVERITIES, self.pairs[selected].any(axis=1))):
+            totals = np.zeros((len(cells), len(labels)), dtype=np.int64)
+            np.add.at(totals, inverse, flags)
+            breakdowns[name] = (labels, totals)
+        expansion_zooms = self._expansion_zooms(selected, inverse, len(cells), zoom)
+        member = np.empty(len(cells), dtype=np.int64)
+        member[inverse] = selected
+
+        features = []
+        for cell, (cell_x, cell_y) in enumerate(cells.tolist()):
+            if counts[cell] == 1:
+                features.append(self.documents[member[cell]])
+                continue
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [float(centroid_lon[cell]), float(centroid_lat[cell])]},
+                "properties": {
+                    "cluster": True,
+                    "cluster_id": f"{level}/{cell_x}/{cell_y}",
+                    "count": int(counts[cell]),
+                    "expansion_zoom": int(expansion_zooms[cell]),
+                } | {name: dict(zip(labels, totals[cell].tolist())) for name, (labels, totals) in breakdowns.items()},
+            })
+        return features
+
+    def _expansion_zooms(self, selected, inverse, cell_count, zoom):
+        """First zoom at which each cluster splits into several cells, to zoom to on click."""
+        result = np.full(cell_count, CLUSTER_MAX_ZOOM + 1, dtype=np.int64)
+        pending = np.ones(cell_count, dtype=bool)
+        for next_zoom in range(max(CLUSTER_MIN_ZOOM, zoom) + 1, CLUSTER_MAX_ZOOM + 1):
+            shift = FINEST_LEVEL - next_zoom - CLUSTER_CELL_BITS
+            children = np.unique(np.stack([inverse, self.x[selected] >> shift, self.y[selected] >> shift], axis=1), axis=0)
+            splits = np.bincount(children[:, 0], minlength=cell_count) > 1
+            result[pending & splits] = next_zoom
+            pending &= ~splits
+            if not pending.any():
+                break
+        return result
+
+class HotspotClusters:
+    """HotspotClusterIndex per (collection, month, year), keyed by dataset version and built with one query."""
+
+    def __init__(self, dataset_versions, maxsize=CLUSTER_INDEX_CACHE_SIZE, ttl=CLUSTER_INDEX_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.indexes = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def index(self, collection_name, month, year):
+        key = (collection_name, month, year, self.dataset_versions.key(collection_name))
+        index = self.indexes.get(key)
+        if index is None:
+            hotspots = self.dataset_versions.db_manager.get_all_hotspots(collection_name, -1, None, None, None, month, year)
+            index = HotspotClusterIndex(hotspots)
+            self.indexes.set(key, index)
+        return index
+
+    def clusters(self, collection_name, zoom, bbox, month=None, year=None, type=None, user=None, severity=None):
+        return self.index(collection_name, month, year).clusters(zoom, bbox, type, user, severity)
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+
+from app.caching import TTLCache
+from app.mongo import DemandType
+from app.spatial_join import SNAP_MAX_DISTANCE_METERS, LineIndex, index_cell_size, line_accident_counts
+
+# Accidentes por cada 1000 vehículos calculados en el momento: sólo se guardan los vectores por arco
+# (demanda por tipo y accidentes por filtro); cada consulta es una división y un rango percentil
+DEMAND_EDGES_CACHE_SIZE = int(os.environ.get("SOTERIA_DEMAND_EDGES_CACHE_SIZE", 4))
+EDGE_ACCIDENTS_CACHE_SIZE = int(os.environ.get("SOTERIA_EDGE_ACCIDENTS_CACHE_SIZE", 64))
+DEMAND_RATES_TTL_SECONDS = float(os.environ.get("SOTERIA_DEMAND_RATES_TTL_SECONDS", 24 * 3600))
+
+class DemandEdges:
+    """The edges of a travel demand collection: LineIndex over their geometry and one demand vector per DemandType."""
+
+    def __init__(self, documents, cell_size=SNAP_MAX_DISTANCE_METERS):
+        self.lines = LineIndex(documents, cell_size)
+        properties = [doc.get("properties") or {} for doc in self.lines.documents]
+        self.edge_ids = [p.get("edgeID") for p in properties]
+        self.demand = {
+            demand_type: np.array([float((p.get("total_demand") or {}).get(demand_type.value) or 0) for p in properties])
+            for demand_type in DemandType
+        }
+
+def percentile_ranks(values, valid):
+    """Percentage of the valid values less than or equal to each value (0-100), 0 where not valid."""
+    reference = np.sort(values[valid])
+    ranks = np.zeros(len(values))
+    if len(reference):
+        ranks[valid] = np.searchsorted(reference, values[valid], side="right") * 100.0 / len(reference)
+    return ranks
+
+class DemandAccidentRates:
+    """
+    Accidents per 1000 vehicles of each edge for any period, demand type and accident filters. The
+    accidents are snapped to the edge geometry and counted per edge; the edges (with their demand
+    vectors) and the count vectors are cached by dataset version, the rates and percentiles are not.
+    """
+
+    def __init__(self, dataset_versions, ttl=DEMAND_RATES_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.edges = TTLCache(maxsize=DEMAND_EDGES_CACHE_SIZE, ttl=ttl)
+        self.accidents = TTLCache(maxsize=EDGE_ACCIDENTS_CACHE_SIZE, ttl=ttl)
+
+    def demand_edges(self, collection_name, max_distance):
+        # Índice con tamaño de celda fijo por colección: max_distance sólo limita el ajuste
+        cell_size = index_cell_size(max_distance)
+        key = (collection_name, cell_size, self.dataset_versions.key(collection_name))
+        edges = self.edges.get(key)
+        if edges is None:
+            edges = DemandEdges(self.dataset_versions.db_manager.get_demand_edges(collection_name), cell_size)
+            self.edges.set(key, edges)
+        return edges
+
+    def edge_accidents(self, accidents_collection_name, edges, demand_collection_name, start, end, severity, user, max_distance):
+        """(accidents, killed or severe) per edge for the period and filters."""
+        key = (accidents_collection_name, demand_collection_name, start, end, severity, user, max_distance,
+               self.dataset_versions.key(accidents_collection_name), self.dataset_versions.key(demand_collection_name))
+        counts = self.accidents.get(key)
+        if counts is None:
+            points = self.dataset_versions.db_manager.get_accident_points_in_period(accidents_collection_name, start, end, severity, user)
+            counts = line_accident_counts(edges.lines, points, max_distance)[:2]
+            self.accidents.set(key, counts)
+        return counts
+
+    def rates(self, accidents_collection_name, demand_collection_name, start, end, demand_type=DemandType.PrivateVehicle, severity=None, user=None,
+              accidents_percentile=None, quantity=50, max_distance=SNAP_MAX_DISTANCE_METERS):
+        """
+        Edges in the layout of LGL_travelDemandAccidents, highest rate first, with the rate recomputed for the
+        period and filters. Percentiles rank the rate among the edges with demand of that type.
+        """
+        edges = self.demand_edges(demand_collection_name, max_distance)
+        accidents, severe = self.edge_accidents(accidents_collection_name, edges, demand_collection_name, start, end, severity, user, max_distance)
+        demand = edges.demand[demand_type]
+
+        with_demand = demand > 0
+        rate = np.divide(accidents * 1000.0, demand, out=np.zeros(len(demand)), where=with_demand)
+        percentile = percentile_ranks(rate, with_demand)
+
+        selected = np.flatnonzero(with_demand)
+        if accidents_percentile is not None:
+            selected = selected[percentile[selected] >= accidents_percentile]
+        selected = selected[np.argsort(-rate[selected], kind="stable")]
+        if quantity not in (None, -1):
+            selected = selected[:quantity]
+
+        return [{
+            "type": "Feature",
+            "geometry": edges.lines.documents[i]["geometry"],
+            "properties": {
+                "edgeID": edges.edge_ids[i],
+                "demandType": demand_type.value,
+                "accidents": int(accidents[i]),
+                "fatal_and_severe": int(severe[i]),
+                "demand": float(demand[i]),
+                "accidents_per_1000_vehicles": float(rate[i]),
+                "percentile_accidents_per_1000_vehicles": float(percentile[i]),
+            },
+        } for i in selected.tolist()]
@@ -0,0 +1,98 @@
+import base64
+import io
+import json
+import math
+import os
+
+import numpy as np
+
+from app.caching import ByteLRUCache
+from app.tiles import MAX_LATITUDE, padded_bbox_polygon, tile_bounds, tile_row_latitude
+
+# Rásteres de densidad por tesela XYZ: histograma de los puntos, suavizado gaussiano y cuantización a 8 bits
+DENSITY_CACHE_MAX_BYTES = int(os.environ.get("SOTERIA_DENSITY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+def pixel_coordinates(lon, lat, zoom, x, y, size):
+    """Position of each point in pixels of tile (zoom, x, y), with (0, 0) at its north-west corner."""
+    n = 2 ** zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    column = ((np.asarray(lon) + 180.0) / 360.0 * n - x) * size
+    row = ((1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * n - y) * size
+    return column, row
+
+def gaussian_kernel(sigma):
+    radius = max(1, int(math.ceil(3 * sigma)))
+    offsets = np.arange(-radius, radius + 1, dtype=float)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    return kernel / kernel.sum()
+
+def gaussian_blur(grid, sigma):
+    """Separable Gaussian blur: one 1-D convolution per row, then per column."""
+    if sigma <= 0:
+        return grid
+    kernel = gaussian_kernel(sigma)
+    grid = np.apply_along_axis(np.convolve, 1, grid, kernel, mode="same")
+    return np.apply_along_axis(np.convolve, 0, grid, kernel, mode="same")
+
+def density_grid(points, zoom, x, y, size, sigma=0.0):
+    """
+    Weighted point counts per pixel of the tile, blurred with `sigma` pixels. Points are histogrammed
+    on a grid padded by the kernel radius, so points just outside the tile also spread into it and
+    neighbouring tiles match at their edges.
+    """
+    margin = max(1, int(math.ceil(3 * sigma))) if sigma > 0 else 0
+    if not points:
+        return np.zeros((size, size))
+    lon, lat, weights = (np.asarray(values, dtype=float) for values in zip(*points))
+    column, row = pixel_coordinates(lon, lat, zoom, x, y, size)
+    grid, _, _ = np.histogram2d(row, column, bins=size + 2 * margin, range=[[-margin, size + margin], [-margin, size + margin]], weights=weights)
+    grid = gaussian_blur(grid, sigma)
+    return grid[margin:margin + size, margin:margin + size]
+
+def quantize(grid, scale=None):
+    """uint8 raster with 255 at `scale` (the tile's maximum when None) and the scale used."""
+    scale = float(scale) if scale else float(grid.max())
+    if scale <= 0:
+        return np.zeros(grid.shape, dtype=np.uint8), 0.0
+    return np.round(np.clip(grid / scale, 0, 1) * 255).astype(np.uint8), scale
+
+def encode_png(raster):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(raster).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+class DensityTiles:
+    """
+    Density rasters per tile, cached as encoded bytes by tile, resolution, smoothing, scale, filters
+    and the dataset version of the collection. Points come from `method(collection_name, geometry,
+    *args)`, a MongoDBManager query returning (lon, lat, weight) tuples inside the geometry.
+    """
+
+    def __init__(self, dataset_versions, max_bytes=DENSITY_CACHE_MAX_BYTES):
+        self.dataset_versions = dataset_versions
+        self.cache = ByteLRUCache(max_bytes)
+
+    def render(self, collection_name, zoom, x, y, size, sigma, scale, image_format, method, *args):
+        """Returns (body, metadata): PNG bytes or the quantized raster as JSON with its bounds."""
+        key = (method.__name__, collection_name, args, zoom, x, y, size, sigma, scale, image_format, self.dataset_versions.key(collection_name))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        bounds = tile_bounds(zoom, x, y)
+        west, _, east, _ = bounds
+        # Radio del núcleo en fracciones de tesela: en longitud es lineal, en latitud se convierte fila a fila
+        margin = math.ceil(3 * sigma) / size if sigma > 0 else 0
+        query_bounds = (west - margin * (east - west), tile_row_latitude(zoom, y + 1 + margin), east + margin * (east - west), tile_row_latitude(zoom, y - margin))
+        points = method(collection_name, padded_bbox_polygon(*query_bounds), *args)
+        raster, used_scale = quantize(density_grid(points, zoom, x, y, size, sigma), scale)
+        metadata = {"bounds": list(bounds), "width": size, "height": size, "scale": used_scale, "points": len(points)}
+
+        if image_format == "png":
+            body = encode_png(raster)
+        else:
+            body = json.dumps({"data": base64.b64encode(raster.tobytes()).decode()} | metadata, separators=(",", ":")).encode()
+        self.cache.set(key, (body, metadata), len(body))
+        return body, metadata
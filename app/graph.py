@@ -1,5 +1,4 @@
-import matplotlib.pyplot as plt
-import pandas as pd
+# matplotlib y pandas se importan dentro de las funciones: importar este módulo no debe cargarlos
 
 # The provided data sample, replace this with your actual data in the same format
 data = [
@@ -489,6 +488,8 @@ data = [
 
 # Convertir los datos a un DataFrame para facilitar el trazado
 def prepare_data(data, user):
+    import pandas as pd
+
     records = []
     for severity_data in data:
         if severity_data["user"] == user:
@@ -508,13 +509,14 @@ def prepare_data(data, user):
                     })
     return pd.DataFrame(records)
 
-# Generar gráficos para cada usuario
-for user_data in data:
-    user = user_data["user"]
+# Generar el gráfico de un usuario
+def plot_user(data, user):
+    import matplotlib.pyplot as plt
+
     df = prepare_data(data, user)
 
     # Trazado
-    plt.figure(figsize=(10, 6))
+    figure = plt.figure(figsize=(10, 6))
     for i, (severity, group) in enumerate(df.groupby("Severity")):
         # Extraer columnas de deciles en orden del 1 al 10
         decile_columns = [f"D{d}" for d in range(1, 11)]
@@ -533,4 +535,30 @@ for user_data in data:
 
     plt.suptitle(f"Event Totals by Severity for {user.capitalize()}")
     plt.tight_layout(rect=[0, 0, 1, 0.96])
-    plt.show()
\ No newline at end of file
+    return figure
+
+# Renderizar el gráfico de un usuario como imagen (se ejecuta en el pool de procesos de app.workers)
+def render_chart(data, user, image_format="png"):
+    import io
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure = plot_user(data, user)
+    buffer = io.BytesIO()
+    try:
+        figure.savefig(buffer, format=image_format)
+    finally:
+        plt.close(figure)
+    return buffer.getvalue()
+
+# Generar gráficos para cada usuario
+def main():
+    import matplotlib.pyplot as plt
+
+    for user_data in data:
+        plot_user(data, user_data["user"])
+        plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import math
+import os
+
+import numpy as np
+
+from app.caching import TTLCache
+from app.mongo import GeoType, Severity
+from app.spatial_join import KILLED_OR_SEVERE, cell_keys, expand_ranges, to_meters
+from app.tiles import MAX_LATITUDE
+from app.workers import PROCESS_POOL_WORKERS, get_process_pool
+
+# Hotspots calculados a demanda: densidad de accidentes (núcleo cuártico) evaluada en los nodos o
+# segmentos de la red viaria, para cualquier periodo, usuario y gravedad
+HOTSPOT_BANDWIDTH_METERS = float(os.environ.get("SOTERIA_HOTSPOT_BANDWIDTH_METERS", 100))
+HOTSPOT_MIN_ACCIDENTS = int(os.environ.get("SOTERIA_HOTSPOT_MIN_ACCIDENTS", 3))
+HOTSPOT_PERCENTILE = float(os.environ.get("SOTERIA_HOTSPOT_PERCENTILE", 95))
+# A partir de este número de accidentes, el cálculo se reparte en el pool de procesos
+HOTSPOT_PARALLEL_MIN_ACCIDENTS = int(os.environ.get("SOTERIA_HOTSPOT_PARALLEL_MIN_ACCIDENTS", 50000))
+HOTSPOT_SITE_CACHE_SIZE = int(os.environ.get("SOTERIA_HOTSPOT_SITE_CACHE_SIZE", 8))
+HOTSPOT_SITE_TTL_SECONDS = float(os.environ.get("SOTERIA_HOTSPOT_SITE_TTL_SECONDS", 24 * 3600))
+
+def neighbour_pairs(site_x, site_y, point_x, point_y, radius):
+    """
+    Every (site, point) pair closer than `radius`, found through a grid of `radius`-sized cells: each
+    site only looks at the points of its own cell and the eight around it. Returns the two index
+    arrays and the distances.
+    """
+    cell = lambda values: np.floor(values / radius).astype(np.int64)
+    point_keys = cell_keys(cell(point_x), cell(point_y))
+    order = np.argsort(point_keys, kind="stable")
+    sorted_keys = point_keys[order]
+
+    site_cx, site_cy = cell(site_x), cell(site_y)
+    sites, points = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = cell_keys(site_cx + dx, site_cy + dy)
+            owners, positions = expand_ranges(np.searchsorted(sorted_keys, keys, side="left"), np.searchsorted(sorted_keys, keys, side="right"))
+            sites.append(owners)
+            points.append(order[positions])
+    sites, points = np.concatenate(sites), np.concatenate(points)
+    distances = np.hypot(site_x[sites] - point_x[points], site_y[sites] - point_y[points])
+    close = distances < radius
+    return sites[close], points[close], distances[close]
+
+def score_sites(site_x, site_y, point_x, point_y, point_severe, radius):
+    """
+    Quartic kernel density of the points at each site, with the number of points and of killed or
+    severe points within `radius`. Module-level so it can run in the process pool.
+    """
+    sites, points, distances = neighbour_pairs(site_x, site_y, point_x, point_y, radius)
+    weights = (1 - (distances / radius) ** 2) ** 2
+    n = len(site_x)
+    density = np.bincount(sites, weights=weights, minlength=n) * 3 / (math.pi * radius ** 2)
+    counts = np.bincount(sites, minlength=n)
+    severe = np.bincount(sites, weights=point_severe[points], minlength=n).astype(np.int64)
+    return density, counts, severe
+
+class NetworkSites:
+    """Nodes or segments of a road network as arrays: representative point in meters and the original document."""
+
+    def __init__(self, documents, geo_type: GeoType):
+        self.geo_type = geo_type
+        self.documents, lon, lat = [], [], []
+        for doc in documents:
+            coordinates = np.asarray((doc.get("geometry") or {}).get("coordinates") or [], dtype=float)
+            if coordinates.size < 2:
+                continue
+            coordinates = coordinates.reshape(-1, coordinates.shape[-1])
+            self.documents.append(doc)
+            lon.append(coordinates[:, 0].mean())
+            lat.append(coordinates[:, 1].mean())
+        self.origin_lat = float(np.clip(np.mean(lat), -MAX_LATITUDE, MAX_LATITUDE)) if lat else 0.0
+        self.x, self.y = to_meters(lon, lat, self.origin_lat)
+
+    def location(self, index):
+        """locationID and id with the same values as the accident and hotspot collections."""
+        properties = self.documents[index].get("properties") or {}
+        if self.geo_type is GeoType.segment:
+            location_id = {key: properties.get(key) for key in ("u", "v", "key", "segmentID")}
+            return location_id, properties.get("segmentID")
+        location_id = properties.get("osmid", properties.get("locationID"))
+        return location_id, location_id
+
+class HotspotEngine:
+    """
+    Computes hotspots for any period from the accident points and the road network. Each accident
+    contributes a quartic kernel of radius `bandwidth` to the nodes (or segments) around it; a site
+    is a hotspot when it has at least `min_accidents` accidents within the radius and its density is
+    in the top `percentile` of the sites with accidents. The network is loaded once per dataset version.
+    """
+
+    def __init__(self, dataset_versions, maxsize=HOTSPOT_SITE_CACHE_SIZE, ttl=HOTSPOT_SITE_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.sites = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def network_sites(self, collection_name, geo_type):
+        key = (collection_name, geo_type, self.dataset_versions.key(collection_name))
+        sites = self.sites.get(key)
+        if sites is None:
+            sites = NetworkSites(self.dataset_versions.db_manager.get_network_sites(collection_name), geo_type)
+            self.sites.set(key, sites)
+        return sites
+
+    def score(self, sites, point_x, point_y, point_severe, radius):
+        if len(point_x) < HOTSPOT_PARALLEL_MIN_ACCIDENTS or PROCESS_POOL_WORKERS < 2:
+            return score_sites(sites.x, sites.y, point_x, point_y, point_severe, radius)
+        # Periodos largos: los sitios se reparten por franjas entre los procesos; cada franja sólo
+        # necesita los accidentes a menos de un radio de ella
+        bounds = np.linspace(sites.y.min(), sites.y.max(), PROCESS_POOL_WORKERS + 1)
+        bounds[-1] = np.inf
+        chunks = [np.flatnonzero((sites.y >= low) & (sites.y < high)) for low, high in zip(bounds[:-1], bounds[1:])]
+        chunks = [chunk for chunk in chunks if len(chunk)]
+        jobs = []
+        for chunk in chunks:
+            near = (point_y >= sites.y[chunk].min() - radius) & (point_y <= sites.y[chunk].max() + radius)
+            jobs.append((sites.x[chunk], sites.y[chunk], point_x[near], point_y[near], point_severe[near], radius))
+        results = list(get_process_pool().map(score_sites, *zip(*jobs)))
+        density, counts, severe = np.zeros(len(sites.x)), np.zeros(len(sites.x), dtype=np.int64), np.zeros(len(sites.x), dtype=np.int64)
+        for chunk, (chunk_density, chunk_counts, chunk_severe) in zip(chunks, results):
+            density[chunk], counts[chunk], severe[chunk] = chunk_density, chunk_counts, chunk_severe
+        return density, counts, severe
+
+    def hotspots(self, accidents_collection_name, sites_collection_name, start, end, geo_type=GeoType.intersection, user=None, severity=None,
+                 bandwidth=HOTSPOT_BANDWIDTH_METERS, min_accidents=HOTSPOT_MIN_ACCIDENTS, percentile=HOTSPOT_PERCENTILE, quantity=None):
+        """Hotspot documents in the get_all_hotspots layout, densest first, with the accident counts behind each one."""
+        sites = self.network_sites(sites_collection_name, geo_type)
+        points = self.dataset_versions.db_manager.get_accident_points_in_period(accidents_collection_name, start, end, severity, user)
+        if not points or not sites.documents:
+            return []
+
+        lon, lat, severities = zip(*points)
+        point_x, point_y = to_meters(lon, lat, sites.origin_lat)
+        point_severe = np.isin(np.asarray(severities, dtype=object), KILLED_OR_SEVERE).astype(float)
+        density, counts, severe = self.score(sites, point_x, point_y, point_severe, bandwidth)
+
+        candidates = np.flatnonzero(counts >= min_accidents)
+        if len(candidates) == 0:
+            return []
+        threshold = np.percentile(density[counts > 0], percentile)
+        selected = candidates[density[candidates] >= threshold]
+        selected = selected[np.argsort(-density[selected], kind="stable")]
+        if quantity not in (None, -1, 0):
+            selected = selected[:quantity]
+
+        user_value = user.value if user is not None else "general"
+        result = []
+        for index in selected.tolist():
+            location_id, site_id = sites.location(index)
+            result.append({
+                "type": "Feature",
+                "geometry": sites.documents[index]["geometry"],
+                "properties": {
+                    "id": site_id,
+                    "locationID": location_id,
+                    "locationType": geo_type.value,
+                    "hotspotType": geo_type.value,
+                    "date": start,
+                    "end_date": end,
+                    "info": [{"user": user_value, "severity": (Severity.severe if severe[index] > 0 else Severity.light).value}],
+                    "accidents": int(counts[index]),
+                    "fatal_and_severe_accidents": int(severe[index]),
+                    "density": float(density[index]),
+                },
+            })
+        return result
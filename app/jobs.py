@@ -0,0 +1,29 @@
+import datetime
+
+# Estado de los trabajos de administración que se ejecutan fuera de la petición HTTP
+class BackgroundJob:
+    def __init__(self, name):
+        self.name = name
+        self.status = "running"
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.finished_at = None
+        self.steps = {}
+        self.error = None
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    def finish(self, error=None):
+        self.status, self.error = ("failed", str(error)) if error is not None else ("done", None)
+        self.finished_at = datetime.datetime.now(datetime.timezone.utc)
+
+    def as_dict(self):
+        return {
+            "job": self.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps": self.steps,
+            "error": self.error,
+        }
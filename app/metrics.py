@@ -0,0 +1,192 @@
+from collections import defaultdict
+import bisect
+import os
+import threading
+import time
+
+import bson
+from pymongo import monitoring
+
+from app.mongo import Location
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+COUNT_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+# Bytes recibidos de MongoDB: sólo se codifica 1 de cada N respuestas por colección y comando, y se
+# cuenta multiplicada por N; 1 mide todas
+MONGO_BYTES_SAMPLE_EVERY = max(1, int(os.environ.get("SOTERIA_MONGO_BYTES_SAMPLE_EVERY", 20)))
+# Valores admitidos para la etiqueta location: cualquier otro segmento de ruta cuenta como "other"
+LOCATION_LABELS = frozenset(location.value for location in Location)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in self._values.items()]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [cuentas por bucket..., +Inf, suma]
+        self._values = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def _samples(self):
+        samples = []
+        for labels, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                samples.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', bound)])} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {counts[-1]}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return samples
+
+REGISTRY = []
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# HTTP
+http_request_duration = Histogram("soteria_http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "location", "status"))
+http_response_size = Histogram("soteria_http_response_size_bytes", "HTTP response body size by route template", ("method", "route", "location"), buckets=SIZE_BUCKETS)
+http_requests_in_flight = Gauge("soteria_http_requests_in_flight", "HTTP requests currently being served", ("method",))
+
+# MongoDB
+mongo_command_duration = Histogram("soteria_mongo_command_duration_seconds", "MongoDB command duration by collection and command", ("collection", "command"))
+mongo_command_documents = Histogram("soteria_mongo_command_documents", "Documents returned per MongoDB command", ("collection", "command"), buckets=COUNT_BUCKETS)
+mongo_command_bytes = Counter("soteria_mongo_received_bytes_total", "Estimated BSON bytes received from MongoDB by collection and command (1 in SOTERIA_MONGO_BYTES_SAMPLE_EVERY replies measured and scaled up)", ("collection", "command"))
+mongo_command_failures = Counter("soteria_mongo_command_failures_total", "Failed MongoDB commands by collection and command", ("collection", "command"))
+
+class MetricsMiddleware:
+    """ASGI middleware that records latency, response size and in-flight requests per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        http_requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec(method)
+            # El router deja la ruta resuelta en el scope; así las etiquetas no dependen de los parámetros
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            location = scope.get("path_params", {}).get("location", "")
+            if location and location not in LOCATION_LABELS:
+                location = "other"
+            http_request_duration.observe(elapsed, method, route_path, location, str(status_code))
+            http_response_size.observe(response_size, method, route_path, location)
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Records duration and returned documents for every MongoDB command, and an estimate of the bytes
+    received: re-encoding a reply costs as much as decoding it, so only a sample of replies is sized.
+    """
+
+    def __init__(self, sample_every=MONGO_BYTES_SAMPLE_EVERY):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.sample_every = sample_every
+        self._replies = defaultdict(int)
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _pop_collection(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), "")
+
+    def _sampled(self, collection, command):
+        with self._lock:
+            self._replies[(collection, command)] += 1
+            return self._replies[(collection, command)] % self.sample_every == 1 % self.sample_every
+
+    def succeeded(self, event):
+        collection = self._pop_collection(event)
+        command = event.command_name
+        mongo_command_duration.observe(event.duration_micros / 1_000_000, collection, command)
+        if self._sampled(collection, command):
+            mongo_command_bytes.inc(collection, command, amount=len(bson.encode(event.reply)) * self.sample_every)
+
+        cursor = event.reply.get("cursor")
+        if isinstance(cursor, dict):
+            batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+            mongo_command_documents.observe(len(batch), collection, command)
+
+    def failed(self, event):
+        collection = self._pop_collection(event)
+        mongo_command_duration.observe(event.duration_micros / 1_000_000, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
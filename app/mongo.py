@@ -1,14 +1,87 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from enum import Enum
 import datetime
 import calendar
+import functools
 import json
 import logging
+import os
+import threading
+import time
+from bson import ObjectId, json_util
 from pydantic import BaseModel
 import pymongo
 
 # Configurar logging para mongo.py
 logger = logging.getLogger(__name__)
 
+# Presupuestos de consulta: tiempo máximo en el servidor, tope de documentos devueltos
+# y número de consultas "pesadas" (sin límite o sobre toda la colección) en paralelo
+QUERY_MAX_TIME_MS = int(os.environ.get("SOTERIA_QUERY_MAX_TIME_MS", 15000))
+HEAVY_QUERY_MAX_TIME_MS = int(os.environ.get("SOTERIA_HEAVY_QUERY_MAX_TIME_MS", 60000))
+MAX_RESULT_DOCUMENTS = int(os.environ.get("SOTERIA_MAX_RESULT_DOCUMENTS", 50000))
+HEAVY_QUERY_CONCURRENCY = int(os.environ.get("SOTERIA_HEAVY_QUERY_CONCURRENCY", 4))
+HEAVY_QUERY_QUEUE_TIMEOUT = float(os.environ.get("SOTERIA_HEAVY_QUERY_QUEUE_TIMEOUT", 2.0))
+
+# Registro de consultas lentas con su plan de ejecución (explain executionStats)
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SOTERIA_SLOW_QUERY_THRESHOLD_MS", 1000))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SOTERIA_SLOW_QUERY_LOG_SIZE", 200))
+
+# Memoria de las fechas más recientes de cada colección (las versiones con array recorren la colección entera)
+RECENT_DATE_CACHE_TTL_SECONDS = float(os.environ.get("SOTERIA_RECENT_DATE_CACHE_TTL_SECONDS", 600))
+
+# Colección con la versión de datos de cada colección, actualizada en cada carga por lotes
+DATASET_VERSIONS_COLLECTION = "dataset_versions"
+
+# Consultas de accidentes por hotspot: tamaño máximo de un lote y colecciones con índice sobre el hotspot
+MAX_BATCH_HOTSPOTS = int(os.environ.get("SOTERIA_MAX_BATCH_HOTSPOTS", 500))
+ENSURE_INDEXES = os.environ.get("SOTERIA_ENSURE_INDEXES", "1") != "0"
+HOTSPOT_LOOKUP_COLLECTIONS = ['LGL_accidents', 'LGL_accidents_CADaS', 'LG_saxony_accidents']
+
+# Etiquetas de salida de las estadísticas de accidentes (limpioMadridAccidentalidad), por valor almacenado
+ACCIDENT_INVOLVED_USER_LABELS = {'Driver': 'Driver', 'Passenger': 'Passenger', 'Pedestrian': 'Pedestrian'}
+ACCIDENT_VEHICLE_LABELS = {
+    'Car': 'Car', 'Commercial Vehicle': 'Commercial Vehicle', 'Emergency Vehicle': 'Emergency Vehicle',
+    'Personal Mobility Vehicle': 'Urban Mobility Vehicle', 'Others': 'Other', 'Bus': 'Bus', 'Unknown': 'Unknown',
+    'Motorcycle': 'Motorcycle', 'Bicycle': 'Bicycle', 'Non-Motorized': 'Non-Motorized', 'Train': 'Train',
+}
+ACCIDENT_CAUSE_LABELS = {
+    'Alcance': 'Rear-end collision', 'Colisión fronto-lateral': 'Front-lateral collision', 'Otro': 'Other',
+    'Solo salida de la vía': 'Run-off-the-road only', 'Colisión frontal': 'Head-on collision',
+    'Choque contra obstáculo fijo': 'Crash into fixed obstacle', 'Caída': 'Falling', 'Colisión lateral': 'Side impact collision',
+    'Atropello a persona': 'Person run over', 'Colisión múltiple': 'Multiple collision', 'Vuelco': 'Roll-over',
+    'Atropello a animal': 'Animal run over',
+}
+ACCIDENT_AGE_LABELS = {
+    'Menor de 5 años': 'Less than 5 years', 'De 6 a 9 años': 'From 6 to 9 years', 'De 10 a 14 años': 'From 10 to 14 years',
+    'De 15 a 17 años': 'From 15 to 17 years', 'De 18 a 20 años': 'From 18 to 20 years', 'De 21 a 24 años': 'From 21 to 24 years',
+    'De 25 a 29 años': 'From 25 to 30 years', 'De 30 a 34 años': 'From 30 to 34 years', 'De 35 a 39 años': 'From 35 to 40 years',
+    'De 40 a 44 años': 'From 40 to 44 years', 'De 45 a 49 años': 'From 45 to 50 years', 'De 50 a 54 años': 'From 50 to 54 years',
+    'De 55 a 59 años': 'From 55 to 60 years', 'De 60 a 64 años': 'From 60 to 64 years', 'De 65 a 69 años': 'From 65 to 70 years',
+    'De 70 a 74 años': 'From 70 to 74 years', 'Más de 74 años': 'More than 74 years',
+}
+# (sección de la respuesta, campo, etiquetas) de los desgloses de accidentes graves y mortales
+ACCIDENT_FSA_BREAKDOWNS = [
+    ('FatalAndSevereAccidentsByInvolvedUser', 'tipo_persona', ACCIDENT_INVOLVED_USER_LABELS),
+    ('FatalAndSevereAccidentsByUserType', 'grupo_tipo_vehiculo', ACCIDENT_VEHICLE_LABELS),
+    ('FatalAndSevereAccidentsByCauses', 'tipo_accidente', ACCIDENT_CAUSE_LABELS),
+    ('FatalAndSevereAccidentsByAgeRange', 'rango_edad', ACCIDENT_AGE_LABELS),
+]
+
+# Campo con el distrito asignado a cada accidente (ver assign_districts)
+DISTRICT_FIELD = 'district_id'
+
+class QueryBudgetExceeded(Exception):
+    """A query was rejected or aborted because it exceeded its budget."""
+
+class TooManyHeavyQueries(QueryBudgetExceeded):
+    """All heavy query slots are busy and none was freed within the queue timeout."""
+
+class ResultTooLarge(QueryBudgetExceeded):
+    """The query would return more than MAX_RESULT_DOCUMENTS documents."""
+
 class Location(Enum):
     Madrid = "madrid"
     Saxony = "saxony"
@@ -63,14 +136,248 @@ class ErrorCategory(Enum):
     High = "high"   
     VeryHigh = "very_high"  
 
+class AccidentSeverity(Enum):
+    fatal = "fatal"
+    severe = "severe"
+    slight = "slight"
+    fatal_and_severe = "fatal_and_severe"
+
+class TimeBucket(Enum):
+    hour = "hour"
+    day = "day"
+    week = "week"
+    month = "month"
+
+class HotspotBatch(BaseModel):
+    intersections: list[int] = []
+    # "u,v,key,segmentID" (como en /accidents/byhotspot) o [u, v, key, segmentID]
+    segments: list[str | tuple[int, int, int, int]] = []
+
+class AreaType(Enum):
+    district = "district"
+    hotspot = "hotspot"
+
 class Geometry(BaseModel):
     type: str
     coordinates: list[list[list[float]]]
 
+# Valores de gravedad almacenados (iguales en todas las colecciones) para cada filtro
+ACCIDENT_SEVERITY_VALUES = {
+    AccidentSeverity.fatal: ['Deceased'],
+    AccidentSeverity.severe: ['Severe'],
+    AccidentSeverity.slight: ['Slight'],
+    AccidentSeverity.fatal_and_severe: ['Severe', 'Deceased'],
+}
+
+# Estructura de cada colección de accidentes: campos de fecha, gravedad, persona y vehículo, cómo se
+# traduce cada tipo de usuario a un filtro (campo, valor) y el campo que identifica cada tipo de área
+_CADAS_LAYOUT = {
+    'date': 'properties.datetime',
+    'severity': 'properties.injury_severity_label',
+    'areas': {AreaType.district: 'properties.' + DISTRICT_FIELD},
+    'user_filters': {
+        UserType.pedestrian: ('properties.person_type_label', 'Pedestrian'),
+        UserType.cyclist: ('properties.vehicle_type_label', 'Pedal Cycle'),
+        UserType.motorcycle: ('properties.vehicle_type_label', 'Motorcycle'),
+    },
+}
+ACCIDENT_LAYOUTS = {
+    'limpioMadridAccidentalidad': {
+        'date': 'fecha_hora',
+        'severity': 'gravedad_lesividad',
+        'areas': {AreaType.district: DISTRICT_FIELD},
+        'user_filters': {
+            UserType.pedestrian: ('tipo_persona', 'Pedestrian'),
+            UserType.cyclist: ('grupo_tipo_vehiculo', 'Bicycle'),
+            UserType.motorcycle: ('grupo_tipo_vehiculo', 'Motorcycle'),
+        },
+    },
+    'LGL_accidents': {
+        'date': 'properties.fecha_hora',
+        'severity': 'properties.gravedad_lesividad',
+        'areas': {AreaType.district: 'properties.' + DISTRICT_FIELD, AreaType.hotspot: 'properties.locationID'},
+        'user_filters': {
+            UserType.pedestrian: ('properties.tipo_persona', 'Pedestrian'),
+            UserType.cyclist: ('properties.grupo_tipo_vehiculo', 'Bicycle'),
+            UserType.motorcycle: ('properties.grupo_tipo_vehiculo', 'Motorcycle'),
+        },
+    },
+    'LGL_accidents_CADaS': _CADAS_LAYOUT,
+    'LG_saxony_accidents': _CADAS_LAYOUT,
+}
+
+def _accidents_stats_accumulators():
+    """Acumuladores de $group con los recuentos de get_accidents_stats, para agrupar por distrito, año..."""
+    isFatalOrSevere = {'$in': ['$gravedad_lesividad', ['Severe', 'Deceased']]}
+    countIf = lambda condition: {'$sum': {'$cond': [condition, 1, 0]}}
+    accumulators = {
+        'AllAccidents': {'$sum': 1},
+        'FatalAccidents': countIf({'$eq': ['$gravedad_lesividad', 'Deceased']}),
+        'SevereAccidents': countIf({'$eq': ['$gravedad_lesividad', 'Severe']}),
+        'FatalAndSevereAccidents': countIf(isFatalOrSevere),
+    }
+    # Los nombres de los acumuladores no admiten puntos ni espacios: se numeran por sección
+    for section, (_, field, labels) in enumerate(ACCIDENT_FSA_BREAKDOWNS):
+        for index, value in enumerate(labels):
+            accumulators[f'fsa_{section}_{index}'] = countIf({'$and': [isFatalOrSevere, {'$eq': ['$' + field, value]}]})
+    return accumulators
+
+def _accidents_stats_from_counts(doc):
+    """Mismo formato que get_accidents_stats a partir de un documento agrupado con _accidents_stats_accumulators."""
+    stats = {'TotalNumberOfAccidents': {key: doc.get(key, 0) for key in ('AllAccidents', 'FatalAccidents', 'SevereAccidents', 'FatalAndSevereAccidents')}}
+    for section, (name, _, labels) in enumerate(ACCIDENT_FSA_BREAKDOWNS):
+        stats[name] = {label: doc.get(f'fsa_{section}_{index}', 0) for index, label in enumerate(labels.values())}
+    # Igual que get_accidents_stats: los peatones también figuran entre los tipos de usuario
+    stats['FatalAndSevereAccidentsByUserType']['Pedestrian'] = stats['FatalAndSevereAccidentsByInvolvedUser']['Pedestrian']
+    return stats
+
+class SlowQueryLog:
+    """Ring buffer with the most recent slow queries, newest first."""
+
+    def __init__(self, maxlen=SLOW_QUERY_LOG_SIZE):
+        self._entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._entries.appendleft(entry)
+
+    def entries(self, limit=None, collection=None):
+        with self._lock:
+            entries = list(self._entries)
+        if collection is not None:
+            entries = [entry for entry in entries if entry['collection'] == collection]
+        return entries[:limit] if limit is not None else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def get_field(doc, path):
+    """Valor de un campo con notación de puntos ('properties.fecha_hora'), o None si falta."""
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def area_key(value):
+    """Clave de área como texto: distritos e intersecciones por su id, segmentos como "u,v,key,segmentID" (igual que /accidents/byhotspot)."""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return ",".join(str(value.get(part)) for part in ('u', 'v', 'key', 'segmentID'))
+    return str(value)
+
+def segment_location(segment):
+    """locationID de un segmento a partir de "u,v,key,segmentID" o de la tupla equivalente."""
+    u, v, key, segmentID = map(int, segment.split(",") if isinstance(segment, str) else segment)
+    return {"u": u, "v": v, "key": key, "segmentID": segmentID}
+
+def to_json_compatible(value):
+    """Convierte tipos BSON (ObjectId, datetime...) a su representación Extended JSON."""
+    return json.loads(json_util.dumps(value))
+
 class MongoDBManager:
-    def __init__(self, connection_string):
-        self.client = pymongo.MongoClient(connection_string)
-        self.db = self.client['SoteriaDB']
+    def __init__(self, connection_string, event_listeners=None, database_name='SoteriaDB'):
+        self.client = pymongo.MongoClient(connection_string, event_listeners=event_listeners or [])
+        self.db = self.client[database_name]
+        self.heavy_query_slots = threading.BoundedSemaphore(HEAVY_QUERY_CONCURRENCY)
+        self.slow_queries = SlowQueryLog()
+        # Un único explain a la vez: repetir consultas lentas no debe duplicar la carga
+        self.explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self.explain_slot = threading.Semaphore(1)
+
+    @contextmanager
+    def heavy_query(self, queue_timeout=HEAVY_QUERY_QUEUE_TIMEOUT):
+        """
+        Reserva un hueco para una consulta pesada o la rechaza si no se libera ninguno a tiempo.
+        Con queue_timeout=None espera sin límite (trabajos en segundo plano).
+        """
+        if not self.heavy_query_slots.acquire(timeout=queue_timeout):
+            raise TooManyHeavyQueries("Too many heavy queries in progress, please retry later")
+        try:
+            yield
+        finally:
+            self.heavy_query_slots.release()
+
+    def _find(self, collection, query, projection=None, quantity=None, heavy=None, method=None):
+        """find() con maxTimeMS y tope de documentos. Por defecto, las consultas sin límite son pesadas."""
+        unlimited = quantity in (None, -1, 0)
+        if heavy is None:
+            heavy = unlimited
+        limit = MAX_RESULT_DOCUMENTS + 1 if unlimited else min(quantity, MAX_RESULT_DOCUMENTS + 1)
+        projection = projection if projection is not None else {'_id': 0}
+        cursor = collection.find(query, projection)
+        cursor = cursor.max_time_ms(HEAVY_QUERY_MAX_TIME_MS if heavy else QUERY_MAX_TIME_MS).limit(limit)
+
+        with self.heavy_query() if heavy else nullcontext():
+            with self._timed_query(method, collection, {'find': collection.name, 'filter': query, 'projection': projection, 'limit': limit}):
+                docs = list(cursor)
+        return self._check_result_size(collection, docs)
+
+    def _aggregate(self, collection, pipeline, heavy=True, method=None):
+        """aggregate() con maxTimeMS y tope de documentos."""
+        pipeline = pipeline + [{'$limit': MAX_RESULT_DOCUMENTS + 1}]
+        max_time_ms = HEAVY_QUERY_MAX_TIME_MS if heavy else QUERY_MAX_TIME_MS
+
+        with self.heavy_query() if heavy else nullcontext():
+            with self._timed_query(method, collection, {'aggregate': collection.name, 'pipeline': pipeline, 'cursor': {}}):
+                docs = list(collection.aggregate(pipeline, maxTimeMS=max_time_ms))
+        return self._check_result_size(collection, docs)
+
+    def _count(self, collection, query, method=None):
+        with self._timed_query(method, collection, {'count': collection.name, 'query': query}):
+            return collection.count_documents(query, maxTimeMS=QUERY_MAX_TIME_MS)
+
+    @contextmanager
+    def _timed_query(self, method, collection, command):
+        """Registra la consulta si es lenta, también cuando agota su maxTimeMS (que son las más lentas)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except pymongo.errors.ExecutionTimeout:
+            self._check_slow_query(start, method, collection, command, timed_out=True)
+            raise
+        self._check_slow_query(start, method, collection, command)
+
+    def _check_slow_query(self, start, method, collection, command, timed_out=False):
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms < SLOW_QUERY_THRESHOLD_MS and not timed_out:
+            return
+
+        entry = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            # Método de MongoDBManager que lanzó la consulta
+            'method': method,
+            'collection': collection.name,
+            'command': to_json_compatible(command),
+            'duration_ms': round(duration_ms, 1),
+            'timed_out': timed_out,
+            'explain': None,
+        }
+        logger.warning(f"Slow query: {json.dumps({key: value for key, value in entry.items() if key != 'explain'})}")
+        self.slow_queries.record(entry)
+
+        if self.explain_slot.acquire(blocking=False):
+            # Una consulta que agotó su tiempo volvería a agotarlo: sólo el plan, sin ejecutarla
+            self.explain_executor.submit(self._explain_slow_query, entry, command, 'queryPlanner' if timed_out else 'executionStats')
+        else:
+            entry['explain'] = {'skipped': 'another explain is already running'}
+
+    def _explain_slow_query(self, entry, command, verbosity='executionStats'):
+        try:
+            explain = self.db.command('explain', command | {'maxTimeMS': HEAVY_QUERY_MAX_TIME_MS}, verbosity=verbosity)
+            entry['explain'] = to_json_compatible(explain)
+        except Exception as e:
+            entry['explain'] = {'error': str(e)}
+        finally:
+            self.explain_slot.release()
+
+    def _check_result_size(self, collection, docs):
+        if len(docs) > MAX_RESULT_DOCUMENTS:
+            raise ResultTooLarge(f"Query on '{collection.name}' matches more than {MAX_RESULT_DOCUMENTS} documents, narrow the filters or set a smaller quantity")
+        return docs
 
     def insert_document(self, collection_name, data):
         collection = self.db[collection_name]
@@ -80,9 +387,7 @@ class MongoDBManager:
     def get_city_districts(self, collection_name, location: Location):
         collection = self.db[collection_name]
         query = {'location': location.value}
-        alldocs = collection.find(query, {'_id': 0})
-        print (alldocs)
-        return list(alldocs)
+        return self._find(collection, query, heavy=False, method='get_city_districts')
     
     def get_accidents_stats(self, collection_name, year):
         collection = self.db[collection_name]
@@ -90,57 +395,58 @@ class MongoDBManager:
         queryAllAccidents = {'fecha_hora':{'$gte':datetime.datetime(year,1,1),'$lt':datetime.datetime(year+1,1,1)}}
         queryFatalAndSevereAccidents = queryAllAccidents | {'$or': [{'gravedad_lesividad': 'Severe'}, {'gravedad_lesividad': 'Deceased'}]}
 
-        numAllAccidents = len(list(collection.find(queryAllAccidents)))
-        numFatalAccidents = len(list(collection.find(queryAllAccidents | {'gravedad_lesividad': 'Deceased'})))
-        numSevereAccidents = len(list(collection.find(queryAllAccidents | {'gravedad_lesividad': 'Severe'})))
-        numFatalAndSevereAccidents = len(list(collection.find(queryFatalAndSevereAccidents)))
-
-        numFSADriver = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_persona': 'Driver'})))
-        numFSAPassenger = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_persona': 'Passenger'})))
-        numFSAPedestrian = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_persona': 'Pedestrian'})))
-
-        numFSACoche = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Car'})))
-        numFSAVehiculoComercial = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Commercial Vehicle'})))
-        numFSAVehiculodeEmergencia = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Emergency Vehicle'})))
-        numFSAVMU = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Personal Mobility Vehicle'})))
-        numFSAOtrosA = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Others'})))
-        numFSAAutobus = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bus'})))
-        numFSADesconocido = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Unknown'})))
-        numFSAMotocicleta = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Motorcycle'})))
-        numFSABicicleta = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bicycle'})))
-        numFSASinMotor = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Non-Motorized'})))
-        numFSATren = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Train'})))
-
-        numFSAAlcance = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Alcance'})))
-        numFSAColisionFrontoLateral = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión fronto-lateral'})))
-        numFSAOtros = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Otro'})))
-        numFSASalidaDeVia = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Solo salida de la vía'})))
-        numFSAColisionFrontal = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión frontal'})))
-        numFSAChoqueObstaculo = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Choque contra obstáculo fijo'})))
-        numFSACaida = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Caída'})))
-        numFSAColisionLateral = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión lateral'})))
-        numFSAAtropelloPersona = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a persona'})))
-        numFSAColisionMultiple = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión múltiple'})))
-        numFSAVuelco = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Vuelco'})))
-        numFSAAtropelloAnimal = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a animal'})))
-
-        numFSARango0 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'Menor de 5 años'})))
-        numFSARango5 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 6 a 9 años'})))
-        numFSARango10 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 10 a 14 años'})))
-        numFSARango15 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 15 a 17 años'})))
-        numFSARango17 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 18 a 20 años'})))
-        numFSARango20 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 21 a 24 años'})))
-        numFSARango25 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 25 a 29 años'})))
-        numFSARango30 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 30 a 34 años'})))
-        numFSARango35 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 35 a 39 años'})))
-        numFSARango40 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 40 a 44 años'})))
-        numFSARango45 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 45 a 49 años'})))
-        numFSARango50 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 50 a 54 años'})))
-        numFSARango55 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 55 a 59 años'})))
-        numFSARango60 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 60 a 64 años'})))
-        numFSARango65 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 65 a 69 años'})))
-        numFSARango70 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 70 a 74 años'})))
-        numFSARango75 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'Más de 74 años'})))
+        with self.heavy_query():
+            numAllAccidents = self._count(collection, queryAllAccidents, method='get_accidents_stats')
+            numFatalAccidents = self._count(collection, queryAllAccidents | {'gravedad_lesividad': 'Deceased'}, method='get_accidents_stats')
+            numSevereAccidents = self._count(collection, queryAllAccidents | {'gravedad_lesividad': 'Severe'}, method='get_accidents_stats')
+            numFatalAndSevereAccidents = self._count(collection, queryFatalAndSevereAccidents, method='get_accidents_stats')
+
+            numFSADriver = self._count(collection, queryFatalAndSevereAccidents | {'tipo_persona': 'Driver'}, method='get_accidents_stats')
+            numFSAPassenger = self._count(collection, queryFatalAndSevereAccidents | {'tipo_persona': 'Passenger'}, method='get_accidents_stats')
+            numFSAPedestrian = self._count(collection, queryFatalAndSevereAccidents | {'tipo_persona': 'Pedestrian'}, method='get_accidents_stats')
+
+            numFSACoche = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Car'}, method='get_accidents_stats')
+            numFSAVehiculoComercial = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Commercial Vehicle'}, method='get_accidents_stats')
+            numFSAVehiculodeEmergencia = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Emergency Vehicle'}, method='get_accidents_stats')
+            numFSAVMU = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Personal Mobility Vehicle'}, method='get_accidents_stats')
+            numFSAOtrosA = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Others'}, method='get_accidents_stats')
+            numFSAAutobus = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bus'}, method='get_accidents_stats')
+            numFSADesconocido = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Unknown'}, method='get_accidents_stats')
+            numFSAMotocicleta = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Motorcycle'}, method='get_accidents_stats')
+            numFSABicicleta = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bicycle'}, method='get_accidents_stats')
+            numFSASinMotor = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Non-Motorized'}, method='get_accidents_stats')
+            numFSATren = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Train'}, method='get_accidents_stats')
+
+            numFSAAlcance = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Alcance'}, method='get_accidents_stats')
+            numFSAColisionFrontoLateral = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión fronto-lateral'}, method='get_accidents_stats')
+            numFSAOtros = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Otro'}, method='get_accidents_stats')
+            numFSASalidaDeVia = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Solo salida de la vía'}, method='get_accidents_stats')
+            numFSAColisionFrontal = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión frontal'}, method='get_accidents_stats')
+            numFSAChoqueObstaculo = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Choque contra obstáculo fijo'}, method='get_accidents_stats')
+            numFSACaida = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Caída'}, method='get_accidents_stats')
+            numFSAColisionLateral = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión lateral'}, method='get_accidents_stats')
+            numFSAAtropelloPersona = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a persona'}, method='get_accidents_stats')
+            numFSAColisionMultiple = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión múltiple'}, method='get_accidents_stats')
+            numFSAVuelco = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Vuelco'}, method='get_accidents_stats')
+            numFSAAtropelloAnimal = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a animal'}, method='get_accidents_stats')
+
+            numFSARango0 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'Menor de 5 años'}, method='get_accidents_stats')
+            numFSARango5 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 6 a 9 años'}, method='get_accidents_stats')
+            numFSARango10 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 10 a 14 años'}, method='get_accidents_stats')
+            numFSARango15 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 15 a 17 años'}, method='get_accidents_stats')
+            numFSARango17 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 18 a 20 años'}, method='get_accidents_stats')
+            numFSARango20 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 21 a 24 años'}, method='get_accidents_stats')
+            numFSARango25 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 25 a 29 años'}, method='get_accidents_stats')
+            numFSARango30 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 30 a 34 años'}, method='get_accidents_stats')
+            numFSARango35 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 35 a 39 años'}, method='get_accidents_stats')
+            numFSARango40 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 40 a 44 años'}, method='get_accidents_stats')
+            numFSARango45 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 45 a 49 años'}, method='get_accidents_stats')
+            numFSARango50 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 50 a 54 años'}, method='get_accidents_stats')
+            numFSARango55 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 55 a 59 años'}, method='get_accidents_stats')
+            numFSARango60 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 60 a 64 años'}, method='get_accidents_stats')
+            numFSARango65 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 65 a 69 años'}, method='get_accidents_stats')
+            numFSARango70 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 70 a 74 años'}, method='get_accidents_stats')
+            numFSARango75 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'Más de 74 años'}, method='get_accidents_stats')
 
         
 
@@ -206,6 +512,210 @@ class MongoDBManager:
         }
     
     
+    def get_accidents_stats_by_district(self, collection_name, districts_collection_name, location: Location, year):
+        """
+        Las estadísticas de get_accidents_stats para todos los distritos con una única agregación agrupada
+        por el distrito asignado con assign_districts.
+        """
+        districts = self.db[districts_collection_name].find_one({'location': location.value}, {'features.properties': 1}, max_time_ms=QUERY_MAX_TIME_MS)
+        if not districts:
+            return []
+
+        pipeline = [
+            {'$match': {'fecha_hora': {'$gte': datetime.datetime(year, 1, 1), '$lt': datetime.datetime(year + 1, 1, 1)}}},
+            {'$group': {'_id': '$' + DISTRICT_FIELD} | _accidents_stats_accumulators()},
+        ]
+        counts = {doc['_id']: doc for doc in self._aggregate(self.db[collection_name], pipeline, method='get_accidents_stats_by_district')}
+
+        result = []
+        for position, feature in enumerate(districts.get('features', [])):
+            properties = feature.get('properties') or {}
+            district_id = properties.get('cartodb_id', position)
+            result.append({'district_id': district_id, 'name': properties.get('name'), 'stats': _accidents_stats_from_counts(counts.get(district_id, {}))})
+        # Accidentes fuera de todos los distritos o todavía sin asignar
+        if None in counts:
+            result.append({'district_id': None, 'name': None, 'stats': _accidents_stats_from_counts(counts[None])})
+        return result
+
+    def get_accidents_stats_by_year(self, collection_name, years):
+        """
+        Las estadísticas de get_accidents_stats de varios años con una única agregación agrupada por año:
+        {año: estadísticas}. Los años sin accidentes devuelven todo a 0.
+        """
+        years = sorted(set(years))
+        if not years:
+            return {}
+        # Un rango de fechas por tramo de años consecutivos: sólo se leen los años pedidos y se usa el índice de fecha
+        runs = []
+        for year in years:
+            if runs and runs[-1][1] == year:
+                runs[-1][1] = year + 1
+            else:
+                runs.append([year, year + 1])
+        ranges = [{'fecha_hora': {'$gte': datetime.datetime(first, 1, 1), '$lt': datetime.datetime(last, 1, 1)}} for first, last in runs]
+        pipeline = [
+            {'$match': ranges[0] if len(ranges) == 1 else {'$or': ranges}},
+            {'$group': {'_id': {'$year': '$fecha_hora'}} | _accidents_stats_accumulators()},
+        ]
+        counts = {doc['_id']: doc for doc in self._aggregate(self.db[collection_name], pipeline, method='get_accidents_stats_by_year')}
+        return {year: _accidents_stats_from_counts(counts.get(year, {})) for year in years}
+
+    def get_accidents_time_series(self, collection_name, start, end, bucket: TimeBucket, severity: AccidentSeverity = None, user: UserType = None, geometry=None):
+        """
+        Número de accidentes (total, mortales y graves) por intervalo de $dateTrunc entre start (incluido)
+        y end (excluido). Sólo devuelve los intervalos con accidentes, ordenados: [{'_id': inicio, ...}].
+        Las semanas empiezan en lunes.
+        """
+        layout = ACCIDENT_LAYOUTS[collection_name]
+        dateField, severityField = layout['date'], layout['severity']
+
+        query = {dateField: {'$gte': start, '$lt': end}}
+        if severity is not None:
+            query[severityField] = {'$in': ACCIDENT_SEVERITY_VALUES[severity]}
+        if user is not None and user in layout['user_filters']:
+            field, value = layout['user_filters'][user]
+            query[field] = value
+        if geometry is not None:
+            query['geometry'] = {'$geoWithin': {'$geometry': geometry}}
+
+        pipeline = [
+            {'$match': query},
+            {'$group': {
+                '_id': {'$dateTrunc': {'date': '$' + dateField, 'unit': bucket.value, 'startOfWeek': 'monday'}},
+                'count': {'$sum': 1},
+                'fatal': {'$sum': {'$cond': [{'$eq': ['$' + severityField, 'Deceased']}, 1, 0]}},
+                'severe': {'$sum': {'$cond': [{'$eq': ['$' + severityField, 'Severe']}, 1, 0]}},
+            }},
+            {'$sort': {'_id': 1}},
+        ]
+        return self._aggregate(self.db[collection_name], pipeline, method='get_accidents_time_series')
+
+    def assign_districts(self, collection_name, districts_collection_name, location: Location, district_field=DISTRICT_FIELD, batch_size=10000, progress=None):
+        """
+        Guarda en cada documento de la colección el distrito que contiene su geometría (punto), con un
+        point-in-polygon vectorizado contra los polígonos de `locations`. Llamar tras cada carga de accidentes.
+        Recorre la colección por lotes de _id: cada lote reserva su propio hueco de consulta pesada y tiene
+        HEAVY_QUERY_MAX_TIME_MS para la lectura y la escritura, así que las peticiones HTTP no esperan a toda
+        la colección. `progress(assigned, unmatched)` se llama tras cada lote.
+        """
+        # numpy sólo se necesita aquí: no se importa al cargar la aplicación
+        from app.spatial import DistrictIndex
+
+        districts = self.db[districts_collection_name].find_one({'location': location.value}, max_time_ms=QUERY_MAX_TIME_MS)
+        if not districts:
+            return {'assigned': 0, 'unmatched': 0}
+        index = DistrictIndex(districts.get('features', []))
+        collection = self.db[collection_name]
+        assigned = unmatched = 0
+        last_id = None
+
+        while True:
+            query = {'geometry.type': 'Point'} | ({'_id': {'$gt': last_id}} if last_id is not None else {})
+            # Sin límite de cola: es un trabajo en segundo plano y cede el hueco entre lotes
+            with self.heavy_query(queue_timeout=None), pymongo.timeout(HEAVY_QUERY_MAX_TIME_MS / 1000):
+                batch = list(collection.find(query, {'_id': 1, 'geometry.coordinates': 1}).sort('_id', pymongo.ASCENDING).limit(batch_size))
+                if not batch:
+                    break
+                district_ids = index.assign([doc['geometry']['coordinates'][0] for doc in batch], [doc['geometry']['coordinates'][1] for doc in batch])
+                by_district = {}
+                for doc, district_id in zip(batch, district_ids):
+                    by_district.setdefault(district_id, []).append(doc['_id'])
+                # Una actualización por distrito y lote en lugar de una por documento
+                requests = [pymongo.UpdateMany({'_id': {'$in': doc_ids}}, {'$set': {district_field: district_id}}) for district_id, doc_ids in by_district.items()]
+                collection.bulk_write(requests, ordered=False)
+            unmatched += len(by_district.get(None, []))
+            assigned += len(batch) - len(by_district.get(None, []))
+            last_id = batch[-1]['_id']
+            if progress is not None:
+                progress(assigned, unmatched)
+            if len(batch) < batch_size:
+                break
+        collection.create_index([(district_field, pymongo.ASCENDING)])
+        return {'assigned': assigned, 'unmatched': unmatched}
+
+    def get_accident_temporal_rows(self, collection_name, area_type: AreaType, year, after_id=None):
+        """
+        (_id, fecha, gravedad, área) de cada accidente del año, sólo los de _id mayor que after_id si se
+        indica, para construir los cubos de app.temporal. Sin tope de documentos: sólo viajan tres campos.
+        """
+        layout = ACCIDENT_LAYOUTS[collection_name]
+        dateField, severityField = layout['date'], layout['severity']
+        areaField = layout.get('areas', {}).get(area_type)
+
+        query = {dateField: {'$gte': datetime.datetime(year, 1, 1), '$lt': datetime.datetime(year + 1, 1, 1)}}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+        projection = {dateField: 1, severityField: 1} | ({areaField: 1} if areaField else {})
+
+        cursor = self.db[collection_name].find(query, projection, batch_size=10000).max_time_ms(HEAVY_QUERY_MAX_TIME_MS)
+        with self.heavy_query():
+            return [
+                (doc['_id'], get_field(doc, dateField), get_field(doc, severityField), area_key(get_field(doc, areaField)) if areaField else None)
+                for doc in cursor
+            ]
+
+    def get_accident_points_within_area(self, collection_name, geometry, year, month=None, severity: AccidentSeverity = None, user: UserType = None):
+        """(lon, lat, 1) de cada accidente dentro de la geometría en el año o mes, para los rásteres de densidad."""
+        layout = ACCIDENT_LAYOUTS[collection_name]
+        fecha_inicio = datetime.datetime(year, month or 1, 1)
+        fecha_fin = datetime.datetime(year + 1, 1, 1) if month in (None, 12) else datetime.datetime(year, month + 1, 1)
+
+        query = {layout['date']: {'$gte': fecha_inicio, '$lt': fecha_fin}, 'geometry': {'$geoWithin': {'$geometry': geometry}}}
+        if severity is not None:
+            query[layout['severity']] = {'$in': ACCIDENT_SEVERITY_VALUES[severity]}
+        if user is not None and user in layout['user_filters']:
+            field, value = layout['user_filters'][user]
+            query[field] = value
+        return self._points(collection_name, query)
+
+    def get_event_points_within_area(self, collection_name, geometry, year, month=None, event_type: EventType = None):
+        """(lon, lat, event_count) de cada registro de eventos dentro de la geometría en el año o mes."""
+        fecha_inicio = datetime.datetime(year, month or 1, 1)
+        fecha_fin = datetime.datetime(year + 1, 1, 1) if month in (None, 12) else datetime.datetime(year, month + 1, 1)
+
+        query = {'properties.start_date': {'$gte': fecha_inicio, '$lt': fecha_fin}, 'geometry': {'$geoWithin': {'$geometry': geometry}}}
+        if event_type is not None:
+            query['properties.event_type'] = event_type.value
+        return self._points(collection_name, query, weight_field='properties.event_count')
+
+    def get_accident_points_in_period(self, collection_name, start, end, severity: AccidentSeverity = None, user: UserType = None):
+        """(lon, lat, gravedad) de cada accidente entre start (incluido) y end (excluido), para los hotspots a demanda."""
+        layout = ACCIDENT_LAYOUTS[collection_name]
+        query = {layout['date']: {'$gte': start, '$lt': end}, 'geometry.type': 'Point'}
+        if severity is not None:
+            query[layout['severity']] = {'$in': ACCIDENT_SEVERITY_VALUES[severity]}
+        if user is not None and user in layout['user_filters']:
+            field, value = layout['user_filters'][user]
+            query[field] = value
+        return self._points(collection_name, query, weight_field=layout['severity'])
+
+    def get_network_sites(self, collection_name):
+        """Geometría y propiedades de todos los nodos o segmentos de una red viaria, sin tope de documentos."""
+        cursor = self.db[collection_name].find({}, {'_id': 0, 'geometry': 1, 'properties': 1}, batch_size=10000).max_time_ms(HEAVY_QUERY_MAX_TIME_MS)
+        with self.heavy_query():
+            return list(cursor)
+
+    def get_demand_edges(self, collection_name):
+        """Geometría, edgeID y demanda total por tipo de cada arco con demanda de viajes, sin tope de documentos."""
+        projection = {'_id': 0, 'geometry': 1, 'properties.edgeID': 1, 'properties.total_demand': 1}
+        cursor = self.db[collection_name].find({}, projection, batch_size=10000).max_time_ms(HEAVY_QUERY_MAX_TIME_MS)
+        with self.heavy_query():
+            return list(cursor)
+
+    def _points(self, collection_name, query, weight_field=None):
+        """Coordenadas y peso de documentos puntuales. Sin tope de documentos: sólo viajan las coordenadas."""
+        projection = {'_id': 0, 'geometry.coordinates': 1} | ({weight_field: 1} if weight_field else {})
+        cursor = self.db[collection_name].find(query, projection, batch_size=10000).max_time_ms(HEAVY_QUERY_MAX_TIME_MS)
+        with self.heavy_query():
+            return [
+                (doc['geometry']['coordinates'][0], doc['geometry']['coordinates'][1], (get_field(doc, weight_field) or 0) if weight_field else 1)
+                for doc in cursor
+            ]
+
+    def count_accidents(self, collection_name, year):
+        dateField = ACCIDENT_LAYOUTS[collection_name]['date']
+        return self._count(self.db[collection_name], {dateField: {'$gte': datetime.datetime(year, 1, 1), '$lt': datetime.datetime(year + 1, 1, 1)}}, method='count_accidents')
+
     def get_accidents_stats_cadas(self, collection_name, year):
         collection = self.db[collection_name]
 
@@ -219,33 +729,34 @@ class MongoDBManager:
             ]
         }
 
-        numAllAccidents = len(list(collection.find(queryAllAccidents)))
-        numFatalAccidents = len(list(collection.find(queryAllAccidents | {'properties.injury_severity_label': 'Deceased'})))
-        numSevereAccidents = len(list(collection.find(queryAllAccidents | {'properties.injury_severity_label': 'Severe'})))
-        numFatalAndSevereAccidents = len(list(collection.find(queryFatalAndSevereAccidents)))
-
-        # person_type_label and vehicle_type_label are inside properties and many are arrays —
-        # equality queries still match array elements, but the field must be referenced under properties.
-        numFSADriver = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.person_type_label': 'Driver'})))
-        numFSAPassenger = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.person_type_label': 'Passenger'})))
-        numFSAPedestrian = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.person_type_label': 'Pedestrian'})))
-
-        numFSACoche = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Passenger car'})))
-        numFSAVehiculoComercial = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Goods Vehicle'})))
-        numFSAVehiculodeEmergencia = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Emergency Vehicle'})))
-        numFSAVMU = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Personal Mobility Vehicle'})))
-        numFSAOtrosA = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Other motor vehicle'})))
-        numFSAAutobus = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Bus or coach'})))
-        numFSADesconocido = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Unknown'})))
-        numFSAMotocicleta = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Motorcycle'})))
-        numFSABicicleta = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Pedal Cycle'})))
-        numFSASinMotor = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Pedestrian'})))
-        numFSATren = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Moped'})))
-
-        # Count both 'Clear' and 'Dry' (and some exports use 'Dry/Clear') as clear weather labels
-        numFSAClear = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.weather_label': {'$in': ['Clear', 'Dry', 'Dry/Clear']}})))
-        numFSARain = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.weather_label': 'Rain'})))
-        numFSASnow = len(list(collection.find(queryFatalAndSevereAccidents | {'properties.weather_label': 'Snow'})))
+        with self.heavy_query():
+            numAllAccidents = self._count(collection, queryAllAccidents, method='get_accidents_stats_cadas')
+            numFatalAccidents = self._count(collection, queryAllAccidents | {'properties.injury_severity_label': 'Deceased'}, method='get_accidents_stats_cadas')
+            numSevereAccidents = self._count(collection, queryAllAccidents | {'properties.injury_severity_label': 'Severe'}, method='get_accidents_stats_cadas')
+            numFatalAndSevereAccidents = self._count(collection, queryFatalAndSevereAccidents, method='get_accidents_stats_cadas')
+
+            # person_type_label and vehicle_type_label are inside properties and many are arrays —
+            # equality queries still match array elements, but the field must be referenced under properties.
+            numFSADriver = self._count(collection, queryFatalAndSevereAccidents | {'properties.person_type_label': 'Driver'}, method='get_accidents_stats_cadas')
+            numFSAPassenger = self._count(collection, queryFatalAndSevereAccidents | {'properties.person_type_label': 'Passenger'}, method='get_accidents_stats_cadas')
+            numFSAPedestrian = self._count(collection, queryFatalAndSevereAccidents | {'properties.person_type_label': 'Pedestrian'}, method='get_accidents_stats_cadas')
+
+            numFSACoche = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Passenger car'}, method='get_accidents_stats_cadas')
+            numFSAVehiculoComercial = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Goods Vehicle'}, method='get_accidents_stats_cadas')
+            numFSAVehiculodeEmergencia = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Emergency Vehicle'}, method='get_accidents_stats_cadas')
+            numFSAVMU = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Personal Mobility Vehicle'}, method='get_accidents_stats_cadas')
+            numFSAOtrosA = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Other motor vehicle'}, method='get_accidents_stats_cadas')
+            numFSAAutobus = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Bus or coach'}, method='get_accidents_stats_cadas')
+            numFSADesconocido = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Unknown'}, method='get_accidents_stats_cadas')
+            numFSAMotocicleta = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Motorcycle'}, method='get_accidents_stats_cadas')
+            numFSABicicleta = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Pedal Cycle'}, method='get_accidents_stats_cadas')
+            numFSASinMotor = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Pedestrian'}, method='get_accidents_stats_cadas')
+            numFSATren = self._count(collection, queryFatalAndSevereAccidents | {'properties.vehicle_type_label': 'Moped'}, method='get_accidents_stats_cadas')
+
+            # Count both 'Clear' and 'Dry' (and some exports use 'Dry/Clear') as clear weather labels
+            numFSAClear = self._count(collection, queryFatalAndSevereAccidents | {'properties.weather_label': {'$in': ['Clear', 'Dry', 'Dry/Clear']}}, method='get_accidents_stats_cadas')
+            numFSARain = self._count(collection, queryFatalAndSevereAccidents | {'properties.weather_label': 'Rain'}, method='get_accidents_stats_cadas')
+            numFSASnow = self._count(collection, queryFatalAndSevereAccidents | {'properties.weather_label': 'Snow'}, method='get_accidents_stats_cadas')
 
         #numFSAAlcance = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Alcance'})))
         #numFSAColisionFrontoLateral = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión fronto-lateral'})))
@@ -299,57 +810,58 @@ class MongoDBManager:
         queryAllAccidents = queryGeo | {'fecha_hora':{'$gte':datetime.datetime(year,1,1),'$lt':datetime.datetime(year+1,1,1)}}
         queryFatalAndSevereAccidents = queryAllAccidents | {'$or': [{'gravedad_lesividad': 'Severe'}, {'gravedad_lesividad': 'Deceased'}]}
 
-        numAllAccidents = len(list(collection.find(queryAllAccidents)))
-        numFatalAccidents = len(list(collection.find(queryAllAccidents | {'gravedad_lesividad': 'Deceased'})))
-        numSevereAccidents = len(list(collection.find(queryAllAccidents | {'gravedad_lesividad': 'Severe'})))
-        numFatalAndSevereAccidents = len(list(collection.find(queryFatalAndSevereAccidents)))
-
-        numFSADriver = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_persona': 'Driver'})))
-        numFSAPassenger = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_persona': 'Passenger'})))
-        numFSAPedestrian = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_persona': 'Pedestrian'})))
-
-        numFSACoche = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Car'})))
-        numFSAVehiculoComercial = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Commercial Vehicle'})))
-        numFSAVehiculodeEmergencia = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Emergency Vehicle'})))
-        numFSAVMU = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Personal Mobility Vehicle'})))
-        numFSAOtrosA = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Others'})))
-        numFSAAutobus = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bus'})))
-        numFSADesconocido = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Unknown'})))
-        numFSAMotocicleta = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Motorcycle'})))
-        numFSABicicleta = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bicycle'})))
-        numFSASinMotor = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Non-Motorized'})))
-        numFSATren = len(list(collection.find(queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Train'})))
-
-        numFSAAlcance = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Alcance'})))
-        numFSAColisionFrontoLateral = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión fronto-lateral'})))
-        numFSAOtros = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Otro'})))
-        numFSASalidaDeVia = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Solo salida de la vía'})))
-        numFSAColisionFrontal = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión frontal'})))
-        numFSAChoqueObstaculo = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Choque contra obstáculo fijo'})))
-        numFSACaida = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Caída'})))
-        numFSAColisionLateral = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión lateral'})))
-        numFSAAtropelloPersona = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a persona'})))
-        numFSAColisionMultiple = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión múltiple'})))
-        numFSAVuelco = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Vuelco'})))
-        numFSAAtropelloAnimal = len(list(collection.find(queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a animal'})))
-
-        numFSARango0 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'Menor de 5 años'})))
-        numFSARango5 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 6 a 9 años'})))
-        numFSARango10 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 10 a 14 años'})))
-        numFSARango15 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 15 a 17 años'})))
-        numFSARango17 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 18 a 20 años'})))
-        numFSARango20 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 21 a 24 años'})))
-        numFSARango25 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 25 a 29 años'})))
-        numFSARango30 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 30 a 34 años'})))
-        numFSARango35 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 35 a 39 años'})))
-        numFSARango40 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 40 a 44 años'})))
-        numFSARango45 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 45 a 49 años'})))
-        numFSARango50 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 50 a 54 años'})))
-        numFSARango55 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 55 a 59 años'})))
-        numFSARango60 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 60 a 64 años'})))
-        numFSARango65 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 65 a 69 años'})))
-        numFSARango70 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'De 70 a 74 años'})))
-        numFSARango75 = len(list(collection.find(queryFatalAndSevereAccidents | {'rango_edad': 'Más de 74 años'})))
+        with self.heavy_query():
+            numAllAccidents = self._count(collection, queryAllAccidents, method='get_accidents_stats_within_area')
+            numFatalAccidents = self._count(collection, queryAllAccidents | {'gravedad_lesividad': 'Deceased'}, method='get_accidents_stats_within_area')
+            numSevereAccidents = self._count(collection, queryAllAccidents | {'gravedad_lesividad': 'Severe'}, method='get_accidents_stats_within_area')
+            numFatalAndSevereAccidents = self._count(collection, queryFatalAndSevereAccidents, method='get_accidents_stats_within_area')
+
+            numFSADriver = self._count(collection, queryFatalAndSevereAccidents | {'tipo_persona': 'Driver'}, method='get_accidents_stats_within_area')
+            numFSAPassenger = self._count(collection, queryFatalAndSevereAccidents | {'tipo_persona': 'Passenger'}, method='get_accidents_stats_within_area')
+            numFSAPedestrian = self._count(collection, queryFatalAndSevereAccidents | {'tipo_persona': 'Pedestrian'}, method='get_accidents_stats_within_area')
+
+            numFSACoche = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Car'}, method='get_accidents_stats_within_area')
+            numFSAVehiculoComercial = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Commercial Vehicle'}, method='get_accidents_stats_within_area')
+            numFSAVehiculodeEmergencia = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Emergency Vehicle'}, method='get_accidents_stats_within_area')
+            numFSAVMU = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Personal Mobility Vehicle'}, method='get_accidents_stats_within_area')
+            numFSAOtrosA = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Others'}, method='get_accidents_stats_within_area')
+            numFSAAutobus = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bus'}, method='get_accidents_stats_within_area')
+            numFSADesconocido = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Unknown'}, method='get_accidents_stats_within_area')
+            numFSAMotocicleta = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Motorcycle'}, method='get_accidents_stats_within_area')
+            numFSABicicleta = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Bicycle'}, method='get_accidents_stats_within_area')
+            numFSASinMotor = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Non-Motorized'}, method='get_accidents_stats_within_area')
+            numFSATren = self._count(collection, queryFatalAndSevereAccidents | {'grupo_tipo_vehiculo': 'Train'}, method='get_accidents_stats_within_area')
+
+            numFSAAlcance = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Alcance'}, method='get_accidents_stats_within_area')
+            numFSAColisionFrontoLateral = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión fronto-lateral'}, method='get_accidents_stats_within_area')
+            numFSAOtros = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Otro'}, method='get_accidents_stats_within_area')
+            numFSASalidaDeVia = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Solo salida de la vía'}, method='get_accidents_stats_within_area')
+            numFSAColisionFrontal = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión frontal'}, method='get_accidents_stats_within_area')
+            numFSAChoqueObstaculo = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Choque contra obstáculo fijo'}, method='get_accidents_stats_within_area')
+            numFSACaida = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Caída'}, method='get_accidents_stats_within_area')
+            numFSAColisionLateral = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión lateral'}, method='get_accidents_stats_within_area')
+            numFSAAtropelloPersona = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a persona'}, method='get_accidents_stats_within_area')
+            numFSAColisionMultiple = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Colisión múltiple'}, method='get_accidents_stats_within_area')
+            numFSAVuelco = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Vuelco'}, method='get_accidents_stats_within_area')
+            numFSAAtropelloAnimal = self._count(collection, queryFatalAndSevereAccidents | {'tipo_accidente': 'Atropello a animal'}, method='get_accidents_stats_within_area')
+
+            numFSARango0 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'Menor de 5 años'}, method='get_accidents_stats_within_area')
+            numFSARango5 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 6 a 9 años'}, method='get_accidents_stats_within_area')
+            numFSARango10 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 10 a 14 años'}, method='get_accidents_stats_within_area')
+            numFSARango15 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 15 a 17 años'}, method='get_accidents_stats_within_area')
+            numFSARango17 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 18 a 20 años'}, method='get_accidents_stats_within_area')
+            numFSARango20 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 21 a 24 años'}, method='get_accidents_stats_within_area')
+            numFSARango25 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 25 a 29 años'}, method='get_accidents_stats_within_area')
+            numFSARango30 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 30 a 34 años'}, method='get_accidents_stats_within_area')
+            numFSARango35 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 35 a 39 años'}, method='get_accidents_stats_within_area')
+            numFSARango40 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 40 a 44 años'}, method='get_accidents_stats_within_area')
+            numFSARango45 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 45 a 49 años'}, method='get_accidents_stats_within_area')
+            numFSARango50 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 50 a 54 años'}, method='get_accidents_stats_within_area')
+            numFSARango55 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 55 a 59 años'}, method='get_accidents_stats_within_area')
+            numFSARango60 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 60 a 64 años'}, method='get_accidents_stats_within_area')
+            numFSARango65 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 65 a 69 años'}, method='get_accidents_stats_within_area')
+            numFSARango70 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'De 70 a 74 años'}, method='get_accidents_stats_within_area')
+            numFSARango75 = self._count(collection, queryFatalAndSevereAccidents | {'rango_edad': 'Más de 74 años'}, method='get_accidents_stats_within_area')
 
         
 
@@ -479,7 +991,7 @@ class MongoDBManager:
             }
         ]
 
-        result = list(collection.aggregate(aggregateTotalDemand))
+        result = self._aggregate(collection, aggregateTotalDemand, method='get_demand_stats')
 
         if result:
             return {
@@ -523,9 +1035,7 @@ class MongoDBManager:
 
         queryDate = {"properties.fecha_hora": {"$gte": fecha_inicio,"$lt": fecha_fin}}    
 
-        alldocs = collection.find(queryDate,{'_id': 0}) if quantity in (None, -1) else collection.find(queryDate,{'_id': 0}).limit(quantity)
-
-        return list(alldocs)
+        return self._find(collection, queryDate, quantity=quantity, method='get_all_accidents_locations')
     
     def get_all_cadas_accidents_locations(self, collection_name, month, year, quantity):
         collection = self.db[collection_name]
@@ -542,9 +1052,7 @@ class MongoDBManager:
 
         queryDate = {"properties.datetime": {"$gte": fecha_inicio,"$lt": fecha_fin}}    
 
-        alldocs = collection.find(queryDate,{'_id': 0}) if quantity in (None, -1) else collection.find(queryDate,{'_id': 0}).limit(quantity)
-
-        return list(alldocs)
+        return self._find(collection, queryDate, quantity=quantity, method='get_all_cadas_accidents_locations')
     
     def get_all_predictions(self, collection_name, month, year, quantity, prediction_type: PredictionType = None, user: UserType = None, model_type: ModelType = None, risk_category: RiskCategory = None, error_category: ErrorCategory = None, is_currently_hotspot: bool | None = None):
         logger.info(f"get_all_predictions called with: collection={collection_name}, month={month}, year={year}, quantity={quantity}, prediction_type={prediction_type}, user={user}, model_type={model_type}, risk_category={risk_category}, error_category={error_category}, is_currently_hotspot={is_currently_hotspot}")
@@ -646,8 +1154,7 @@ class MongoDBManager:
         if quantity not in (None, -1):
             pipeline.append({"$limit": quantity})
 
-        alldocs = collection.aggregate(pipeline)
-        result = list(alldocs)
+        result = self._aggregate(collection, pipeline, heavy=quantity in (None, -1), method='get_all_predictions')
 
         logger.info(f"Aggregation returned {len(result)} documents")
 
@@ -670,9 +1177,7 @@ class MongoDBManager:
         queryDate = {"properties.fecha_hora": {"$gte": fecha_inicio,"$lt": fecha_fin}}    
         query = queryDate | queryGeo
 
-        alldocs = collection.find(query,{'_id': 0}) if quantity in (None, -1) else collection.find(query,{'_id': 0}).limit(quantity)
-
-        return list(alldocs)
+        return self._find(collection, query, quantity=quantity, method='get_accidents_locations_within_area')
 
     def get_accidents_by_hotspot_locations(self, collection_name, year: int, location: int, location_type: GeoType):
         collection = self.db[collection_name]
@@ -682,8 +1187,7 @@ class MongoDBManager:
 
         queryAll = queryDate | queryLocation | queryType if year is not None else queryLocation | queryType
 
-        alldocs = collection.find(queryAll, {'_id': 0})
-        return list(alldocs)
+        return self._find(collection, queryAll, heavy=False, method='get_accidents_by_hotspot_locations')
     
     def get_accidents_by_hotspot_locations_for_segments(self, collection_name, year, location: str, location_type: GeoType):
         collection = self.db[collection_name]
@@ -695,8 +1199,47 @@ class MongoDBManager:
 
         queryAll = queryDate | queryLocation | queryType if year is not None else queryLocation | queryType
 
-        alldocs = collection.find(queryAll, {'_id': 0})
-        return list(alldocs)
+        return self._find(collection, queryAll, heavy=False, method='get_accidents_by_hotspot_locations_for_segments')
+
+    def get_accidents_by_hotspot_batch(self, collection_name, year, intersections, segments, counts_only=False):
+        """
+        Accidentes de varios hotspots con una sola consulta $in sobre properties.locationID, agrupados por
+        hotspot en el orden pedido (también los que no tienen accidentes). Con counts_only sólo se cuentan.
+        """
+        hotspots = {str(int(location)): (GeoType.intersection, int(location)) for location in intersections}
+        for segment in segments:
+            location = segment_location(segment)
+            hotspots.setdefault(area_key(location), (GeoType.segment, location))
+        if len(hotspots) > MAX_BATCH_HOTSPOTS:
+            raise ValueError(f"At most {MAX_BATCH_HOTSPOTS} hotspots can be requested at once")
+        if not hotspots:
+            return []
+
+        collection = self.db[collection_name]
+        query = {'properties.locationID': {'$in': [location for _, location in hotspots.values()]}}
+        if year is not None:
+            query[ACCIDENT_LAYOUTS[collection_name]['date']] = {'$gte': datetime.datetime(year, 1, 1), '$lt': datetime.datetime(year + 1, 1, 1)}
+
+        if counts_only:
+            pipeline = [{'$match': query}, {'$group': {'_id': '$properties.locationID', 'count': {'$sum': 1}}}]
+            counts = {area_key(doc['_id']): doc['count'] for doc in self._aggregate(collection, pipeline, heavy=False, method='get_accidents_by_hotspot_batch')}
+            return [{'hotspot_location': key, 'hotspot_type': hotspot_type.value, 'count': counts.get(key, 0)} for key, (hotspot_type, _) in hotspots.items()]
+
+        accidents = {}
+        for doc in self._find(collection, query, method='get_accidents_by_hotspot_batch'):
+            accidents.setdefault(area_key(get_field(doc, 'properties.locationID')), []).append(doc)
+        return [
+            {'hotspot_location': key, 'hotspot_type': hotspot_type.value, 'count': len(accidents.get(key, [])), 'accidents': accidents.get(key, [])}
+            for key, (hotspot_type, _) in hotspots.items()
+        ]
+
+    def ensure_indexes(self):
+        """Crea los índices de los que dependen las consultas por hotspot; no hace nada si ya existen."""
+        for collection_name in HOTSPOT_LOOKUP_COLLECTIONS:
+            try:
+                self.db[collection_name].create_index([('properties.locationID', pymongo.ASCENDING), ('properties.locationType', pymongo.ASCENDING)])
+            except pymongo.errors.PyMongoError as e:
+                logger.warning(f"Cannot create the hotspot index on {collection_name}: {e}")
 
     def get_conn_vehicle_stats(self, hotspots_collection_name, events_collection_name, type: GeoType): #Intersection por ahora
         hotspotsCollection = self.db[hotspots_collection_name]
@@ -814,7 +1357,7 @@ class MongoDBManager:
         ]
 
         # Ejecutar la consulta
-        results = hotspotsCollection.aggregate(pipeline)
+        results = self._aggregate(hotspotsCollection, pipeline, method='get_conn_vehicle_stats')
 
         # Inicializar una lista para almacenar el resultado final
         final_results = []
@@ -855,10 +1398,10 @@ class MongoDBManager:
         else:
             query = queryOne | queryTwo | queryThree | queryDate
 
-        alldocs = collection.find(query,{'_id': 0}) if quantity in (None, -1) else collection.find(query,{'_id': 0}).limit(quantity)
-        return list(alldocs)
+        return self._find(collection, query, quantity=quantity, method='get_all_hotspots')
     
-    def get_hotspots_within_area(self, collection_name, geometry, type: GeoType, user: UserType, severity: Severity, month: int, year: int):
+    def get_hotspots_within_area(self, collection_name, geometry, type: GeoType, user: UserType, severity: Severity, month: int, year: int, intersects: bool = False):
+        """intersects=True devuelve los documentos que tocan la geometría, con _id, para las consultas por teselas."""
         collection = self.db[collection_name]
         queryOne = {'properties.hotspotType': type.value} if type is not None else {}
         queryTwo = {'properties.info.user': user.value} if user is not None else {}
@@ -877,7 +1420,7 @@ class MongoDBManager:
 
         queryDate = {"properties.date": {"$gte": fecha_inicio,"$lt": fecha_fin}}    
 
-        queryGeo = {'geometry': {'$geoWithin': {'$geometry': geometry}}}
+        queryGeo = {'geometry': {'$geoIntersects' if intersects else '$geoWithin': {'$geometry': geometry}}}
 
         if (user is not None and severity is not None):
             queryAll = {'properties.info': {'$elemMatch': {'user': user.value, 'severity': severity.value}}}
@@ -885,8 +1428,7 @@ class MongoDBManager:
         else:
             query = queryOne | queryTwo | queryThree | queryDate | queryGeo
 
-        alldocs = collection.find(query,{'_id': 0})
-        return list(alldocs)
+        return self._find(collection, query, projection={} if intersects else None, heavy=False, method='get_hotspots_within_area')
     
     def get_all_documents(self, collection_name, quantity, accident_risk):
         collection = self.db[collection_name]
@@ -895,13 +1437,12 @@ class MongoDBManager:
 
         query = queryTwo
 
-        alldocs = collection.find(query,{'_id': 0}) if quantity in (None, -1) else collection.find(query,{'_id': 0}).limit(quantity)
-        return list(alldocs)
+        return self._find(collection, query, quantity=quantity, method='get_all_documents')
 
     def get_all_documents_travel_demand(self, collection_name, quantity):
         collection = self.db[collection_name]
-        alldocs = collection.find({}, {'_id': 0, 'properties.origin_destination': 0, 'properties.way_id': 0, 'properties.edgeID': 0}) if quantity in (None, -1) else collection.find({}, {'_id': 0, 'properties.origin_destination': 0}).limit(quantity)
-        return list(alldocs)
+        projection = {'_id': 0, 'properties.origin_destination': 0, 'properties.way_id': 0, 'properties.edgeID': 0} if quantity in (None, -1) else {'_id': 0, 'properties.origin_destination': 0}
+        return self._find(collection, {}, projection, quantity, method='get_all_documents_travel_demand')
     
     def get_all_documents_risk(self, collection_name, quantity, accident_risk):
         collection = self.db[collection_name]
@@ -910,8 +1451,7 @@ class MongoDBManager:
 
         query = queryTwo
 
-        alldocs = collection.find(query,{'_id': 0}) if quantity in (None, -1) else collection.find(query,{'_id': 0}).limit(quantity)
-        return list(alldocs)
+        return self._find(collection, query, quantity=quantity, method='get_all_documents_risk')
     
     def get_all_documents_percentile(self, collection_name, quantity, demand_type, accident_percentile):
         collection = self.db[collection_name]
@@ -920,8 +1460,7 @@ class MongoDBManager:
 
         query = queryOne | queryTwo
 
-        alldocs = collection.find(query,{'_id': 0}) if quantity in (None, -1) else collection.find(query,{'_id': 0}).limit(quantity)
-        return list(alldocs)
+        return self._find(collection, query, quantity=quantity, method='get_all_documents_percentile')
     
     def get_all_documents_by_type(self, collection_name, event_type: EventType, month, year, percentile, quantity):
         collection = self.db[collection_name]
@@ -940,12 +1479,11 @@ class MongoDBManager:
         fecha_fin = datetime.datetime(year + 1, 1, 1) if month == 12 else datetime.datetime(year, month + 1, 1)
 
         queryDate = {"properties.start_date": {"$gte": fecha_inicio,"$lt": fecha_fin}}    
-        print(fecha_inicio, fecha_fin)
+        logger.debug(f"get_all_documents_by_type date range: {fecha_inicio} to {fecha_fin}")
  
         query = query | queryTwo | queryDate
 
-        alldocs = collection.find(query,{'_id': 0}) if quantity in (None, -1) else collection.find(query,{'_id': 0}).limit(quantity)
-        return list(alldocs)
+        return self._find(collection, query, quantity=quantity, method='get_all_documents_by_type')
     
     def get_conn_vehicle_dangerous_locations(self, collection_name, month, year, percentile, quantity):
         collection = self.db[collection_name]
@@ -1037,24 +1575,23 @@ class MongoDBManager:
             pipeline.append({"$limit": quantity})
 
         # Ejecutar la consulta
-        alldocs = collection.aggregate(pipeline)
-        return list(alldocs)
+        return self._aggregate(collection, pipeline, heavy=quantity in (None, -1), method='get_conn_vehicle_dangerous_locations')
     
-    def get_documents_within_area(self, collection_name, geometry, accident_risk):
+    def get_documents_within_area(self, collection_name, geometry, accident_risk, intersects: bool = False):
+        """intersects=True devuelve los documentos que tocan la geometría, con _id, para las consultas por teselas."""
         collection = self.db[collection_name]
         #queryOne = {'properties.is_hotspot': is_hotspot} if is_hotspot is not None else {}
         queryTwo = {'properties.accident_risk': {'$gte': accident_risk}} if accident_risk is not None else {}
-        print(geometry)
-        queryGeo = {'geometry': {'$geoWithin': {'$geometry': geometry}}}
+        logger.debug(f"get_documents_within_area geometry: {geometry}")
+        queryGeo = {'geometry': {'$geoIntersects' if intersects else '$geoWithin': {'$geometry': geometry}}}
 
         query =  queryTwo | queryGeo
 
-        alldocs = collection.find(query,{'_id': 0})
-        return list(alldocs)
+        return self._find(collection, query, projection={} if intersects else None, heavy=False, method='get_documents_within_area')
 
     def find_document(self, collection_name, query):
         collection = self.db[collection_name]
-        return collection.find_one(query)
+        return collection.find_one(query, max_time_ms=QUERY_MAX_TIME_MS)
 
     def update_document(self, collection_name, query, update_data):
         collection = self.db[collection_name]
@@ -1064,7 +1601,49 @@ class MongoDBManager:
         collection = self.db[collection_name]
         collection.delete_one(query)
 
+    def get_dataset_version(self, collection_name):
+        """
+        Versión de los datos de una colección: (version, updated_at).
+        Si las cargas no han registrado versión, se deriva del número de documentos y del último _id,
+        lo que detecta inserciones y borrados pero no actualizaciones en sitio.
+        """
+        doc = self.db[DATASET_VERSIONS_COLLECTION].find_one({'_id': collection_name}, max_time_ms=QUERY_MAX_TIME_MS)
+        if doc:
+            return str(doc['version']), doc.get('updated_at')
+
+        collection = self.db[collection_name]
+        count = collection.estimated_document_count(maxTimeMS=QUERY_MAX_TIME_MS)
+        last = collection.find_one({}, {'_id': 1}, sort=[('_id', -1)], max_time_ms=QUERY_MAX_TIME_MS)
+        if last is None:
+            return f"{count}-empty", None
+        last_id = last['_id']
+        updated_at = last_id.generation_time if isinstance(last_id, ObjectId) else None
+        return f"{count}-{last_id}", updated_at
+
+    def bump_dataset_version(self, collection_name, append_only=False):
+        """
+        Marca una nueva versión de los datos de la colección; llamar al terminar cada carga por lotes.
+        append_only indica que la carga sólo insertó documentos nuevos: base_version (la última versión
+        con cambios en sitio o borrados) no cambia y los agregados en memoria pueden ampliarse.
+        """
+        doc = self.db[DATASET_VERSIONS_COLLECTION].find_one_and_update(
+            {'_id': collection_name},
+            {'$inc': {'version': 1}, '$set': {'updated_at': datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if not append_only:
+            self.db[DATASET_VERSIONS_COLLECTION].update_one({'_id': collection_name}, {'$set': {'base_version': doc['version']}})
+        clear_recent_dates(collection_name)
+        return str(doc['version']), doc['updated_at']
+
+    def get_dataset_base_version(self, collection_name):
+        """Última versión registrada que no fue sólo de inserciones, o None si no hay versiones registradas."""
+        doc = self.db[DATASET_VERSIONS_COLLECTION].find_one({'_id': collection_name}, {'base_version': 1}, max_time_ms=QUERY_MAX_TIME_MS)
+        return doc.get('base_version') if doc else None
+
     def close_connection(self):
+        self.explain_executor.shutdown(wait=False)
         self.client.close()
 
 # Función para obtener el primer y último día del mes de una fecha dada
@@ -1073,12 +1652,38 @@ def get_month_range(date):
     last_day = datetime.datetime(date.year, date.month, calendar.monthrange(date.year, date.month)[1], 23, 59, 59)
     return first_day, last_day
 
+_recent_dates = {}
+_recent_dates_lock = threading.Lock()
+
+def _memoize_recent_date(function):
+    """Recuerda durante RECENT_DATE_CACHE_TTL_SECONDS el resultado por colección y argumentos."""
+    @functools.wraps(function)
+    def wrapper(collection, *args, **kwargs):
+        key = (function.__name__, collection.database.name, collection.name, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with _recent_dates_lock:
+            entry = _recent_dates.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        result = function(collection, *args, **kwargs)
+        with _recent_dates_lock:
+            _recent_dates[key] = (result, now + RECENT_DATE_CACHE_TTL_SECONDS)
+        return result
+    return wrapper
+
+def clear_recent_dates(collection_name=None):
+    with _recent_dates_lock:
+        for key in [key for key in _recent_dates if collection_name is None or key[2] == collection_name]:
+            del _recent_dates[key]
+
+@_memoize_recent_date
 def obtener_mes_mas_reciente(collection, year, date_field="properties.date"):
     """Obtiene el mes más reciente disponible para un año dado en la colección, basado en un campo de fecha específico."""
     doc = collection.find_one(
         {date_field: {"$gte": datetime.datetime(year, 1, 1), "$lt": datetime.datetime(year + 1, 1, 1)}},
         sort=[(date_field, -1)],  # Ordena por fecha descendente
-        projection={date_field: 1, "_id": 0}
+        projection={date_field: 1, "_id": 0},
+        max_time_ms=QUERY_MAX_TIME_MS
     )
     # Descomponer el campo en niveles si es un campo anidado
     keys = date_field.split(".")
@@ -1092,12 +1697,14 @@ def obtener_mes_mas_reciente(collection, year, date_field="properties.date"):
         return fecha.month
     return None  # Si no hay documentos o la fecha no es válida
 
+@_memoize_recent_date
 def obtener_fecha_mas_reciente(collection, date_field="properties.date"):
     """Obtiene el año y mes más reciente disponible en la colección basado en un campo de fecha específico."""
     doc = collection.find_one(
         {}, 
         sort=[(date_field, -1)],  # Ordena por fecha descendente
-        projection={date_field: 1, "_id": 0}
+        projection={date_field: 1, "_id": 0},
+        max_time_ms=QUERY_MAX_TIME_MS
     )
     # Descomponer el campo en niveles si es un campo anidado
     keys = date_field.split(".")
@@ -1112,8 +1719,9 @@ def obtener_fecha_mas_reciente(collection, date_field="properties.date"):
     return None, None  # Si no hay documentos o la fecha no es válida
 
 # Obtiene el mes más reciente disponible para un año dado en la colección, cuando el campo está dentro de un array
+@_memoize_recent_date
 def obtener_mes_mas_reciente_array(collection, year, array_field="properties.predictions", date_field="prediction.start_period"):
-    docs = collection.find({}, {array_field: 1, "_id": 0})
+    docs = collection.find({}, {array_field: 1, "_id": 0}, max_time_ms=HEAVY_QUERY_MAX_TIME_MS)
     meses = []
     
     for doc in docs:
@@ -1144,8 +1752,9 @@ def obtener_mes_mas_reciente_array(collection, year, array_field="properties.pre
     return max(meses) if meses else None
 
 # Obtiene el año y mes más reciente disponible en la colección cuando el campo está dentro de un array
+@_memoize_recent_date
 def obtener_fecha_mas_reciente_array(collection, array_field="properties.predictions", date_field="prediction.start_period"):
-    docs = collection.find({}, {array_field: 1, "_id": 0})
+    docs = collection.find({}, {array_field: 1, "_id": 0}, max_time_ms=HEAVY_QUERY_MAX_TIME_MS)
     fechas = []
     
     for doc in docs:
@@ -0,0 +1,147 @@
+from collections import Counter
+import os
+import sys
+import threading
+import time
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("SOTERIA_PROFILE_SAMPLE_INTERVAL", 0.001))
+
+# Categorías en las que se reparte el tiempo de cada muestra, según el frame más interno reconocido
+CATEGORIES = ("mongo_io", "bson_decoding", "serialization", "python")
+
+def _frame_category(filename):
+    path = filename.replace("\\", "/")
+    if "/bson/" in path or path.endswith("pymongo/message.py"):
+        return "bson_decoding"
+    if "/pymongo/" in path or path.endswith(("/socket.py", "/ssl.py", "/selectors.py")):
+        return "mongo_io"
+    if path.endswith(("fastapi/encoders.py", "starlette/responses.py", "/json/encoder.py", "/json/__init__.py")) or "/pydantic/" in path:
+        return "serialization"
+    return None
+
+def _frame_label(frame):
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/")
+    for marker in ("/site-packages/", "/app/", "/lib/python"):
+        if marker in path:
+            path = path.split(marker, 1)[1]
+            break
+    return f"{code.co_name} ({path}:{frame.f_lineno})"
+
+class RequestProfiler:
+    """Samples the stacks of the threads serving one request and aggregates them as folded stacks.
+
+    The event loop thread is sampled while it runs FastAPI code (routing, dependencies and
+    jsonable_encoder); worker threads only when they are running the request's endpoint.
+    Concurrent requests to the same endpoint on the same worker may contribute samples.
+    """
+
+    def __init__(self, scope, loop_thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.scope = scope
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        own_thread_id = threading.get_ident()
+        while not self._stop.is_set():
+            endpoint = self.scope.get("endpoint")
+            endpoint_code = getattr(endpoint, "__code__", None)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread_id:
+                    self._sample(thread_id, frame, endpoint_code)
+            time.sleep(self.interval)
+
+    def _sample(self, thread_id, frame, endpoint_code):
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+
+        if thread_id == self.loop_thread_id:
+            if not any("/fastapi/" in f.f_code.co_filename for f in frames):
+                return
+            thread_name = "event-loop"
+        elif endpoint_code is not None and any(f.f_code is endpoint_code for f in frames):
+            thread_name = "worker"
+        else:
+            return
+
+        category = next((c for c in (_frame_category(f.f_code.co_filename) for f in frames) if c), "python")
+        self.categories[category] += 1
+        self.stacks[";".join([thread_name] + [_frame_label(f) for f in reversed(frames)])] += 1
+
+    def folded(self):
+        """Stacks in the folded format understood by flamegraph.pl, speedscope and inferno."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def breakdown(self):
+        total = sum(self.categories.values()) or 1
+        return ",".join(f"{category}={self.categories[category] / total:.3f}" for category in CATEGORIES)
+
+class ProfilingMiddleware:
+    """Returns a sampled profile instead of the response when an administrator sends `X-Profile: 1`.
+
+    `authorize` receives the bearer token and returns whether it belongs to an administrator.
+    Requests without the header only pay for one header lookup.
+    """
+
+    def __init__(self, app, authorize):
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) != b"1":
+            await self.app(scope, receive, send)
+            return
+
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not await self.authorize(token):
+            await self._send_text(send, 403, b"Profiling requires an administrator token\n", [])
+            return
+
+        status_code = 500
+
+        async def capture_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profiler = RequestProfiler(scope, threading.get_ident())
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            profiler.stop()
+
+        extra_headers = [
+            (b"x-profile-status", str(status_code).encode()),
+            (b"x-profile-duration-ms", f"{profiler.duration * 1000:.1f}".encode()),
+            (b"x-profile-samples", str(sum(profiler.stacks.values())).encode()),
+            (b"x-profile-breakdown", profiler.breakdown().encode()),
+        ]
+        await self._send_text(send, 200, profiler.folded().encode(), extra_headers)
+
+    async def _send_text(self, send, status_code, body, extra_headers):
+        headers = [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())] + extra_headers
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,72 @@
+import numpy as np
+
+# Asignación vectorizada de puntos a polígonos (distritos), con las cajas de cada polígono como índice
+
+def points_in_ring(lon, lat, ring):
+    """Ray casting over all points at once, one pass per ring edge. `ring` is an (n, 2) closed ring."""
+    inside = np.zeros(len(lon), dtype=bool)
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(len(x1)):
+            crosses = (y1[i] > lat) != (y2[i] > lat)
+            x_at_lat = (x2[i] - x1[i]) * (lat - y1[i]) / (y2[i] - y1[i]) + x1[i]
+            inside ^= crosses & (lon < x_at_lat)
+    return inside
+
+def _polygons(geometry):
+    """GeoJSON Polygon or MultiPolygon as a list of rings lists, the first ring of each being the shell."""
+    match geometry.get("type"):
+        case "Polygon":
+            polygons = [geometry["coordinates"]]
+        case "MultiPolygon":
+            polygons = geometry["coordinates"]
+        case _:
+            return []
+    return [[np.asarray(ring, dtype=float)[:, :2] for ring in polygon] for polygon in polygons if polygon]
+
+class DistrictIndex:
+    """
+    District polygons from a GeoJSON FeatureCollection (the `locations` documents), ready to assign
+    many points at once. Districts are identified by `properties.cartodb_id`, or by their position
+    when the feature has no id.
+    """
+
+    def __init__(self, features):
+        self.districts = []
+        for position, feature in enumerate(features):
+            properties = feature.get("properties") or {}
+            polygons = _polygons(feature.get("geometry") or {})
+            if not polygons:
+                continue
+            shells = np.concatenate([polygon[0] for polygon in polygons])
+            self.districts.append({
+                "id": properties.get("cartodb_id", position),
+                "name": properties.get("name"),
+                "bbox": (*shells.min(axis=0), *shells.max(axis=0)),
+                "polygons": polygons,
+            })
+
+    def assign(self, lon, lat):
+        """District id of each point, or None for points outside every district."""
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        result = np.full(len(lon), None, dtype=object)
+        pending = np.ones(len(lon), dtype=bool)
+        for district in self.districts:
+            west, south, east, north = district["bbox"]
+            candidates = np.flatnonzero(pending & (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north))
+            if len(candidates) == 0:
+                continue
+            inside = np.zeros(len(candidates), dtype=bool)
+            for shell, *holes in district["polygons"]:
+                in_polygon = points_in_ring(lon[candidates], lat[candidates], shell)
+                for hole in holes:
+                    in_polygon &= ~points_in_ring(lon[candidates], lat[candidates], hole)
+                inside |= in_polygon
+            result[candidates[inside]] = district["id"]
+            pending[candidates[inside]] = False
+        return result
+
+    def names(self):
+        return {district["id"]: district["name"] for district in self.districts}
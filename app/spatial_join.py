@@ -0,0 +1,203 @@
+import math
+import os
+
+import numpy as np
+
+from app.caching import TTLCache
+
+# Unión espacial en memoria de accidentes con la geometría de los segmentos (o de cualquier colección
+# de LineStrings): índice de rejilla sobre los tramos entre vértices y proyección de cada punto
+SNAP_MAX_DISTANCE_METERS = float(os.environ.get("SOTERIA_SNAP_MAX_DISTANCE_METERS", 30))
+LINE_INDEX_CACHE_SIZE = int(os.environ.get("SOTERIA_LINE_INDEX_CACHE_SIZE", 8))
+LINE_INDEX_TTL_SECONDS = float(os.environ.get("SOTERIA_LINE_INDEX_TTL_SECONDS", 24 * 3600))
+
+EARTH_RADIUS_METERS = 6371008.8
+KILLED_OR_SEVERE = ("Deceased", "Severe")
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+def to_meters(lon, lat, origin_lat):
+    """Equirectangular projection around `origin_lat`: accurate to well under 1% within a city."""
+    scale = math.radians(1) * EARTH_RADIUS_METERS
+    return np.asarray(lon, dtype=float) * scale * math.cos(math.radians(origin_lat)), np.asarray(lat, dtype=float) * scale
+
+def index_cell_size(max_distance):
+    """
+    Cell size of the LineIndex that serves `max_distance`: SNAP_MAX_DISTANCE_METERS, doubled until it
+    covers the distance. Small distances reuse the default index and only a few sizes are ever built.
+    """
+    cell_size = SNAP_MAX_DISTANCE_METERS
+    while max_distance is not None and cell_size < max_distance:
+        cell_size *= 2
+    return cell_size
+
+def cell_keys(cell_x, cell_y):
+    """One int64 key per grid cell, so cells can be sorted and searched as a single array."""
+    return (np.asarray(cell_x, dtype=np.int64) << 32) + (np.asarray(cell_y, dtype=np.int64) + (1 << 31))
+
+def expand_ranges(starts, ends):
+    """
+    For ranges [starts[i], ends[i]), the owner i and the position of every element, without Python
+    loops: ([0, 0, 1], [4, 5, 9]) for the ranges [4, 6) and [9, 10).
+    """
+    lengths = np.maximum(ends - starts, 0)
+    total = int(lengths.sum())
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owners, np.repeat(starts, lengths) + within
+
+class LineIndex:
+    """
+    The LineStrings of a collection split into straight pieces between consecutive vertices, in meters,
+    and registered in every `cell_size` grid cell their bounding box touches. A piece within `cell_size`
+    of a point always has a cell among the nine around the point's cell.
+    """
+
+    def __init__(self, documents, cell_size=SNAP_MAX_DISTANCE_METERS):
+        self.cell_size = cell_size
+        self.documents, lines = [], []
+        for doc in documents:
+            coordinates = np.asarray((doc.get("geometry") or {}).get("coordinates") or [], dtype=float)
+            if coordinates.ndim != 2 or len(coordinates) < 2:
+                continue
+            self.documents.append(doc)
+            lines.append(coordinates[:, :2])
+        if not lines:
+            self.origin_lat = 0.0
+            self.lengths = np.zeros(0)
+            self.ax = self.ay = self.bx = self.by = np.zeros(0)
+            self.owner, self.cell_pieces, self.sorted_keys = (np.zeros(0, dtype=np.int64),) * 3
+            return
+
+        vertices = np.concatenate(lines)
+        self.origin_lat = float(vertices[:, 1].mean())
+        x, y = to_meters(vertices[:, 0], vertices[:, 1], self.origin_lat)
+        sizes = np.array([len(line) for line in lines])
+        # Un tramo por par de vértices consecutivos de la misma línea
+        last = np.cumsum(sizes) - 1
+        starts = np.setdiff1d(np.arange(len(vertices) - 1), last[:-1])
+        self.owner = np.repeat(np.arange(len(lines)), sizes - 1)
+        self.ax, self.ay, self.bx, self.by = x[starts], y[starts], x[starts + 1], y[starts + 1]
+        self.lengths = np.bincount(self.owner, weights=np.hypot(self.bx - self.ax, self.by - self.ay), minlength=len(lines))
+
+        cell = lambda values: np.floor(values / cell_size).astype(np.int64)
+        min_cx, max_cx = cell(np.minimum(self.ax, self.bx)), cell(np.maximum(self.ax, self.bx))
+        min_cy, max_cy = cell(np.minimum(self.ay, self.by)), cell(np.maximum(self.ay, self.by))
+        rows = max_cy - min_cy + 1
+        pieces, local = expand_ranges(np.zeros(len(rows), dtype=np.int64), (max_cx - min_cx + 1) * rows)
+        keys = cell_keys(min_cx[pieces] + local // rows[pieces], min_cy[pieces] + local % rows[pieces])
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys, self.cell_pieces = keys[order], pieces[order]
+
+    def snap(self, lon, lat, max_distance=None):
+        """
+        Index of the nearest line within `max_distance` meters (at most the cell size) of each point, or
+        -1, and the distance to it.
+        """
+        max_distance = min(max_distance or self.cell_size, self.cell_size)
+        px, py = to_meters(lon, lat, self.origin_lat)
+        nearest, distance = np.full(len(px), -1, dtype=np.int64), np.full(len(px), np.inf)
+        if len(px) == 0 or len(self.sorted_keys) == 0:
+            return nearest, distance
+
+        # Puntos ordenados por celda: las búsquedas en el índice recorren la memoria en orden
+        cx, cy = np.floor(px / self.cell_size).astype(np.int64), np.floor(py / self.cell_size).astype(np.int64)
+        by_cell = np.argsort(cell_keys(cx, cy), kind="stable")
+        px, py, cx, cy = px[by_cell], py[by_cell], cx[by_cell], cy[by_cell]
+        best_line, best_distance = np.full(len(px), -1, dtype=np.int64), np.full(len(px), np.inf)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = cell_keys(cx + dx, cy + dy)
+                points, positions = expand_ranges(np.searchsorted(self.sorted_keys, keys, side="left"), np.searchsorted(self.sorted_keys, keys, side="right"))
+                if len(points) == 0:
+                    continue
+                pieces = self.cell_pieces[positions]
+
+                # Proyección de cada punto sobre cada tramo candidato, acotada a sus extremos
+                ax, ay = self.ax[pieces], self.ay[pieces]
+                vx, vy = self.bx[pieces] - ax, self.by[pieces] - ay
+                squared = vx * vx + vy * vy
+                t = np.clip(np.divide((px[points] - ax) * vx + (py[points] - ay) * vy, squared, out=np.zeros_like(squared), where=squared > 0), 0, 1)
+                d = np.hypot(ax + t * vx - px[points], ay + t * vy - py[points])
+
+                # Los pares salen agrupados por punto: mínimo de cada grupo sin ordenar
+                group_starts = np.flatnonzero(np.r_[True, points[1:] != points[:-1]])
+                group_points = points[group_starts]
+                minimum = np.minimum.reduceat(d, group_starts)
+                is_minimum = np.flatnonzero(d == np.repeat(minimum, np.diff(np.r_[group_starts, len(d)])))
+                first = is_minimum[np.r_[True, points[is_minimum][1:] != points[is_minimum][:-1]]]
+                better = minimum < best_distance[group_points]
+                best_distance[group_points[better]] = minimum[better]
+                best_line[group_points[better]] = self.owner[pieces[first[better]]]
+
+        close = best_distance <= max_distance
+        nearest[by_cell[close]] = best_line[close]
+        distance[by_cell[close]] = best_distance[close]
+        return nearest, distance
+
+def line_accident_counts(index, points, max_distance):
+    """Accidents and killed or severe accidents per line of `index` for (lon, lat, severity) points, and how many matched no line."""
+    n = len(index.documents)
+    if not points:
+        return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64), 0
+    lon, lat, severities = zip(*points)
+    nearest, _ = index.snap(lon, lat, max_distance)
+    matched = nearest >= 0
+    severe = np.isin(np.asarray(severities, dtype=object), KILLED_OR_SEVERE)
+    return np.bincount(nearest[matched], minlength=n), np.bincount(nearest[matched & severe], minlength=n), int((~matched).sum())
+
+class SegmentAccidentJoin:
+    """
+    Accident counts per road segment for any period and filters, joining the accident points with the
+    segment geometry in memory. The LineIndex is built once per collection and dataset version, with
+    a cell size from index_cell_size; the snapping distance is only the cutoff.
+    """
+
+    def __init__(self, dataset_versions, maxsize=LINE_INDEX_CACHE_SIZE, ttl=LINE_INDEX_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.indexes = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def line_index(self, collection_name, max_distance=SNAP_MAX_DISTANCE_METERS):
+        cell_size = index_cell_size(max_distance)
+        key = (collection_name, cell_size, self.dataset_versions.key(collection_name))
+        index = self.indexes.get(key)
+        if index is None:
+            index = LineIndex(self.dataset_versions.db_manager.get_network_sites(collection_name), cell_size)
+            self.indexes.set(key, index)
+        return index
+
+    def accident_counts(self, accidents_collection_name, lines_collection_name, start, end, severity=None, user=None, max_distance=SNAP_MAX_DISTANCE_METERS):
+        """(LineIndex, accidents per line, killed or severe per line, accidents not snapped to any line)."""
+        index = self.line_index(lines_collection_name, max_distance)
+        points = self.dataset_versions.db_manager.get_accident_points_in_period(accidents_collection_name, start, end, severity, user)
+        counts, severe_counts, unmatched = line_accident_counts(index, points, max_distance)
+        return index, counts, severe_counts, unmatched
+
+    def segment_counts(self, accidents_collection_name, segments_collection_name, start, end, severity=None, user=None, max_distance=SNAP_MAX_DISTANCE_METERS, quantity=None):
+        """
+        Segments with accidents in [start, end), most accidents first, with their counts and the rate per
+        km and year, plus how many accidents were matched and left unmatched.
+        """
+        index, counts, severe_counts, unmatched = self.accident_counts(accidents_collection_name, segments_collection_name, start, end, severity, user, max_distance)
+        years = (end - start).total_seconds() / SECONDS_PER_YEAR
+        selected = np.flatnonzero(counts)
+        selected = selected[np.argsort(-counts[selected], kind="stable")]
+        if quantity not in (None, -1, 0):
+            selected = selected[:quantity]
+
+        segments = []
+        for i in selected.tolist():
+            properties = index.documents[i].get("properties") or {}
+            length = float(index.lengths[i])
+            segments.append({key: properties.get(key) for key in ("segmentID", "u", "v", "key")} | {
+                "accidents": int(counts[i]),
+                "fatal_and_severe": int(severe_counts[i]),
+                "length_m": round(length, 1),
+                "accidents_per_km_year": float(counts[i]) / (length / 1000) / years if length > 0 and years > 0 else None,
+            })
+        return {
+            "start": start,
+            "end": end,
+            "matched": int(counts.sum()),
+            "unmatched": unmatched,
+            "segments": segments,
+        }
@@ -0,0 +1,137 @@
+import os
+import threading
+
+import numpy as np
+
+from app.caching import TTLCache
+from app.mongo import ACCIDENT_SEVERITY_VALUES
+
+# Cubos área × día de la semana × hora × gravedad, por colección, tipo de área y año
+TEMPORAL_CUBE_CACHE_SIZE = int(os.environ.get("SOTERIA_TEMPORAL_CUBE_CACHE_SIZE", 32))
+TEMPORAL_CUBE_TTL_SECONDS = float(os.environ.get("SOTERIA_TEMPORAL_CUBE_TTL_SECONDS", 7 * 24 * 3600))
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SEVERITIES = ["Deceased", "Severe", "Slight"]
+# Último índice del eje de gravedad: valores desconocidos o sin gravedad
+OTHER_SEVERITY = len(SEVERITIES)
+SEVERITY_INDEX = {severity: index for index, severity in enumerate(SEVERITIES)}
+
+class TemporalCube:
+    """
+    Dense int32 counts of shape (area, day of week, hour, severity), plus the city-wide totals. Areas
+    are added as they appear in the data; documents without an area only count towards the totals.
+    `watermark` is the largest _id added, so later loads can be appended without a full rebuild.
+    """
+
+    def __init__(self, version=None, base_version=None):
+        self.version = version
+        self.base_version = base_version
+        self.area_index = {}
+        self.counts = np.zeros((0, 7, 24, OTHER_SEVERITY + 1), dtype=np.int32)
+        self.totals = np.zeros((7, 24, OTHER_SEVERITY + 1), dtype=np.int32)
+        self.documents = 0
+        self.watermark = None
+
+    def _area_positions(self, areas):
+        for area in areas:
+            if area is not None and area not in self.area_index:
+                self.area_index[area] = len(self.area_index)
+        if len(self.area_index) > len(self.counts):
+            # Crece al doble para que añadir áreas de una en una siga siendo barato
+            grown = np.zeros((max(len(self.area_index), 2 * len(self.counts)), *self.counts.shape[1:]), dtype=np.int32)
+            grown[:len(self.counts)] = self.counts
+            self.counts = grown
+        return np.array([self.area_index.get(area, -1) for area in areas], dtype=np.int64)
+
+    def add(self, rows):
+        """Adds (_id, datetime, severity, area) rows as returned by MongoDBManager.get_accident_temporal_rows."""
+        rows = [row for row in rows if row[1] is not None]
+        if not rows:
+            return
+        days = np.array([moment.weekday() for _, moment, _, _ in rows], dtype=np.int64)
+        hours = np.array([moment.hour for _, moment, _, _ in rows], dtype=np.int64)
+        severities = np.array([SEVERITY_INDEX.get(severity, OTHER_SEVERITY) for _, _, severity, _ in rows], dtype=np.int64)
+        areas = self._area_positions([area for _, _, _, area in rows])
+
+        np.add.at(self.totals, (days, hours, severities), 1)
+        with_area = areas >= 0
+        np.add.at(self.counts, (areas[with_area], days[with_area], hours[with_area], severities[with_area]), 1)
+        self.documents += len(rows)
+        newest = max(row[0] for row in rows)
+        self.watermark = newest if self.watermark is None else max(self.watermark, newest)
+
+    def slice(self, area=None, severities=None):
+        """7×24 counts for one area (or the whole city when None); an unknown area has no accidents."""
+        if area is None:
+            grid = self.totals
+        elif area in self.area_index:
+            grid = self.counts[self.area_index[area]]
+        else:
+            return np.zeros((7, 24), dtype=np.int64)
+        return grid[:, :, severities].sum(axis=2) if severities is not None else grid.sum(axis=2)
+
+class TemporalCubes:
+    """
+    One TemporalCube per (collection, area type, year), built on first use and kept until the
+    collection's dataset version changes. If every version since the cube was built was bumped as
+    append_only, only the documents with a newer _id are fetched and added; otherwise, or when the
+    year's document count shows documents inserted out of order, the cube is rebuilt. Any slice is
+    then a fixed-size sum over the last axis.
+    """
+
+    def __init__(self, dataset_versions, maxsize=TEMPORAL_CUBE_CACHE_SIZE, ttl=TEMPORAL_CUBE_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.cubes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def cube(self, collection_name, area_type, year):
+        key = (collection_name, area_type, year)
+        version = self.dataset_versions.key(collection_name)
+        cube = self.cubes.get(key)
+        if cube is not None and cube.version == version:
+            return cube
+
+        with self._locks_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            cube = self.cubes.get(key)
+            if cube is not None and cube.version == version:
+                return cube
+            db_manager = self.dataset_versions.db_manager
+            base_version = db_manager.get_dataset_base_version(collection_name)
+            # Sólo se amplía si todas las versiones posteriores al cubo fueron cargas de sólo inserciones
+            if cube is not None and base_version is not None and cube.base_version == base_version:
+                rows = db_manager.get_accident_temporal_rows(collection_name, area_type, year, after_id=cube.watermark)
+                if cube.documents + len(rows) == db_manager.count_accidents(collection_name, year):
+                    # Copia: las peticiones en curso siguen leyendo el cubo anterior
+                    updated = TemporalCube(version, base_version)
+                    updated.area_index = dict(cube.area_index)
+                    updated.counts, updated.totals = cube.counts.copy(), cube.totals.copy()
+                    updated.documents, updated.watermark = cube.documents, cube.watermark
+                    updated.add(rows)
+                    self.cubes.set(key, updated)
+                    return updated
+            cube = TemporalCube(version, base_version)
+            cube.add(db_manager.get_accident_temporal_rows(collection_name, area_type, year))
+            self.cubes.set(key, cube)
+            return cube
+
+    def invalidate(self, collection_name):
+        """Drops the cubes of a collection whose existing documents changed area, e.g. after assign_districts."""
+        for key in [key for key in self.cubes.keys() if key[0] == collection_name]:
+            self.cubes.invalidate(key)
+
+    def heatmap(self, collection_name, area_type, year, area=None, severity=None):
+        cube = self.cube(collection_name, area_type, year)
+        severities = [SEVERITY_INDEX[value] for value in ACCIDENT_SEVERITY_VALUES[severity]] if severity is not None else None
+        grid = cube.slice(area, severities)
+        return {
+            "area_type": area_type.value,
+            "area": area,
+            "year": year,
+            "days": DAYS,
+            "hours": list(range(24)),
+            "counts": grid.tolist(),
+            "total": int(grid.sum()),
+        }
@@ -0,0 +1,150 @@
+import math
+import os
+import time
+
+import bson
+
+from app.caching import ByteLRUCache
+
+# Consultas de viewport descompuestas en teselas "slippy map" (esquema XYZ de OpenStreetMap)
+TILE_MIN_ZOOM = int(os.environ.get("SOTERIA_TILE_MIN_ZOOM", 10))
+TILE_MAX_ZOOM = int(os.environ.get("SOTERIA_TILE_MAX_ZOOM", 16))
+MAX_VIEWPORT_TILES = int(os.environ.get("SOTERIA_MAX_VIEWPORT_TILES", 16))
+TILE_CACHE_MAX_BYTES = int(os.environ.get("SOTERIA_TILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+TILE_CACHE_TTL_SECONDS = float(os.environ.get("SOTERIA_TILE_CACHE_TTL_SECONDS", 3600))
+# Rásteres de densidad: por debajo de este zoom una tesela abarca demasiado para un polígono geodésico
+DENSITY_MIN_ZOOM = int(os.environ.get("SOTERIA_DENSITY_MIN_ZOOM", 4))
+DENSITY_MAX_ZOOM = int(os.environ.get("SOTERIA_DENSITY_MAX_ZOOM", 22))
+
+MAX_LATITUDE = 85.05112878
+
+def lon_to_tile_x(lon, zoom):
+    n = 2 ** zoom
+    return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+def lat_to_tile_y(lat, zoom):
+    n = 2 ** zoom
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    return min(n - 1, max(0, int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)))
+
+def tile_row_latitude(zoom, row):
+    """Latitude of a (possibly fractional) tile row, clamped to the Web Mercator limits."""
+    row = min(2 ** zoom, max(0, row))
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / 2 ** zoom))))
+
+def tile_bounds(zoom, x, y):
+    """(west, south, east, north) of a tile, in degrees."""
+    n = 2 ** zoom
+    return x / n * 360.0 - 180.0, tile_row_latitude(zoom, y + 1), (x + 1) / n * 360.0 - 180.0, tile_row_latitude(zoom, y)
+
+def bbox_polygon(west, south, east, north):
+    return {
+        "type": "Polygon",
+        "coordinates": [[[west, south], [west, north], [east, north], [east, south], [west, south]]]
+    }
+
+def geodesic_edge_latitude(lat, width):
+    """
+    Latitude of a great circle edge, `width` degrees of longitude wide, whose midpoint reaches `lat`.
+    MongoDB draws polygon edges as great circles, which bow towards the pole: an edge of a bbox on its
+    equator side must be drawn at this latitude so it does not cut into the bbox.
+    """
+    half_width = math.radians(min(width, 180.0) / 2)
+    return math.degrees(math.atan(math.cos(half_width) * math.tan(math.radians(lat))))
+
+def padded_bbox_polygon(west, south, east, north):
+    """
+    bbox_polygon whose geodesic edges contain the whole planar bbox, clamped to [-180, 180] ×
+    [-MAX_LATITUDE, MAX_LATITUDE]. It may include documents just outside the bbox; the caller
+    filters them in planar coordinates.
+    """
+    west, east = max(-180.0, west), min(180.0, east)
+    south, north = max(-MAX_LATITUDE, south), min(MAX_LATITUDE, north)
+    if south > 0:
+        south = geodesic_edge_latitude(south, east - west)
+    if north < 0:
+        north = geodesic_edge_latitude(north, east - west)
+    return bbox_polygon(west, south, east, north)
+
+def tiles_for_bbox(bbox, zoom):
+    west, south, east, north = bbox
+    x_range = range(lon_to_tile_x(west, zoom), lon_to_tile_x(east, zoom) + 1)
+    y_range = range(lat_to_tile_y(north, zoom), lat_to_tile_y(south, zoom) + 1)
+    return [(x, y) for y in y_range for x in x_range]
+
+def choose_zoom(bbox, max_tiles=MAX_VIEWPORT_TILES, min_zoom=TILE_MIN_ZOOM, max_zoom=TILE_MAX_ZOOM):
+    """Deepest zoom at which the bbox is covered by at most `max_tiles` tiles, or None if it would be shallower than `min_zoom`."""
+    west, south, east, north = bbox
+    if not (west < east and south < north):
+        return None
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        columns = lon_to_tile_x(east, zoom) - lon_to_tile_x(west, zoom) + 1
+        rows = lat_to_tile_y(south, zoom) - lat_to_tile_y(north, zoom) + 1
+        if columns * rows <= max_tiles:
+            return zoom
+    return None
+
+def _coordinates_within(coordinates, bbox):
+    west, south, east, north = bbox
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return west <= coordinates[0] <= east and south <= coordinates[1] <= north
+    return all(_coordinates_within(item, bbox) for item in coordinates)
+
+def geometry_within_bbox(geometry, bbox):
+    """
+    Whether every vertex of a GeoJSON geometry lies inside the bbox. The bbox is convex, so this is
+    the planar equivalent of $geoWithin for points, lines and polygons.
+    """
+    if geometry is None:
+        return False
+    if geometry.get("type") == "GeometryCollection":
+        return all(geometry_within_bbox(item, bbox) for item in geometry.get("geometries", []))
+    return _coordinates_within(geometry.get("coordinates", []), bbox)
+
+class ViewportTiles:
+    """
+    Answers bounding-box queries from cached tiles. Each tile holds the documents whose geometry
+    intersects it, keyed by the collection's dataset version so new data invalidates the tiles.
+    Results are merged, deduplicated by _id and clipped to the documents fully inside the bbox,
+    which keeps the $geoWithin semantics of the direct query. The bbox is planar while MongoDB's
+    polygon edges are geodesic (about 15 m apart at the southern edge of a zoom 10 tile in Madrid),
+    so tiles and direct queries use padded_bbox_polygon and are then clipped in planar coordinates.
+    Tiles are bounded by their BSON size, like the other byte-bounded caches.
+    """
+
+    def __init__(self, dataset_versions, max_bytes=TILE_CACHE_MAX_BYTES, ttl=TILE_CACHE_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.cache = ByteLRUCache(max_bytes)
+        self.ttl = ttl
+
+    def _tile(self, key, fetch):
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        tile = fetch()
+        self.cache.set(key, (time.monotonic() + self.ttl, tile), len(bson.encode({"documents": tile})))
+        return tile
+
+    def query(self, collection_name, bbox, method, *args):
+        """
+        `method(collection_name, geometry, *args, intersects=...)` is a MongoDBManager spatial query.
+        Viewports too large for the tile budget are sent directly to MongoDB.
+        """
+        zoom = choose_zoom(bbox)
+        if zoom is None:
+            return [document for document in method(collection_name, padded_bbox_polygon(*bbox), *args) if geometry_within_bbox(document.get("geometry"), bbox)]
+
+        version = self.dataset_versions.key(collection_name)
+        documents = {}
+        for x, y in tiles_for_bbox(bbox, zoom):
+            key = (method.__name__, collection_name, args, zoom, x, y, version)
+            tile = self._tile(key, lambda: method(collection_name, padded_bbox_polygon(*tile_bounds(zoom, x, y)), *args, intersects=True))
+            for document in tile:
+                documents.setdefault(document["_id"], document)
+
+        # Copias sin _id: los documentos de las teselas se comparten entre peticiones
+        return [
+            {field: value for field, value in document.items() if field != "_id"}
+            for document in documents.values()
+            if geometry_within_bbox(document.get("geometry"), bbox)
+        ]
@@ -0,0 +1,151 @@
+import datetime
+import os
+
+from app.caching import TTLCache
+from app.mongo import TimeBucket
+
+# Series temporales de accidentes: se agregan por horas y año una sola vez y el resto se obtiene sumando
+MAX_TIME_SERIES_BUCKETS = int(os.environ.get("SOTERIA_MAX_TIME_SERIES_BUCKETS", 20000))
+TIME_SERIES_PARTITION_CACHE_SIZE = int(os.environ.get("SOTERIA_TIME_SERIES_PARTITION_CACHE_SIZE", 256))
+TIME_SERIES_PARTITION_TTL_SECONDS = float(os.environ.get("SOTERIA_TIME_SERIES_PARTITION_TTL_SECONDS", 24 * 3600))
+# Comparativas entre años: las estadísticas de cada año se calculan una vez y se reutilizan en cualquier rango
+MAX_COMPARED_YEARS = int(os.environ.get("SOTERIA_MAX_COMPARED_YEARS", 30))
+
+def date_range(start: datetime.date | None, end: datetime.date | None):
+    """[start, end] in whole days as [start_at, end_at) datetimes; by default from January 1st to today."""
+    end = end or datetime.date.today()
+    start = start or datetime.date(end.year, 1, 1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    return datetime.datetime.combine(start, datetime.time()), datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time())
+
+def truncate(moment, bucket: TimeBucket):
+    """Same truncation as $dateTrunc, with weeks starting on Monday."""
+    match bucket:
+        case TimeBucket.hour:
+            return moment.replace(minute=0, second=0, microsecond=0)
+        case TimeBucket.day:
+            return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        case TimeBucket.week:
+            day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+            return day - datetime.timedelta(days=day.weekday())
+        case TimeBucket.month:
+            return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_bucket(moment, bucket: TimeBucket):
+    match bucket:
+        case TimeBucket.hour:
+            return moment + datetime.timedelta(hours=1)
+        case TimeBucket.day:
+            return moment + datetime.timedelta(days=1)
+        case TimeBucket.week:
+            return moment + datetime.timedelta(weeks=1)
+        case TimeBucket.month:
+            return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1)
+
+def bucket_starts(start, end, bucket: TimeBucket):
+    """Start of every bucket overlapping [start, end). Raises ValueError above MAX_TIME_SERIES_BUCKETS."""
+    starts = []
+    moment = truncate(start, bucket)
+    while moment < end:
+        starts.append(moment)
+        if len(starts) > MAX_TIME_SERIES_BUCKETS:
+            raise ValueError(f"The range has more than {MAX_TIME_SERIES_BUCKETS} {bucket.value} buckets, use a shorter range or a larger bucket")
+        moment = next_bucket(moment, bucket)
+    return starts
+
+def to_parallel_arrays(bucket: TimeBucket, starts, totals):
+    """One array per measure, aligned with `timestamps`; buckets without accidents count 0."""
+    rows = [totals.get(moment, (0, 0, 0)) for moment in starts]
+    return {
+        "bucket": bucket.value,
+        "timestamps": [moment.isoformat() for moment in starts],
+        "counts": [row[0] for row in rows],
+        "fatal": [row[1] for row in rows],
+        "severe": [row[2] for row in rows],
+    }
+
+class AccidentTimeSeries:
+    """
+    Accident counts per bucket for any date range. Without a polygon the series is rolled up from
+    hourly counts per calendar year, cached by collection, filters and dataset version, so ranges and
+    bucket sizes that change between requests reuse the same aggregations.
+    """
+
+    def __init__(self, dataset_versions, maxsize=TIME_SERIES_PARTITION_CACHE_SIZE, ttl=TIME_SERIES_PARTITION_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.partitions = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def hourly_partition(self, collection_name, year, severity, user):
+        key = (collection_name, year, severity, user, self.dataset_versions.key(collection_name))
+        partition = self.partitions.get(key)
+        if partition is None:
+            docs = self.dataset_versions.db_manager.get_accidents_time_series(
+                collection_name, datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1), TimeBucket.hour, severity, user)
+            partition = {doc["_id"]: (doc["count"], doc["fatal"], doc["severe"]) for doc in docs}
+            self.partitions.set(key, partition)
+        return partition
+
+    def series(self, collection_name, start, end, bucket: TimeBucket, severity=None, user=None):
+        """Rolled up from whole hours: `start` and `end` must fall on the hour, as the ones from date_range do."""
+        if truncate(start, TimeBucket.hour) != start or truncate(end, TimeBucket.hour) != end:
+            raise ValueError("start and end must fall on the hour")
+        starts = bucket_starts(start, end, bucket)
+        totals = {}
+        last_year = (end - datetime.timedelta(microseconds=1)).year
+        for year in range(start.year, last_year + 1):
+            for moment, (count, fatal, severe) in self.hourly_partition(collection_name, year, severity, user).items():
+                if start <= moment < end:
+                    key = truncate(moment, bucket)
+                    total = totals.get(key, (0, 0, 0))
+                    totals[key] = (total[0] + count, total[1] + fatal, total[2] + severe)
+        return to_parallel_arrays(bucket, starts, totals)
+
+    def series_in_geometry(self, collection_name, geometry, start, end, bucket: TimeBucket, severity=None, user=None):
+        """Polygons are arbitrary, so these are aggregated directly for the requested bucket."""
+        starts = bucket_starts(start, end, bucket)
+        docs = self.dataset_versions.db_manager.get_accidents_time_series(collection_name, start, end, bucket, severity, user, geometry)
+        return to_parallel_arrays(bucket, starts, {doc["_id"]: (doc["count"], doc["fatal"], doc["severe"]) for doc in docs})
+
+def stats_deltas(previous, current):
+    """Absolute and percentage change of every count between two years; the percentage is None when the previous count is 0."""
+    absolute, percentage = {}, {}
+    for section, counts in current.items():
+        absolute[section], percentage[section] = {}, {}
+        for label, value in counts.items():
+            before = previous.get(section, {}).get(label, 0)
+            absolute[section][label] = value - before
+            percentage[section][label] = round(100 * (value - before) / before, 2) if before else None
+    return {"absolute": absolute, "percentage": percentage}
+
+class YearlyAccidentStats:
+    """
+    get_accidents_stats for a range of years, with the change from each year to the next. Each year's
+    stats are cached by collection and dataset version, so widening the range only aggregates the new
+    years, all of them in one grouped query.
+    """
+
+    def __init__(self, dataset_versions, maxsize=TIME_SERIES_PARTITION_CACHE_SIZE, ttl=TIME_SERIES_PARTITION_TTL_SECONDS):
+        self.dataset_versions = dataset_versions
+        self.partials = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def compare(self, collection_name, year_from, year_to):
+        if year_from > year_to:
+            raise ValueError("year_from must not be after year_to")
+        if year_to - year_from + 1 > MAX_COMPARED_YEARS:
+            raise ValueError(f"Compare at most {MAX_COMPARED_YEARS} years at once")
+
+        years = list(range(year_from, year_to + 1))
+        version = self.dataset_versions.key(collection_name)
+        stats = {year: self.partials.get((collection_name, year, version)) for year in years}
+        missing = [year for year, partial in stats.items() if partial is None]
+        if missing:
+            for year, partial in self.dataset_versions.db_manager.get_accidents_stats_by_year(collection_name, missing).items():
+                self.partials.set((collection_name, year, version), partial)
+                stats[year] = partial
+
+        return {
+            "years": years,
+            "stats": {str(year): stats[year] for year in years},
+            "deltas": {str(year): stats_deltas(stats[year - 1], stats[year]) for year in years[1:]},
+        }
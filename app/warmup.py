@@ -0,0 +1,105 @@
+from collections import Counter
+import asyncio
+import datetime
+import logging
+import os
+import re
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Calentamiento de cachés al arrancar, antes de que /health/ready responda 200
+WARMUP_ENABLED = os.environ.get("SOTERIA_WARMUP", "1") != "0"
+WARMUP_CONCURRENCY = int(os.environ.get("SOTERIA_WARMUP_CONCURRENCY", 4))
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get("SOTERIA_WARMUP_TIMEOUT_SECONDS", 120))
+WARMUP_TRAFFIC_LOG = os.environ.get("SOTERIA_WARMUP_TRAFFIC_LOG")
+WARMUP_TOP_N = int(os.environ.get("SOTERIA_WARMUP_TOP_N", 50))
+
+ACCESS_LOG_REQUEST = re.compile(r'"?(GET|POST|PUT|DELETE) (\S+)(?: HTTP/[\d.]+)?"?')
+
+def default_warmup_paths(today=None):
+    """Public, cached requests every new client makes: default Madrid viewport, city-wide clusters, network geometry, districts and stats."""
+    year = (today or datetime.date.today()).year
+    return [
+        "/madrid/hotspots/viewport",
+        "/madrid/hotspots/clusters?zoom=11",
+        "/madrid/nodes/geo",
+        "/madrid/edges/geo",
+        "/madrid/segments/geo",
+        "/madrid/districts",
+        "/madrid/accidents/stats",
+        f"/madrid/accidents/stats?year={year}",
+        "/madrid/accidents/cadas/stats",
+        f"/madrid/accidents/cadas/stats?year={year}",
+    ]
+
+def top_paths_from_log(path, top_n=WARMUP_TOP_N):
+    """Most requested GET paths in an access log (uvicorn, nginx or common log format)."""
+    counts = Counter()
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = ACCESS_LOG_REQUEST.search(line)
+            if match and match.group(1) == "GET" and not match.group(2).startswith(("/health", "/metrics", "/admin")):
+                counts[match.group(2)] += 1
+    return [request_path for request_path, _ in counts.most_common(top_n)]
+
+class WarmupState:
+    def __init__(self):
+        self.ready = False
+        self.started_at = None
+        self.duration = None
+        self.succeeded = 0
+        self.failed = 0
+
+    def as_dict(self):
+        return {
+            "ready": self.ready,
+            "warmup_seconds": round(self.duration, 2) if self.duration is not None else None,
+            "warmed": self.succeeded,
+            "failed": self.failed,
+        }
+
+async def warm_up(app, state, paths, functions=(), concurrency=WARMUP_CONCURRENCY, timeout=WARMUP_TIMEOUT_SECONDS):
+    """
+    Sends `paths` through the application in-process and runs `functions` in the threadpool, at most
+    `concurrency` at a time, so the response, tile and date caches are populated. Marks `state` ready
+    when everything has finished or the timeout expires; failures are logged, never raised.
+    """
+    import httpx
+
+    state.started_at = time.monotonic()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(client, path):
+        async with semaphore:
+            try:
+                response = await client.get(path, headers={"Accept-Encoding": "gzip"})
+                ok = response.status_code < 400
+            except Exception as e:
+                logger.warning(f"Warm-up request {path} failed: {e}")
+                ok = False
+        state.succeeded += ok
+        state.failed += not ok
+
+    async def call(function):
+        async with semaphore:
+            try:
+                await run_in_threadpool(function)
+                ok = True
+            except Exception as e:
+                logger.warning(f"Warm-up call {getattr(function, '__name__', function)} failed: {e}")
+                ok = False
+        state.succeeded += ok
+        state.failed += not ok
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://warmup", timeout=timeout) as client:
+            await asyncio.wait_for(asyncio.gather(*(get(client, path) for path in paths), *(call(function) for function in functions)), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Warm-up did not finish in {timeout} s, reporting ready anyway")
+    finally:
+        state.duration = time.monotonic() - state.started_at
+        state.ready = True
+        logger.info(f"Warm-up finished in {state.duration:.1f} s: {state.succeeded} warmed, {state.failed} failed")
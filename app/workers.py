@@ -0,0 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import os
+import threading
+
+# Pool de procesos para trabajo de CPU (gráficos) que no debe ocupar los hilos de las peticiones
+PROCESS_POOL_WORKERS = int(os.environ.get("SOTERIA_PROCESS_POOL_WORKERS", 2))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Creates the pool on first use, so processes are only started by workers that need them."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: hacer fork de un proceso con hilos (pymongo, anyio) puede dejar locks tomados
+            _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+async def run_in_process(function, *args):
+    """Runs a picklable module-level function in the process pool without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), function, *args)
+
+def shutdown_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
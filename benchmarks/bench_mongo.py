@@ -0,0 +1,173 @@
+"""Times every MongoDBManager query method against a seeded, synthetic SoteriaDB.
+
+    python -m benchmarks.bench_mongo --uri mongodb://localhost:27017 --output bench.json
+    python -m benchmarks.bench_mongo --in-process --scale 0.02      # pip install -r requirements-dev.txt
+    python -m benchmarks.bench_mongo --compare bench-main.json --output bench-branch.json
+
+Results (p50/p95 latency and documents/second per method) are written as JSON so runs on
+different commits can be compared with --compare.
+"""
+import argparse
+import datetime
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from app.mongo import *
+from benchmarks.synthetic_data import generate_dataset, seed_database
+
+VIEWPORT = {
+    "type": "Polygon",
+    "coordinates": [[[-3.6895, 40.4241], [-3.6895, 40.4347], [-3.6641, 40.4347], [-3.6641, 40.4241], [-3.6895, 40.4241]]],
+}
+
+# (nombre, llamada): cada caso ejecuta un método de MongoDBManager con argumentos representativos
+CASES = [
+    ("get_city_districts", lambda db: db.get_city_districts("locations", Location.Madrid)),
+    ("get_accidents_stats", lambda db: db.get_accidents_stats("limpioMadridAccidentalidad", 2024)),
+    ("get_accidents_stats_cadas", lambda db: db.get_accidents_stats_cadas("LGL_accidents_CADaS", 2024)),
+    ("get_accidents_stats_by_district", lambda db: db.get_accidents_stats_by_district("limpioMadridAccidentalidad", "locations", Location.Madrid, 2024)),
+    ("get_accidents_stats_by_year", lambda db: db.get_accidents_stats_by_year("limpioMadridAccidentalidad", range(2019, 2025))),
+    ("get_accidents_stats_within_area", lambda db: db.get_accidents_stats_within_area("limpioMadridAccidentalidad", VIEWPORT, 2024)),
+    ("get_accidents_time_series[month]", lambda db: db.get_accidents_time_series("LGL_accidents", datetime.datetime(2024, 1, 1), datetime.datetime(2025, 1, 1), TimeBucket.month)),
+    ("get_accidents_time_series[hour]", lambda db: db.get_accidents_time_series("LGL_accidents_CADaS", datetime.datetime(2024, 1, 1), datetime.datetime(2025, 1, 1), TimeBucket.hour, AccidentSeverity.fatal_and_severe)),
+    ("get_accident_temporal_rows", lambda db: db.get_accident_temporal_rows("LGL_accidents", AreaType.district, 2024)),
+    ("get_demand_stats", lambda db: db.get_demand_stats("LGL_travelDemandAggregated")),
+    ("get_all_accidents_locations", lambda db: db.get_all_accidents_locations("LGL_accidents", None, 2024, -1)),
+    ("get_all_cadas_accidents_locations", lambda db: db.get_all_cadas_accidents_locations("LGL_accidents_CADaS", None, 2024, -1)),
+    ("get_all_predictions", lambda db: db.get_all_predictions("LGL_DL_module_predictions_v2", None, 2025, -1)),
+    ("get_accident_points_within_area", lambda db: db.get_accident_points_within_area("LGL_accidents", VIEWPORT, 2024)),
+    ("get_accident_points_in_period", lambda db: db.get_accident_points_in_period("LGL_accidents", datetime.datetime(2024, 1, 1), datetime.datetime(2025, 1, 1))),
+    ("get_network_sites", lambda db: db.get_network_sites("LGL_nodes")),
+    ("get_demand_edges", lambda db: db.get_demand_edges("LGL_travelDemandAggregated")),
+    ("get_accidents_locations_within_area", lambda db: db.get_accidents_locations_within_area("LGL_accidents", VIEWPORT, None, 2024, -1)),
+    ("get_accidents_by_hotspot_locations", lambda db: db.get_accidents_by_hotspot_locations("LGL_accidents", 2024, 100, GeoType.intersection)),
+    ("get_accidents_by_hotspot_batch", lambda db: db.get_accidents_by_hotspot_batch("LGL_accidents", 2024, range(100, 150), [], counts_only=True)),
+    ("get_accidents_by_hotspot_locations_for_segments", lambda db: db.get_accidents_by_hotspot_locations_for_segments("LGL_accidents", 2024, "0,1,0,0", GeoType.segment)),
+    ("get_conn_vehicle_stats", lambda db: db.get_conn_vehicle_stats("madridHotspots", "LGL_eventFrequency", GeoType.intersection)),
+    ("get_all_hotspots", lambda db: db.get_all_hotspots("LGL_hotspots", -1, None, None, None, None, None)),
+    ("get_hotspots_within_area", lambda db: db.get_hotspots_within_area("LGL_hotspots", VIEWPORT, None, None, None, None, None)),
+    ("get_all_documents[edges]", lambda db: db.get_all_documents("LGL_edges", -1, None)),
+    ("get_all_documents[segments]", lambda db: db.get_all_documents("LGL_segments", -1, None)),
+    ("get_all_documents_travel_demand", lambda db: db.get_all_documents_travel_demand("LGL_travelDemandAggregated", -1)),
+    ("get_all_documents_risk", lambda db: db.get_all_documents_risk("LGL_nodes", -1, None)),
+    ("get_all_documents_percentile", lambda db: db.get_all_documents_percentile("LGL_travelDemandAccidents", -1, None, 50)),
+    ("get_all_documents_by_type", lambda db: db.get_all_documents_by_type("LGL_eventFrequency", None, None, None, 0, -1)),
+    ("get_conn_vehicle_dangerous_locations", lambda db: db.get_conn_vehicle_dangerous_locations("LGL_eventFrequency", None, None, [50, 50, 50, 50], -1)),
+    ("get_documents_within_area[nodes]", lambda db: db.get_documents_within_area("LGL_nodes", VIEWPORT, None)),
+    ("get_documents_within_area[edges]", lambda db: db.get_documents_within_area("LGL_edges", VIEWPORT, None)),
+    ("get_documents_within_area[segments]", lambda db: db.get_documents_within_area("LGL_segments", VIEWPORT, None)),
+]
+
+def _count_documents(result):
+    if isinstance(result, list):
+        return len(result)
+    return 1 if result else 0
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_case(db_manager, call, repeat, warmup):
+    for _ in range(warmup):
+        call(db_manager)
+    timings, documents = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call(db_manager)
+        timings.append(time.perf_counter() - start)
+        documents = _count_documents(result)
+    mean = statistics.fmean(timings)
+    return {
+        "p50_ms": round(_percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(timings, 0.95) * 1000, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "documents": documents,
+        "documents_per_second": round(documents / mean, 1) if mean > 0 else None,
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _print_report(results, previous=None):
+    print(f"{'method':<50} {'p50 ms':>10} {'p95 ms':>10} {'docs/s':>12}" + (f" {'p50 Δ':>9}" if previous else ""))
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<50} error: {result['error']}")
+            continue
+        line = f"{name:<50} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['documents_per_second'] or 0:>12.0f}"
+        before = (previous or {}).get(name, {})
+        if previous and before.get("p50_ms"):
+            line += f" {(result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100:>+8.1f}%"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="mongod to seed and query")
+    parser.add_argument("--database", default="soteria_bench", help="database created (and dropped, unless --keep-database) for the benchmark")
+    parser.add_argument("--in-process", action="store_true", help="use mongomock instead of a real mongod (no geo or $lookup support)")
+    parser.add_argument("--scale", type=float, default=1.0, help="dataset size relative to Madrid production volumes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", action="append", help="run only the cases whose name contains this text")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in --database (never dropped)")
+    parser.add_argument("--keep-database", action="store_true", help="keep the seeded --database for later --skip-seed runs")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    db_manager = MongoDBManager(args.uri, database_name=args.database)
+    if args.in_process:
+        import mongomock
+        db_manager.client = mongomock.MongoClient()
+        db_manager.db = db_manager.client[args.database]
+
+    try:
+        if not args.skip_seed:
+            start = time.perf_counter()
+            dataset = generate_dataset(args.scale, args.seed)
+            seed_database(db_manager.db, dataset)
+            print(f"Seeded {sum(map(len, dataset.values()))} documents in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+        results = {}
+        for name, call in CASES:
+            if args.only and not any(text in name for text in args.only):
+                continue
+            try:
+                results[name] = run_case(db_manager, call, args.repeat, args.warmup)
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        # Sólo se borra la base de datos que ha sembrado esta ejecución
+        if not args.skip_seed and not args.keep_database:
+            db_manager.client.drop_database(args.database)
+        db_manager.close_connection()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+    _print_report(results, previous)
+
+    if args.output:
+        report = {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "uri": "in-process" if args.in_process else args.uri.split("@")[-1],
+            "scale": args.scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
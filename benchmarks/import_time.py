@@ -0,0 +1,78 @@
+"""Measures the cold import time of the application with `python -X importtime` and gates regressions.
+
+    python -m benchmarks.import_time                     # check against benchmarks/import_time_budget.json
+    python -m benchmarks.import_time --top 20            # also list the slowest modules
+    python -m benchmarks.import_time --output imports.json
+
+Each run imports the module in a fresh interpreter. The gate fails (exit code 1) when the median
+cumulative import time exceeds the budget or when a module that must stay lazy (matplotlib, pandas,
+numpy...) is imported. Importing must not touch the network either: MongoDB clients are created in
+the application lifespan, so SOTERIA_MONGO_URI points at an unroutable address during the runs.
+
+The budget is the recorded baseline (the highest median of several sets of runs, see `baseline` in
+the budget file) plus 25%, since medians on a shared machine vary by more than 100 ms between sets.
+Re-measure and update both numbers when a change moves the baseline on purpose.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+DEFAULT_BUDGET = os.path.join(os.path.dirname(__file__), "import_time_budget.json")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+def measure(module):
+    """Runs one cold import; returns {module: (self_us, cumulative_us)}."""
+    env = os.environ | {"SOTERIA_MONGO_URI": "mongodb://192.0.2.1:27017/?serverSelectionTimeoutMS=1000", "PYTHONDONTWRITEBYTECODE": "1"}
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, env=env)
+    if process.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{process.stderr[-2000:]}")
+    timings = {}
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="JSON file with module, max_cumulative_ms and forbidden_modules")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="list the N modules with the highest self time")
+    parser.add_argument("--output", help="write the measurements as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.budget, encoding="utf-8") as f:
+        budget = json.load(f)
+    module = budget["module"]
+
+    runs = [measure(module) for _ in range(args.runs)]
+    cumulative_ms = statistics.median(run[module][1] for run in runs) / 1000
+    imported = set().union(*runs)
+    forbidden = sorted(name for name in imported if name.split(".")[0] in budget.get("forbidden_modules", []))
+
+    baseline = f"baseline {budget['baseline_cumulative_ms']} ms, " if "baseline_cumulative_ms" in budget else ""
+    print(f"{module}: median cumulative import time {cumulative_ms:.1f} ms over {args.runs} runs ({baseline}budget {budget['max_cumulative_ms']} ms)")
+    if args.top:
+        self_ms = {name: statistics.median(run.get(name, (0, 0))[0] for run in runs) / 1000 for name in imported}
+        for name, value in sorted(self_ms.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {value:>8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"module": module, "cumulative_ms": cumulative_ms, "runs": args.runs, "forbidden_imported": forbidden}, f, indent=2)
+
+    failures = []
+    if cumulative_ms > budget["max_cumulative_ms"]:
+        failures.append(f"import time {cumulative_ms:.1f} ms exceeds the budget of {budget['max_cumulative_ms']} ms")
+    if forbidden:
+        failures.append(f"modules that must be imported lazily were loaded: {', '.join(forbidden[:10])}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
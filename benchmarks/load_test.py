@@ -0,0 +1,282 @@
+"""HTTP load harness that replays a realistic request mix against the FastAPI app.
+
+    # Seed local test data, start uvicorn against it and run the synthetic mix for 60 s
+    python -m benchmarks.load_test --spawn --seed-data --uri mongodb://localhost:27017 --duration 60
+
+    # Replay a recorded access log against an already running server
+    python -m benchmarks.load_test --base-url http://localhost:8000 --access-log access.log
+
+    # Check that a login storm does not hurt the data endpoints
+    python -m benchmarks.load_test --spawn --login-storm 20
+
+The report gives throughput, latency percentiles and error rate per request class, plus the
+resident memory of the server processes at the start and end of the run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+BENCH_USERNAME = "loadtest"
+BENCH_PASSWORD = "loadtest-password"
+
+# Vista por defecto de la API; las panorámicas se desplazan a partir de ella
+DEFAULT_VIEWPORT = (-3.6895, 40.4241, -3.6641, 40.4347)
+
+# Peso relativo de cada tipo de petición en la mezcla sintética
+SYNTHETIC_MIX = {
+    "viewport_pan": 50,
+    "accidents_stats": 10,
+    "cadas_stats": 5,
+    "districts": 10,
+    "demand_stats": 5,
+    "predictions": 15,
+    "dangerous_locations": 5,
+}
+
+ACCESS_LOG_REQUEST = re.compile(r'"?(GET|POST|PUT|DELETE) (\S+)(?: HTTP/[\d.]+)?"?')
+
+class VirtualUser:
+    """One simulated client: keeps its own viewport position and reuses its access token."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.viewport = list(DEFAULT_VIEWPORT)
+        self.token = None
+
+    def pan(self):
+        width = self.viewport[2] - self.viewport[0]
+        height = self.viewport[3] - self.viewport[1]
+        dx = self.rng.uniform(-0.5, 0.5) * width
+        dy = self.rng.uniform(-0.5, 0.5) * height
+        self.viewport = [self.viewport[0] + dx, self.viewport[1] + dy, self.viewport[2] + dx, self.viewport[3] + dy]
+        sw_lon, sw_lat, ne_lon, ne_lat = (round(value, 6) for value in self.viewport)
+        return f"/madrid/hotspots/viewport?sw_lon={sw_lon}&sw_lat={sw_lat}&ne_lon={ne_lon}&ne_lat={ne_lat}"
+
+    def next_request(self):
+        """Returns (request class, method, path, needs authentication)."""
+        kind = self.rng.choices(list(SYNTHETIC_MIX), list(SYNTHETIC_MIX.values()))[0]
+        match kind:
+            case "viewport_pan":
+                return kind, "GET", self.pan(), False
+            case "accidents_stats":
+                return kind, "GET", f"/madrid/accidents/stats?year={self.rng.choice([2023, 2024])}", False
+            case "cadas_stats":
+                return kind, "GET", f"/madrid/accidents/cadas/stats?year={self.rng.choice([2023, 2024])}", False
+            case "districts":
+                return kind, "GET", "/madrid/districts", False
+            case "demand_stats":
+                return kind, "GET", "/madrid/traveldemand/stats", True
+            case "predictions":
+                return kind, "GET", f"/madrid/predictions/accidents?quantity={self.rng.choice([50, 200])}", True
+            case "dangerous_locations":
+                return kind, "GET", "/madrid/connectedvehicledata/dangerouslocations?brake_percentile=80", True
+
+def load_access_log(path):
+    """Parses `METHOD /path?query` request lines, as found in uvicorn, nginx or common log format."""
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = ACCESS_LOG_REQUEST.search(line)
+            if match and match.group(1) == "GET":
+                route = re.sub(r"^/[^/]+", "/{location}", match.group(2).split("?")[0])
+                authenticated = any(part in route for part in ("/connectedvehicledata", "/traveldemand", "/predictions", "/users/me"))
+                requests.append((route, "GET", match.group(2), authenticated))
+    if not requests:
+        raise SystemExit(f"No GET requests found in {path}")
+    return requests
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, kind, elapsed, ok):
+        self.latencies[kind].append(elapsed)
+        if not ok:
+            self.errors[kind] += 1
+
+    def summary(self, duration):
+        def stats(values, errors):
+            ordered = sorted(values)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+            return {
+                "requests": len(values),
+                "throughput_rps": round(len(values) / duration, 2),
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "mean_ms": round(statistics.fmean(values) * 1000, 2),
+                "error_rate": round(errors / len(values), 4),
+            }
+        result = {kind: stats(values, self.errors[kind]) for kind, values in sorted(self.latencies.items()) if values}
+        data_values = [v for kind, values in self.latencies.items() if kind != "login" for v in values]
+        if data_values:
+            result["ALL (excluding login)"] = stats(data_values, sum(e for kind, e in self.errors.items() if kind != "login"))
+        return result
+
+async def login(client):
+    response = await client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run_user(client, user, recorder, deadline, replay):
+    while time.monotonic() < deadline:
+        if replay:
+            kind, method, path, authenticated = user.rng.choice(replay)
+        else:
+            kind, method, path, authenticated = user.next_request()
+        start = time.perf_counter()
+        try:
+            headers = {}
+            if authenticated:
+                if user.token is None:
+                    user.token = await login(client)
+                headers["Authorization"] = f"Bearer {user.token}"
+            response = await client.request(method, path, headers=headers)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        recorder.record(kind, time.perf_counter() - start, ok)
+
+async def run_login_storm(client, recorder, deadline, concurrency):
+    async def one():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            recorder.record("login", time.perf_counter() - start, ok)
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+
+def _process_tree(pid):
+    pids = [pid]
+    for child in _read(f"/proc/{pid}/task/{pid}/children").split():
+        pids.extend(_process_tree(int(child)))
+    return pids
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+def server_rss_mb(pid):
+    """Resident memory of the server and its workers, from /proc (Linux only)."""
+    total_kb = 0
+    for process in _process_tree(pid):
+        match = re.search(r"VmRSS:\s+(\d+) kB", _read(f"/proc/{process}/status"))
+        if match:
+            total_kb += int(match.group(1))
+    return round(total_kb / 1024, 1)
+
+def seed(uri, database, scale):
+    from pymongo import MongoClient
+    from app.authentication import get_password_hash
+    from benchmarks.synthetic_data import generate_dataset, seed_database
+
+    db = MongoClient(uri)[database]
+    seed_database(db, generate_dataset(scale))
+    db.users.delete_many({"username": BENCH_USERNAME})
+    db.users.insert_one({"username": BENCH_USERNAME, "hashed_password": get_password_hash(BENCH_PASSWORD), "disabled": False})
+
+def spawn_server(args):
+    env = os.environ | {"SOTERIA_MONGO_URI": args.uri, "SOTERIA_MONGO_DATABASE": args.database}
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"]
+    print(f"Starting {shlex.join(command)}", file=sys.stderr)
+    process = subprocess.Popen(command, env=env)
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{args.port}/openapi.json", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("The server did not start")
+
+async def run(args, server_pid):
+    replay = load_access_log(args.access_log) if args.access_log else None
+    recorder = Recorder()
+    rss = []
+    limits = httpx.Limits(max_connections=args.users + args.login_storm)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        deadline = time.monotonic() + args.duration
+
+        async def sample_memory():
+            while server_pid and time.monotonic() < deadline:
+                rss.append(server_rss_mb(server_pid))
+                await asyncio.sleep(1)
+
+        users = [VirtualUser(random.Random(args.seed + i)) for i in range(args.users)]
+        start = time.monotonic()
+        await asyncio.gather(
+            sample_memory(),
+            run_login_storm(client, recorder, deadline, args.login_storm),
+            *(run_user(client, user, recorder, deadline, replay) for user in users),
+        )
+        duration = time.monotonic() - start
+
+    report = {"duration_s": round(duration, 1), "users": args.users, "login_storm": args.login_storm, "classes": recorder.summary(duration)}
+    if rss:
+        report["server_rss_mb"] = {"start": rss[0], "end": rss[-1], "max": max(rss), "growth": round(rss[-1] - rss[0], 1)}
+    return report
+
+def print_report(report):
+    print(f"{'class':<24} {'reqs':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for kind, stats in report["classes"].items():
+        print(f"{kind:<24} {stats['requests']:>7} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['error_rate']:>7.2%}")
+    if "server_rss_mb" in report:
+        memory = report["server_rss_mb"]
+        print(f"server RSS: {memory['start']} MB -> {memory['end']} MB (max {memory['max']} MB, growth {memory['growth']:+} MB)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="server to test; defaults to the spawned one")
+    parser.add_argument("--spawn", action="store_true", help="start uvicorn against --uri/--database for the run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="soteria_bench")
+    parser.add_argument("--seed-data", action="store_true", help="seed synthetic data and the load test user first")
+    parser.add_argument("--scale", type=float, default=0.2, help="synthetic data set size (see benchmarks.synthetic_data)")
+    parser.add_argument("--access-log", help="replay GET requests from this access log instead of the synthetic mix")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--login-storm", type=int, default=0, help="concurrent clients logging in continuously")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.seed_data:
+        seed(args.uri, args.database, args.scale)
+
+    server = spawn_server(args) if args.spawn else None
+    args.base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+    try:
+        report = asyncio.run(run(args, server.pid if server else None))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
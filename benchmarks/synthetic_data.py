@@ -0,0 +1,327 @@
+"""Synthetic, Madrid-sized data set with the same document layouts as SoteriaDB.
+
+Every generator is deterministic for a given seed and scale, so two benchmark runs on
+different commits query exactly the same data.
+"""
+import datetime
+import json
+import math
+import os
+import random
+
+# Bounding box aproximado del municipio de Madrid
+MADRID_BBOX = (-3.8350, 40.3120, -3.5250, 40.5630)
+YEARS = (2023, 2024)
+
+# Tamaños con scale=1.0, cercanos a los de producción
+BASE_SIZES = {
+    "accidents_per_year": 45_000,
+    "cadas_accidents_per_year": 30_000,
+    "hotspots_per_month": 1_500,
+    "event_rows": 40_000,
+    "prediction_docs": 5_000,
+    "demand_docs": 30_000,
+    "grid_side": 160,
+}
+
+GRAVEDAD = ["Deceased", "Severe", "Slight", "Unharmed"]
+GRAVEDAD_WEIGHTS = [0.002, 0.03, 0.6, 0.368]
+TIPO_PERSONA = ["Driver", "Passenger", "Pedestrian"]
+GRUPO_TIPO_VEHICULO = ["Car", "Commercial Vehicle", "Emergency Vehicle", "Personal Mobility Vehicle", "Others", "Bus", "Unknown", "Motorcycle", "Bicycle", "Non-Motorized", "Train"]
+TIPO_ACCIDENTE = ["Alcance", "Colisión fronto-lateral", "Otro", "Solo salida de la vía", "Colisión frontal", "Choque contra obstáculo fijo", "Caída", "Colisión lateral", "Atropello a persona", "Colisión múltiple", "Vuelco", "Atropello a animal"]
+RANGO_EDAD = ["Menor de 5 años", "De 6 a 9 años", "De 10 a 14 años", "De 15 a 17 años", "De 18 a 20 años", "De 21 a 24 años", "De 25 a 29 años", "De 30 a 34 años", "De 35 a 39 años", "De 40 a 44 años", "De 45 a 49 años", "De 50 a 54 años", "De 55 a 59 años", "De 60 a 64 años", "De 65 a 69 años", "De 70 a 74 años", "Más de 74 años"]
+
+CADAS_SEVERITY = ["Deceased", "Severe", "Slight"]
+CADAS_SEVERITY_WEIGHTS = [0.01, 0.09, 0.9]
+CADAS_PERSON = ["Driver", "Passenger", "Pedestrian"]
+CADAS_VEHICLE = ["Passenger car", "Goods Vehicle", "Emergency Vehicle", "Personal Mobility Vehicle", "Other motor vehicle", "Bus or coach", "Unknown", "Motorcycle", "Pedal Cycle", "Pedestrian", "Moped"]
+CADAS_WEATHER = ["Clear", "Dry", "Dry/Clear", "Rain", "Snow"]
+
+HOTSPOT_USERS = ["general", "pedestrian", "cyclist", "motorcycle"]
+HOTSPOT_SEVERITIES = ["light", "severe", "mass"]
+EVENT_TYPES = ["cornering_right", "cornering_left", "brake", "speedup"]
+PREDICTION_TYPES = ["accident_number_all", "accident_risk_score_abs", "accident_risk_score_rel"]
+MODEL_TYPES = ["GNN", "GLM"]
+CATEGORIES = ["very_low", "low", "intermediate", "high", "very_high"]
+
+def _sizes(scale):
+    sizes = {name: max(1, int(value * scale)) for name, value in BASE_SIZES.items()}
+    sizes["grid_side"] = max(4, int(BASE_SIZES["grid_side"] * math.sqrt(scale)))
+    return sizes
+
+def _point(lon, lat):
+    return {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]}
+
+def _random_datetime(rng, year, month=None):
+    month = month or rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    return datetime.datetime(year, month, day, rng.randint(0, 23), rng.randint(0, 59))
+
+class RoadNetwork:
+    """Regular grid of intersections over the Madrid bbox, with an edge between grid neighbours."""
+
+    def __init__(self, rng, side):
+        sw_lon, sw_lat, ne_lon, ne_lat = MADRID_BBOX
+        self.side = side
+        self.step_lon = (ne_lon - sw_lon) / (side - 1)
+        self.step_lat = (ne_lat - sw_lat) / (side - 1)
+        self.nodes = {}
+        for i in range(side):
+            for j in range(side):
+                node_id = i * side + j
+                lon = sw_lon + j * self.step_lon + rng.uniform(-0.2, 0.2) * self.step_lon
+                lat = sw_lat + i * self.step_lat + rng.uniform(-0.2, 0.2) * self.step_lat
+                self.nodes[node_id] = (lon, lat)
+        self.edges = []
+        for i in range(side):
+            for j in range(side):
+                u = i * side + j
+                if j + 1 < side:
+                    self.edges.append((u, u + 1, 0))
+                if i + 1 < side:
+                    self.edges.append((u, u + side, 0))
+
+    def edge_line(self, edge):
+        u, v, _ = edge
+        return {"type": "LineString", "coordinates": [list(map(lambda c: round(c, 6), self.nodes[u])), list(map(lambda c: round(c, 6), self.nodes[v]))]}
+
+    def segment_id(self, index):
+        u, v, key = self.edges[index]
+        return {"u": u, "v": v, "key": key, "segmentID": index}
+
+def generate_locations():
+    path = os.path.join(os.path.dirname(__file__), "..", "app", "madrid-districts.geojson")
+    with open(path, encoding="utf-8") as f:
+        return [json.load(f)]
+
+def generate_road_network(rng, network):
+    nodes = [{
+        "type": "Feature",
+        "geometry": _point(*coords),
+        "properties": {"osmid": node_id, "accident_risk": rng.randint(0, 10), "is_hotspot": rng.random() < 0.03},
+    } for node_id, coords in network.nodes.items()]
+    edges = [{
+        "type": "Feature",
+        "geometry": network.edge_line(edge),
+        "properties": {"u": edge[0], "v": edge[1], "key": edge[2], "accident_risk": rng.randint(0, 10)},
+    } for edge in network.edges]
+    segments = [{
+        "type": "Feature",
+        "geometry": network.edge_line(edge),
+        "properties": network.segment_id(index) | {"accident_risk": rng.randint(0, 10)},
+    } for index, edge in enumerate(network.edges) if index % 2 == 0]
+    return nodes, edges, segments
+
+def _accident_location(rng, network):
+    """Accidents cluster around a subset of intersections so hotspots are meaningful."""
+    if rng.random() < 0.6:
+        node_id = rng.randrange(len(network.nodes))
+        lon, lat = network.nodes[node_id]
+        return node_id, "intersection", lon + rng.gauss(0, network.step_lon / 20), lat + rng.gauss(0, network.step_lat / 20)
+    index = rng.randrange(len(network.edges))
+    (lon1, lat1), (lon2, lat2) = (network.nodes[n] for n in network.edges[index][:2])
+    t = rng.random()
+    return network.segment_id(index), "segment", lon1 + t * (lon2 - lon1), lat1 + t * (lat2 - lat1)
+
+def generate_madrid_accidents(rng, network, count_per_year):
+    """`limpioMadridAccidentalidad` (flat fields) and `LGL_accidents` (`properties.fecha_hora`) layouts."""
+    flat, geojson = [], []
+    for year in YEARS:
+        for _ in range(count_per_year):
+            location_id, location_type, lon, lat = _accident_location(rng, network)
+            fields = {
+                "fecha_hora": _random_datetime(rng, year),
+                "gravedad_lesividad": rng.choices(GRAVEDAD, GRAVEDAD_WEIGHTS)[0],
+                "tipo_persona": rng.choice(TIPO_PERSONA),
+                "grupo_tipo_vehiculo": rng.choice(GRUPO_TIPO_VEHICULO),
+                "tipo_accidente": rng.choice(TIPO_ACCIDENTE),
+                "rango_edad": rng.choice(RANGO_EDAD),
+            }
+            flat.append(fields | {"geometry": _point(lon, lat)})
+            geojson.append({
+                "type": "Feature",
+                "geometry": _point(lon, lat),
+                "properties": fields | {"locationID": location_id, "locationType": location_type},
+            })
+    return flat, geojson
+
+def generate_cadas_accidents(rng, network, count_per_year):
+    """`LGL_accidents_CADaS` / `LG_saxony_accidents` layout with `properties.datetime` and array labels."""
+    docs = []
+    for year in YEARS:
+        for _ in range(count_per_year):
+            location_id, location_type, lon, lat = _accident_location(rng, network)
+            involved = rng.randint(1, 3)
+            docs.append({
+                "type": "Feature",
+                "geometry": _point(lon, lat),
+                "properties": {
+                    "datetime": _random_datetime(rng, year),
+                    "injury_severity_label": rng.choices(CADAS_SEVERITY, CADAS_SEVERITY_WEIGHTS)[0],
+                    "person_type_label": [rng.choice(CADAS_PERSON) for _ in range(involved)],
+                    "vehicle_type_label": [rng.choice(CADAS_VEHICLE) for _ in range(involved)],
+                    "weather_label": rng.choice(CADAS_WEATHER),
+                    "locationID": location_id,
+                    "locationType": location_type,
+                },
+            })
+    return docs
+
+def generate_hotspots(rng, network, per_month):
+    docs = []
+    for year in YEARS:
+        for month in range(1, 13):
+            for _ in range(per_month):
+                if rng.random() < 0.6:
+                    node_id = rng.randrange(len(network.nodes))
+                    geometry, location_id, location_type = _point(*network.nodes[node_id]), node_id, "intersection"
+                else:
+                    index = rng.randrange(len(network.edges))
+                    geometry, location_id, location_type = network.edge_line(network.edges[index]), network.segment_id(index), "segment"
+                info = [{"user": rng.choice(HOTSPOT_USERS), "severity": rng.choice(HOTSPOT_SEVERITIES)} for _ in range(rng.randint(1, 3))]
+                docs.append({
+                    "type": "Feature",
+                    "geometry": geometry,
+                    "properties": {
+                        "id": location_id if location_type == "intersection" else location_id["segmentID"],
+                        "locationID": location_id,
+                        "locationType": location_type,
+                        "hotspotType": location_type,
+                        "date": datetime.datetime(year, month, 1),
+                        "info": info,
+                    },
+                })
+    return docs
+
+def generate_event_frequency(rng, network, count):
+    docs = []
+    for _ in range(count):
+        node_id = rng.randrange(len(network.nodes))
+        year = rng.choice(YEARS)
+        month = rng.randint(1, 12)
+        start = datetime.datetime(year, month, 1)
+        percentile = rng.randint(1, 100)
+        docs.append({
+            "type": "Feature",
+            "geometry": _point(*network.nodes[node_id]),
+            "properties": {
+                "ID": node_id,
+                "locationID": node_id,
+                "locationType": "intersection",
+                "type": "intersection",
+                "event_type": rng.choice(EVENT_TYPES),
+                "P": percentile,
+                "D": min(9, percentile // 10),
+                "start_date": start,
+                "end_date": start + datetime.timedelta(days=27),
+                "creation_date": start + datetime.timedelta(days=35),
+                "event_count": rng.randint(1, 500),
+            },
+        })
+    return docs
+
+def generate_predictions(rng, network, count):
+    docs = []
+    for _ in range(count):
+        node_id = rng.randrange(len(network.nodes))
+        predictions = []
+        for year, month in [(2025, m) for m in range(1, 13)] + [(2024, m) for m in range(1, 13)]:
+            predictions.append({
+                "prediction_type": rng.choice(PREDICTION_TYPES),
+                "user": rng.choice(HOTSPOT_USERS),
+                "model_type": rng.choice(MODEL_TYPES),
+                "prediction": {
+                    "start_period": datetime.datetime(year, month, 1),
+                    "value": round(rng.random() * 5, 3),
+                    "risk_category": rng.choice(CATEGORIES),
+                    "error_category": rng.choice(CATEGORIES),
+                    "is_currently_hotspot": rng.choice([True, False, "true", "false"]),
+                },
+            })
+        docs.append({
+            "type": "Feature",
+            "geometry": _point(*network.nodes[node_id]),
+            "properties": {"locationID": node_id, "locationType": "intersection", "predictions": predictions},
+        })
+    return docs
+
+def generate_travel_demand(rng, network, count):
+    aggregated, with_accidents = [], []
+    for index in range(count):
+        edge = network.edges[index % len(network.edges)]
+        micro, private = rng.randint(0, 2_000), rng.randint(0, 20_000)
+        aggregated.append({
+            "type": "Feature",
+            "geometry": network.edge_line(edge),
+            "properties": {
+                "edgeID": index,
+                "way_id": rng.randint(1, 10**9),
+                "origin_destination": [[rng.randint(0, 500), rng.randint(0, 500)] for _ in range(5)],
+                "total_demand": {"micro": micro, "privateVehicle": private},
+                "gender": {
+                    "gender_micro": {"1": micro // 2, "2": micro - micro // 2},
+                    "gender_privateVehicle": {"1": private // 2, "2": private - private // 2},
+                },
+                "hour": {
+                    "hour_micro": {str(h): rng.randint(0, 100) for h in range(24)},
+                    "hour_privateVehicle": {str(h): rng.randint(0, 1_000) for h in range(24)},
+                },
+            },
+        })
+        for demand_type in ("micro", "privateVehicle"):
+            with_accidents.append({
+                "type": "Feature",
+                "geometry": network.edge_line(edge),
+                "properties": {
+                    "edgeID": index,
+                    "demandType": demand_type,
+                    "accidents": rng.randint(0, 10),
+                    "percentile_accidents_per_1000_vehicles": rng.randint(0, 100),
+                },
+            })
+    return aggregated, with_accidents
+
+def generate_dataset(scale=1.0, seed=42):
+    """Returns {collection_name: [documents]} for every collection the API queries."""
+    rng = random.Random(seed)
+    sizes = _sizes(scale)
+    network = RoadNetwork(rng, sizes["grid_side"])
+
+    nodes, edges, segments = generate_road_network(rng, network)
+    flat_accidents, accidents = generate_madrid_accidents(rng, network, sizes["accidents_per_year"])
+    cadas = generate_cadas_accidents(rng, network, sizes["cadas_accidents_per_year"])
+    hotspots = generate_hotspots(rng, network, sizes["hotspots_per_month"])
+    events = generate_event_frequency(rng, network, sizes["event_rows"])
+    demand, demand_accidents = generate_travel_demand(rng, network, sizes["demand_docs"])
+
+    return {
+        "locations": generate_locations(),
+        "limpioMadridAccidentalidad": flat_accidents,
+        "LGL_accidents": accidents,
+        "LGL_accidents_CADaS": cadas,
+        "LG_saxony_accidents": cadas[: len(cadas) // 3],
+        "LGL_hotspots": hotspots,
+        "madridHotspots": [doc for doc in hotspots if doc["properties"]["date"].year == YEARS[-1]],
+        "LGL_eventFrequency": events,
+        "madridEventFrequency": events,
+        "LGL_DL_module_predictions_v2": generate_predictions(rng, network, sizes["prediction_docs"]),
+        "LGL_travelDemandAggregated": demand,
+        "LGL_travelDemandAccidents": demand_accidents,
+        "LGL_nodes": nodes,
+        "LGL_edges": edges,
+        "LGL_segments": segments,
+    }
+
+# Índices que existen en producción y sin los que las consultas geográficas fallan
+GEO_COLLECTIONS = ("limpioMadridAccidentalidad", "LGL_accidents", "LGL_accidents_CADaS", "LG_saxony_accidents", "LGL_hotspots", "LGL_nodes", "LGL_edges", "LGL_segments")
+
+def seed_database(db, dataset, batch_size=5_000):
+    for name, docs in dataset.items():
+        collection = db[name]
+        collection.drop()
+        for start in range(0, len(docs), batch_size):
+            # insert_many añade _id a los documentos; se insertan copias para poder reutilizar el dataset
+            collection.insert_many([dict(doc) for doc in docs[start:start + batch_size]], ordered=False)
+    # Sin estos índices los resultados no serían comparables: un fallo aborta la siembra
+    for name in GEO_COLLECTIONS:
+        db[name].create_index([("geometry", "2dsphere")])
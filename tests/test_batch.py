@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+from app.batch import BatchOperations, BatchQuery, run_batch
+from app.caching import CachedResponse, serialize_json
+from app.mongo import AccidentSeverity, ResultTooLarge, TooManyHeavyQueries
+
+def plain(year: int, severity: AccidentSeverity = None):
+    return {"year": year, "severity": severity.value if severity else None, "text": 'quote " and ñ'}
+
+def cached(year: int):
+    return CachedResponse(serialize_json([{"year": year}]), b"")
+
+def heavy():
+    raise TooManyHeavyQueries("Too many heavy queries in progress, please retry later")
+
+def too_large():
+    raise ResultTooLarge("Result exceeds 50000 documents")
+
+def failing():
+    raise RuntimeError("boom")
+
+def whoami(current_user: str):
+    return {"user": current_user}
+
+OPERATIONS = BatchOperations({
+    "plain": plain, "cached": cached, "heavy": heavy, "too_large": too_large, "failing": failing, "whoami": whoami,
+})
+
+def batch(*queries):
+    body = asyncio.run(run_batch([BatchQuery(id=str(i), **query) for i, query in enumerate(queries)], OPERATIONS, {"current_user": "alice"}))
+    # El cuerpo se compone a trozos: debe seguir siendo JSON válido
+    return json.loads(body)["results"]
+
+def test_plain_and_cached_results_are_valid_json():
+    results = batch(
+        {"operation": "plain", "params": {"year": "2024", "severity": "fatal"}},
+        {"operation": "cached", "params": {"year": 2023}},
+    )
+    assert results[0] == {"id": "0", "operation": "plain", "status": 200, "result": {"year": 2024, "severity": "fatal", "text": 'quote " and ñ'}}
+    assert results[1] == {"id": "1", "operation": "cached", "status": 200, "result": [{"year": 2023}]}
+
+def test_results_keep_the_request_order():
+    results = batch(*({"operation": "plain", "params": {"year": year}} for year in range(2015, 2025)))
+    assert [item["result"]["year"] for item in results] == list(range(2015, 2025))
+
+def test_context_is_filled_and_cannot_be_sent():
+    results = batch({"operation": "whoami"}, {"operation": "whoami", "params": {"current_user": "mallory"}})
+    assert results[0]["result"] == {"user": "alice"}
+    assert results[1]["status"] == 400 and "current_user" in results[1]["detail"]
+
+def test_unknown_operation_returns_404():
+    (result,) = batch({"operation": "nope"})
+    assert result["status"] == 404 and "plain" in result["detail"]
+
+@pytest.mark.parametrize("query, status", [
+    ({"operation": "plain", "params": {"year": "not a year"}}, 422),
+    ({"operation": "plain", "params": {"year": 2024, "severity": "unknown"}}, 422),
+    ({"operation": "heavy"}, 503),
+    ({"operation": "too_large"}, 400),
+    ({"operation": "failing"}, 500),
+])
+def test_an_error_only_fails_its_item(query, status):
+    results = batch({"operation": "plain", "params": {"year": 2024}}, query, {"operation": "cached", "params": {"year": 2024}})
+    assert [item["status"] for item in results] == [200, status, 200]
+    assert "result" not in results[1] and results[1]["detail"]
@@ -0,0 +1,110 @@
+import datetime
+
+import mongomock
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from app.caching import DatasetVersions, ResponseCache
+from app.mongo import DATASET_VERSIONS_COLLECTION, MongoDBManager
+
+UPDATED_AT = datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+@pytest.fixture
+def db_manager():
+    manager = MongoDBManager("mongodb://localhost:1")
+    manager.client = mongomock.MongoClient()
+    manager.db = manager.client["test"]
+    manager.db[DATASET_VERSIONS_COLLECTION].insert_many([
+        {"_id": "accidents", "version": 1, "updated_at": UPDATED_AT},
+        {"_id": "districts", "version": 3, "updated_at": UPDATED_AT - datetime.timedelta(days=1)},
+    ])
+    # Sin versión registrada y con _id que no es ObjectId: la versión no tiene updated_at
+    manager.db["unversioned"].insert_one({"_id": 1, "value": 1})
+    return manager
+
+@pytest.fixture
+def api(db_manager):
+    dataset_versions = DatasetVersions(db_manager, refresh_seconds=0)
+    response_cache = ResponseCache(dataset_versions)
+    calls = []
+
+    def query(collection_name):
+        calls.append(collection_name)
+        return {"collection": collection_name}
+
+    app = FastAPI()
+
+    @app.get("/data/{collection_name}")
+    def data(request: Request, response: Response, collection_name: str, other: str = None):
+        collections = [collection_name] + ([other] if other else [])
+        if (not_modified := dataset_versions.conditional_get(request, response, *collections)) is not None:
+            return not_modified
+        return response_cache.cached_response(request, query, collection_name, collections=collections, headers=response.headers)
+
+    client = TestClient(app)
+    client.dataset_versions, client.calls = dataset_versions, calls
+    return client
+
+def get(client, path, **headers):
+    # Sin Accept-Encoding el ETag es el de la respuesta sin comprimir
+    return client.get(path, headers={"Accept-Encoding": "identity"} | headers)
+
+def test_not_modified_skips_the_query(api):
+    first = get(api, "/data/accidents")
+    assert first.status_code == 200 and first.json() == {"collection": "accidents"}
+    assert first.headers["last-modified"] == "Wed, 01 May 2024 12:30:00 GMT"
+    assert api.calls == ["accidents"]
+
+    api.calls.clear()
+    again = get(api, "/data/accidents", **{"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304 and again.headers["etag"] == first.headers["etag"]
+    assert api.calls == []
+
+def test_etag_depends_on_path_and_query(api):
+    etag = get(api, "/data/accidents").headers["etag"]
+    assert get(api, "/data/accidents?other=districts").headers["etag"] != etag
+    assert get(api, "/data/districts").headers["etag"] != etag
+
+@pytest.mark.parametrize("if_none_match", [
+    '"other", {etag}',
+    "W/{etag}",
+    '"x", W/{etag}',
+    "*",
+])
+def test_if_none_match_lists_and_weak_tags(api, if_none_match):
+    etag = get(api, "/data/accidents").headers["etag"]
+    assert get(api, "/data/accidents", **{"If-None-Match": if_none_match.format(etag=etag)}).status_code == 304
+
+def test_if_none_match_accepts_the_gzip_etag(api):
+    compressed = api.get("/data/accidents", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"].endswith('-gzip"')
+    assert get(api, "/data/accidents", **{"If-None-Match": compressed.headers["etag"]}).status_code == 304
+
+def test_if_none_match_takes_precedence_over_if_modified_since(api):
+    first = get(api, "/data/accidents")
+    response = get(api, "/data/accidents", **{"If-None-Match": '"stale"', "If-Modified-Since": first.headers["last-modified"]})
+    assert response.status_code == 200
+
+def test_if_modified_since(api):
+    last_modified = get(api, "/data/accidents").headers["last-modified"]
+    assert get(api, "/data/accidents", **{"If-Modified-Since": last_modified}).status_code == 304
+    assert get(api, "/data/accidents", **{"If-Modified-Since": "Tue, 30 Apr 2024 00:00:00 GMT"}).status_code == 200
+    assert get(api, "/data/accidents", **{"If-Modified-Since": "not a date"}).status_code == 200
+
+def test_last_modified_is_the_latest_of_all_collections(api):
+    assert get(api, "/data/districts?other=accidents").headers["last-modified"] == "Wed, 01 May 2024 12:30:00 GMT"
+
+def test_no_last_modified_when_a_collection_has_no_updated_at(api):
+    response = get(api, "/data/accidents?other=unversioned")
+    assert "last-modified" not in response.headers
+    assert get(api, "/data/accidents?other=unversioned", **{"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}).status_code == 200
+
+def test_bump_changes_the_etag_and_the_cached_response(api):
+    first = get(api, "/data/accidents")
+    api.dataset_versions.bump("accidents")
+    after = get(api, "/data/accidents", **{"If-None-Match": first.headers["etag"]})
+    assert after.status_code == 200 and after.headers["etag"] != first.headers["etag"]
+    # La versión forma parte de la clave: la respuesta se vuelve a calcular
+    assert api.calls == ["accidents", "accidents"]
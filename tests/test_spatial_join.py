@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app.hotspots import neighbour_pairs, score_sites
+from app.spatial_join import LineIndex, cell_keys, expand_ranges, to_meters
+
+def random_lines(rng, count, origin=(-3.70, 40.42), spread=0.02):
+    lines = []
+    for _ in range(count):
+        start = np.array(origin) + rng.uniform(-spread, spread, 2)
+        steps = rng.normal(0, 0.0006, (rng.integers(1, 5), 2))
+        lines.append({"geometry": {"type": "LineString", "coordinates": np.vstack([start, start + np.cumsum(steps, axis=0)]).tolist()}})
+    return lines
+
+def brute_force_snap(index, lon, lat, max_distance):
+    px, py = to_meters(lon, lat, index.origin_lat)
+    ax, ay, vx, vy = index.ax, index.ay, index.bx - index.ax, index.by - index.ay
+    squared = vx * vx + vy * vy
+    t = np.clip(np.divide((px[:, None] - ax) * vx + (py[:, None] - ay) * vy, squared, out=np.zeros((len(px), len(ax))), where=squared > 0), 0, 1)
+    d = np.hypot(ax + t * vx - px[:, None], ay + t * vy - py[:, None])
+    piece = d.argmin(axis=1)
+    distance = d[np.arange(len(px)), piece]
+    return np.where(distance <= max_distance, index.owner[piece], -1), distance
+
+def test_cell_keys_order_and_uniqueness():
+    cx, cy = np.meshgrid(np.arange(-3, 4), np.arange(-3, 4))
+    keys = cell_keys(cx.ravel(), cy.ravel())
+    assert len(np.unique(keys)) == keys.size
+    # Ordenar por clave equivale a ordenar por (x, y)
+    order = np.argsort(keys)
+    assert np.array_equal(np.lexsort((cy.ravel(), cx.ravel())), order)
+
+def test_expand_ranges_matches_python_loop():
+    rng = np.random.default_rng(1)
+    starts = rng.integers(0, 50, 40)
+    ends = starts + rng.integers(-2, 6, 40)
+    owners, positions = expand_ranges(starts, ends)
+    expected = [(i, p) for i, (s, e) in enumerate(zip(starts, ends)) for p in range(s, e)]
+    assert list(zip(owners.tolist(), positions.tolist())) == expected
+
+@pytest.mark.parametrize("cell_size, max_distance", [(30, 30), (30, 10), (60, 45), (120, 120)])
+def test_snap_matches_brute_force(cell_size, max_distance):
+    rng = np.random.default_rng(2)
+    index = LineIndex(random_lines(rng, 300), cell_size)
+    lon = -3.70 + rng.uniform(-0.02, 0.02, 2000)
+    lat = 40.42 + rng.uniform(-0.02, 0.02, 2000)
+    nearest, distance = index.snap(lon, lat, max_distance)
+    expected, expected_distance = brute_force_snap(index, lon, lat, max_distance)
+    assert np.array_equal(nearest >= 0, expected >= 0)
+    matched = nearest >= 0
+    np.testing.assert_allclose(distance[matched], expected_distance[matched])
+    # Con empates el tramo elegido puede cambiar; la distancia no
+    assert np.all((nearest == expected) | np.isclose(distance, expected_distance))
+
+def test_snap_without_lines_or_points():
+    index = LineIndex([{"geometry": {"type": "Point", "coordinates": [-3.7, 40.4]}}])
+    nearest, distance = index.snap([-3.7], [40.4], 30)
+    assert nearest.tolist() == [-1] and np.isinf(distance).all()
+    index = LineIndex(random_lines(np.random.default_rng(3), 5))
+    assert len(index.snap([], [], 30)[0]) == 0
+
+def test_neighbour_pairs_and_scores_match_brute_force():
+    rng = np.random.default_rng(4)
+    site_x, site_y = rng.uniform(-1000, 1000, 200), rng.uniform(-1000, 1000, 200)
+    point_x, point_y = rng.uniform(-1000, 1000, 3000), rng.uniform(-1000, 1000, 3000)
+    point_severe = (rng.random(3000) < 0.1).astype(float)
+    radius = 100
+
+    sites, points, distances = neighbour_pairs(site_x, site_y, point_x, point_y, radius)
+    d = np.hypot(site_x[:, None] - point_x, site_y[:, None] - point_y)
+    expected_sites, expected_points = np.nonzero(d < radius)
+    assert sorted(zip(sites.tolist(), points.tolist())) == sorted(zip(expected_sites.tolist(), expected_points.tolist()))
+    np.testing.assert_allclose(distances, d[sites, points])
+
+    density, counts, severe = score_sites(site_x, site_y, point_x, point_y, point_severe, radius)
+    weights = np.where(d < radius, (1 - (d / radius) ** 2) ** 2, 0)
+    np.testing.assert_allclose(density, weights.sum(axis=1) * 3 / (np.pi * radius ** 2))
+    assert np.array_equal(counts, (d < radius).sum(axis=1))
+    assert np.array_equal(severe, ((d < radius) * point_severe).sum(axis=1).astype(np.int64))
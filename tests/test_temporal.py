@@ -0,0 +1,123 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from app.caching import DatasetVersions
+from app.mongo import AccidentSeverity, AreaType
+from app.temporal import SEVERITY_INDEX, TemporalCube, TemporalCubes
+
+class StubDatabase:
+    """The MongoDBManager methods TemporalCubes uses, over a list of (_id, datetime, severity, area) rows."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.version = 1
+        self.base_version = 1
+        self.fetches = []
+
+    def get_dataset_version(self, collection_name):
+        return str(self.version), None
+
+    def get_dataset_base_version(self, collection_name):
+        return self.base_version
+
+    def bump_dataset_version(self, collection_name, append_only=False):
+        self.version += 1
+        if not append_only:
+            self.base_version = self.version
+        return str(self.version), None
+
+    def get_accident_temporal_rows(self, collection_name, area_type, year, after_id=None):
+        self.fetches.append(after_id)
+        return [row for row in self.rows if after_id is None or row[0] > after_id]
+
+    def count_accidents(self, collection_name, year):
+        return len(self.rows)
+
+def make_rows(start_id, count, seed):
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2024, 1, 1)
+    return [(start_id + i, start + datetime.timedelta(hours=int(rng.integers(0, 24 * 365))),
+             ["Deceased", "Severe", "Slight", None][int(rng.integers(0, 4))], [None, "1", "2", "3"][int(rng.integers(0, 4))])
+            for i in range(count)]
+
+def assert_same_cube(cube, expected):
+    assert cube.documents == expected.documents and cube.watermark == expected.watermark
+    assert np.array_equal(cube.totals, expected.totals)
+    for area in expected.area_index:
+        assert np.array_equal(cube.slice(area), expected.slice(area))
+
+@pytest.fixture
+def setup():
+    db = StubDatabase(make_rows(0, 500, seed=1))
+    return db, TemporalCubes(DatasetVersions(db, refresh_seconds=0))
+
+def full_cube(rows):
+    cube = TemporalCube()
+    cube.add(rows)
+    return cube
+
+def test_append_only_bump_extends_the_cube(setup):
+    db, cubes = setup
+    first = cubes.cube("accidents", AreaType.district, 2024)
+    db.rows += make_rows(1000, 200, seed=2)
+    cubes.dataset_versions.bump("accidents", append_only=True)
+
+    updated = cubes.cube("accidents", AreaType.district, 2024)
+    assert db.fetches == [None, first.watermark]
+    assert updated is not first and first.documents == 500
+    assert_same_cube(updated, full_cube(db.rows))
+
+def test_bump_without_append_only_rebuilds(setup):
+    db, cubes = setup
+    cubes.cube("accidents", AreaType.district, 2024)
+    # Cambio en sitio: mismo número de documentos, otra gravedad
+    db.rows[0] = (db.rows[0][0], db.rows[0][1], "Deceased" if db.rows[0][2] != "Deceased" else "Slight", db.rows[0][3])
+    cubes.dataset_versions.bump("accidents")
+
+    rebuilt = cubes.cube("accidents", AreaType.district, 2024)
+    assert db.fetches == [None, None]
+    assert_same_cube(rebuilt, full_cube(db.rows))
+
+def test_count_mismatch_rebuilds(setup):
+    db, cubes = setup
+    cubes.cube("accidents", AreaType.district, 2024)
+    # Documento insertado con un _id anterior a la marca de agua: no llega con after_id
+    db.rows += make_rows(1000, 10, seed=3) + [(-1, datetime.datetime(2024, 3, 4, 10), "Severe", "1")]
+    cubes.dataset_versions.bump("accidents", append_only=True)
+
+    rebuilt = cubes.cube("accidents", AreaType.district, 2024)
+    assert db.fetches[-1] is None and len(db.fetches) == 3
+    assert_same_cube(rebuilt, full_cube(db.rows))
+
+def test_unchanged_version_reuses_the_cube(setup):
+    db, cubes = setup
+    first = cubes.cube("accidents", AreaType.district, 2024)
+    assert cubes.cube("accidents", AreaType.district, 2024) is first
+    assert db.fetches == [None]
+
+def test_slice_of_an_unknown_area_is_empty():
+    cube = full_cube(make_rows(0, 50, seed=4))
+    grid = cube.slice("no such area")
+    assert grid.shape == (7, 24) and not grid.any()
+
+def test_slice_with_severity_filter():
+    rows = [
+        (1, datetime.datetime(2024, 1, 1, 8), "Deceased", "1"),   # lunes
+        (2, datetime.datetime(2024, 1, 1, 8), "Severe", "1"),
+        (3, datetime.datetime(2024, 1, 1, 8), "Slight", "1"),
+        (4, datetime.datetime(2024, 1, 2, 9), "Severe", "2"),     # martes
+        (5, datetime.datetime(2024, 1, 2, 9), None, None),
+    ]
+    cube = full_cube(rows)
+    severe = [SEVERITY_INDEX[value] for value in ("Severe", "Deceased")]
+    assert cube.slice("1", severe)[0, 8] == 2
+    assert cube.slice("1")[0, 8] == 3
+    assert cube.slice(None, severe).sum() == 3
+    assert cube.slice(None)[1, 9] == 2
+
+def test_heatmap_severity(setup):
+    db, cubes = setup
+    heatmap = cubes.heatmap("accidents", AreaType.district, 2024, severity=AccidentSeverity.fatal)
+    assert heatmap["total"] == sum(1 for row in db.rows if row[2] == "Deceased")
@@ -0,0 +1,135 @@
+import datetime
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app.caching import DatasetVersions
+from app.mongo import TimeBucket
+from app.timeseries import AccidentTimeSeries, YearlyAccidentStats, stats_deltas
+
+class StubDatabase:
+    """get_accidents_time_series over in-memory (timestamp, severity) accidents, hourly buckets only."""
+
+    def __init__(self, accidents):
+        self.accidents = accidents
+        self.queries = []
+
+    def get_dataset_version(self, collection_name):
+        return "1", None
+
+    def get_accidents_time_series(self, collection_name, start, end, bucket, severity=None, user=None, geometry=None):
+        assert bucket is TimeBucket.hour
+        self.queries.append((start, end))
+        hours = {}
+        for moment, accident_severity in self.accidents:
+            if start <= moment < end:
+                hour = moment.replace(minute=0, second=0, microsecond=0)
+                count, fatal, severe = hours.get(hour, (0, 0, 0))
+                hours[hour] = (count + 1, fatal + (accident_severity == "Deceased"), severe + (accident_severity == "Severe"))
+        return [{"_id": hour, "count": count, "fatal": fatal, "severe": severe} for hour, (count, fatal, severe) in sorted(hours.items())]
+
+def expected_bucket(moment, bucket):
+    """$dateTrunc written independently: ISO weeks start on Monday."""
+    match bucket:
+        case TimeBucket.hour:
+            return datetime.datetime(moment.year, moment.month, moment.day, moment.hour)
+        case TimeBucket.day:
+            return datetime.datetime(moment.year, moment.month, moment.day)
+        case TimeBucket.week:
+            year, week, _ = moment.isocalendar()
+            return datetime.datetime.fromisocalendar(year, week, 1)
+        case TimeBucket.month:
+            return datetime.datetime(moment.year, moment.month, 1)
+
+@pytest.fixture(scope="module")
+def accidents():
+    rng = np.random.default_rng(7)
+    start = datetime.datetime(2022, 11, 1)
+    minutes = rng.integers(0, 60 * 24 * 800, 20000)
+    severities = rng.choice(["Deceased", "Severe", "Slight"], 20000, p=[0.02, 0.1, 0.88])
+    return [(start + datetime.timedelta(minutes=int(m)), str(s)) for m, s in zip(minutes, severities)]
+
+@pytest.mark.parametrize("bucket", list(TimeBucket))
+@pytest.mark.parametrize("start, end", [
+    (datetime.datetime(2023, 12, 20, 13), datetime.datetime(2024, 2, 10)),    # diciembre → enero
+    (datetime.datetime(2024, 12, 30), datetime.datetime(2025, 1, 6)),         # semana ISO 1 de 2025
+    (datetime.datetime(2023, 1, 1), datetime.datetime(2023, 1, 2)),           # domingo: semana que empieza en 2022
+    (datetime.datetime(2022, 11, 15, 7), datetime.datetime(2024, 11, 3)),     # tres años
+])
+def test_series_matches_direct_bucketing(accidents, bucket, start, end):
+    if bucket is TimeBucket.hour and (end - start).days > 60:
+        pytest.skip("too many hourly buckets to compare one by one")
+    series = AccidentTimeSeries(DatasetVersions(StubDatabase(accidents), refresh_seconds=60)).series("accidents", start, end, bucket)
+
+    in_range = [(moment, severity) for moment, severity in accidents if start <= moment < end]
+    counts = Counter(expected_bucket(moment, bucket) for moment, _ in in_range)
+    fatal = Counter(expected_bucket(moment, bucket) for moment, severity in in_range if severity == "Deceased")
+    severe = Counter(expected_bucket(moment, bucket) for moment, severity in in_range if severity == "Severe")
+
+    timestamps = [datetime.datetime.fromisoformat(value) for value in series["timestamps"]]
+    assert timestamps[0] == expected_bucket(start, bucket) and timestamps == sorted(set(timestamps))
+    assert expected_bucket(end - datetime.timedelta(microseconds=1), bucket) == timestamps[-1]
+    assert set(counts) <= set(timestamps)
+    assert series["counts"] == [counts[moment] for moment in timestamps]
+    assert series["fatal"] == [fatal[moment] for moment in timestamps]
+    assert series["severe"] == [severe[moment] for moment in timestamps]
+    assert sum(series["counts"]) == len(in_range)
+
+def test_partitions_are_reused_across_buckets(accidents):
+    db = StubDatabase(accidents)
+    series = AccidentTimeSeries(DatasetVersions(db, refresh_seconds=60))
+    series.series("accidents", datetime.datetime(2023, 12, 1), datetime.datetime(2024, 2, 1), TimeBucket.day)
+    series.series("accidents", datetime.datetime(2023, 6, 1), datetime.datetime(2024, 6, 1), TimeBucket.week)
+    assert db.queries == [(datetime.datetime(2023, 1, 1), datetime.datetime(2024, 1, 1)), (datetime.datetime(2024, 1, 1), datetime.datetime(2025, 1, 1))]
+
+def test_series_rejects_ranges_that_split_an_hour(accidents):
+    series = AccidentTimeSeries(DatasetVersions(StubDatabase(accidents), refresh_seconds=60))
+    with pytest.raises(ValueError):
+        series.series("accidents", datetime.datetime(2023, 1, 1, 7, 30), datetime.datetime(2023, 1, 2), TimeBucket.day)
+
+class StubStatsDatabase:
+    def __init__(self, accidents_per_year):
+        self.accidents_per_year = accidents_per_year
+        self.version = 1
+        self.queries = []
+
+    def get_dataset_version(self, collection_name):
+        return str(self.version), None
+
+    def get_accidents_stats_by_year(self, collection_name, years):
+        self.queries.append(sorted(years))
+        return {year: {"severity": {"total": self.accidents_per_year.get(year, 0)}} for year in years}
+
+def test_compare_only_queries_missing_years():
+    db = StubStatsDatabase({2019: 10, 2020: 0, 2021: 5, 2022: 8, 2023: 8})
+    stats = YearlyAccidentStats(DatasetVersions(db, refresh_seconds=0))
+    stats.compare("accidents", 2020, 2021)
+    stats.compare("accidents", 2023, 2023)
+    result = stats.compare("accidents", 2019, 2023)
+    assert db.queries == [[2020, 2021], [2023], [2019, 2022]]
+    assert result["years"] == [2019, 2020, 2021, 2022, 2023]
+
+    # Una nueva versión de los datos invalida los años ya calculados
+    db.version += 1
+    stats.compare("accidents", 2022, 2023)
+    assert db.queries[-1] == [2022, 2023]
+
+def test_compare_deltas():
+    db = StubStatsDatabase({2019: 10, 2020: 0, 2021: 5, 2022: 8})
+    result = YearlyAccidentStats(DatasetVersions(db, refresh_seconds=0)).compare("accidents", 2019, 2022)
+    deltas = {year: (delta["absolute"]["severity"]["total"], delta["percentage"]["severity"]["total"]) for year, delta in result["deltas"].items()}
+    # Sin accidentes el año anterior el porcentaje es None
+    assert deltas == {"2020": (-10, -100.0), "2021": (5, None), "2022": (3, 60.0)}
+
+def test_stats_deltas_with_labels_missing_the_previous_year():
+    deltas = stats_deltas({"users": {"cyclist": 4}}, {"users": {"cyclist": 5, "pedestrian": 2}})
+    assert deltas["absolute"] == {"users": {"cyclist": 1, "pedestrian": 2}}
+    assert deltas["percentage"] == {"users": {"cyclist": 25.0, "pedestrian": None}}
+
+def test_compare_rejects_bad_ranges():
+    stats = YearlyAccidentStats(DatasetVersions(StubStatsDatabase({}), refresh_seconds=0))
+    with pytest.raises(ValueError):
+        stats.compare("accidents", 2024, 2020)
+    with pytest.raises(ValueError):
+        stats.compare("accidents", 1900, 2024)